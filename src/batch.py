@@ -0,0 +1,194 @@
+"""
+This module helps to run many games (jobs) in one process: the process
+pool is started once and runs whole jobs, attack tables for all dimensions
+of jobs are built before starting of the pool (so workers share them),
+results of counting are stored to the persistent cache.
+
+Jobs are read from JSON-lines file, one job per line:
+    {"id": "any value", "dims": [5, 5], "figures": {"kings": 2, ...},
+     "mode": "count" | "combinations", "symmetry": false, "engine": "stack"}
+("id", "mode", "symmetry" and "engine" are optional). One result record is
+written per job in order of jobs:
+    {"id": ..., "dims": [5, 5], "figures": {...}, "count": 8,
+     "combinations": [[figure, ...], ...], "seconds": 0.01}
+("combinations" are written in "combinations" mode only) or
+    {"id": ..., "error": "description of the error"}
+
+Example:
+    python3 -m src.batch jobs.jsonl --output results.jsonl --workers 4
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from src.cache import ResultsCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from src.exceptions import GameArgumentsValidationError
+from src.figures import pin_attack_tables
+from src.game_logic import Game, ALIASES_FIGURES_MAP, DEFAULT_ENGINE, \
+    iter_pool_results
+
+COUNT_MODE = 'count'
+COMBINATIONS_MODE = 'combinations'
+MODES = (COUNT_MODE, COMBINATIONS_MODE)
+
+
+def read_jobs(lines):
+    """ Parse jobs from JSON lines (empty lines are skipped)
+
+    :return: list of jobs (dictionaries), jobs which can not be parsed
+             are replaced by records with errors
+    """
+    jobs = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as error:
+            job = {'error': 'Line {}: {}'.format(number, error)}
+        if not isinstance(job, dict):
+            job = {'error': 'Line {}: job must be an object'.format(number)}
+        jobs.append(job)
+    return jobs
+
+
+def create_game(job, mode, cache=None, workers=1):
+    """ Create the game of the job (see <read_jobs>)
+
+    :raise GameArgumentsValidationError: if the job is not correct
+    """
+    try:
+        dim_x, dim_y = (int(dimension) for dimension in job['dims'])
+        figures_numbers = {alias: int(number)
+                           for alias, number in job['figures'].items()}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise GameArgumentsValidationError(
+            'Job must contain "dims" like [x, y] and "figures" like '
+            '{"kings": 1}'
+        )
+    aliases = [alias for alias, _ in ALIASES_FIGURES_MAP]
+    for alias in figures_numbers:
+        if alias not in aliases:
+            raise GameArgumentsValidationError(
+                'Unknown figures "{}"'.format(alias)
+            )
+    if mode not in MODES:
+        raise GameArgumentsValidationError('Unknown mode "{}"'.format(mode))
+    return Game(dim_x, dim_y, figures_numbers,
+                engine=job.get('engine', DEFAULT_ENGINE),
+                symmetry=bool(job.get('symmetry', False)), workers=workers,
+                cache=cache)
+
+
+def run_job(job, mode=COUNT_MODE, cache=None):
+    """ Run the job in this process
+
+    :param mode: mode of jobs which do not specify it
+    :return: result record (see module's documentation)
+    """
+    record = {'id': job['id']} if 'id' in job else {}
+    if 'error' in job:
+        record['error'] = job['error']
+        return record
+
+    mode = job.get('mode', mode)
+    try:
+        game = create_game(job, mode, cache)
+    except GameArgumentsValidationError as error:
+        record['error'] = str(error)
+        return record
+
+    record['dims'] = [game.dimension_x, game.dimension_y]
+    record['figures'] = {alias: number for alias, number
+                         in sorted(game.figures_numbers.items()) if number}
+    start_time = time.time()
+    if mode == COUNT_MODE:
+        record['count'] = game.count_combinations()
+    else:
+        combinations = list(game.iter_combinations())
+        record['count'] = len(combinations)
+        record['combinations'] = combinations
+    record['seconds'] = round(time.time() - start_time, 6)
+    return record
+
+
+def run_job_task(task):
+    """ Run the job in the worker process
+
+    :param task: tuple like (job, mode, cache)
+    """
+    return run_job(*task)
+
+
+def prepare_attack_tables(jobs):
+    """ Build attack tables for dimensions of all correct jobs, so they are
+        shared by all jobs (and inherited by workers of the pool). Tables
+        are pinned: the limit of cached tables does not drop them.
+    """
+    for job in jobs:
+        try:
+            game = create_game(job, COUNT_MODE)
+        except GameArgumentsValidationError:
+            continue
+        pin_attack_tables(game.figure_classes, game.dimension_x,
+                          game.dimension_y)
+
+
+def iter_batch_results(jobs, mode=COUNT_MODE, workers=1, cache=None):
+    """ Run all jobs and yield result records in order of jobs.
+        Jobs are run by the process pool (one job per task) if several
+        workers are specified.
+
+    :return: generator of result records
+    """
+    jobs = list(jobs)
+    prepare_attack_tables(jobs)
+    tasks = [(job, mode, cache) for job in jobs]
+    if os.getenv('TEST_MODE') or workers < 2:
+        for task in tasks:
+            yield run_job_task(task)
+        return
+
+    pool_results = iter_pool_results(run_job_task, tasks, workers)
+    for _, record in pool_results:
+        yield record
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('jobs', help='JSON-lines file with jobs ("-" for stdin)')
+    p.add_argument('--output', default=None,
+                   help='JSON-lines file for results (stdout by default)')
+    p.add_argument('--mode', default=COUNT_MODE, choices=MODES,
+                   help='Mode of jobs which do not specify it')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                   help='Number of worker processes')
+    p.add_argument('--no-cache', default=False, action='store_true',
+                   help='To run jobs without the cache of results')
+    p.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                   help='Directory of the cache of results')
+    p.add_argument('--cache-size', type=int,
+                   default=DEFAULT_CACHE_SIZE >> 20,
+                   help='Maximal size of the cache of results (MB)')
+    args = p.parse_args()
+
+    if args.jobs == '-':
+        batch_jobs = read_jobs(sys.stdin)
+    else:
+        with open(args.jobs) as jobs_file:
+            batch_jobs = read_jobs(jobs_file)
+    batch_cache = None
+    if not args.no_cache:
+        batch_cache = ResultsCache(args.cache_dir, args.cache_size << 20)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for result in iter_batch_results(batch_jobs, args.mode,
+                                         args.workers, batch_cache):
+            output.write(json.dumps(result, separators=(',', ':')) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
@@ -0,0 +1,234 @@
+"""
+This module helps to measure throughput of the combinations engine.
+Every benchmark case runs in a separate process (so peak RSS is measured
+correctly) in single-process mode (TEST_MODE) and in process-pool mode.
+
+Reported metrics:
+    wall_time - time of the enumeration (seconds)
+    nodes - number of placed figures during the whole search (it is
+            calculated by a separate instrumented run of the search)
+    solutions - number of found combinations
+    solutions_per_second - solutions / wall_time
+    peak_rss_kb - peak resident memory of the main process (and workers)
+    worker_utilization - CPU time of all processes / (wall_time * workers)
+
+Example:
+    python3 -m src.benchmark --suite quick --save-baseline baseline.json
+    python3 -m src.benchmark --suite quick --baseline baseline.json
+
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from src.game_logic import Game, DEFAULT_ENGINE, ENGINES
+
+# Cases like (name, dim_x, dim_y, figures_numbers)
+QUICK_CASES = (
+    ('readme-3x3', 3, 3, {'kings': 1, 'rooks': 2}),
+    ('all-figures-4x4', 4, 4, {'kings': 1, 'queens': 1, 'bishops': 1,
+                               'rooks': 1, 'knights': 1}),
+    ('queens-6x6', 6, 6, {'queens': 6}),
+    ('mixed-6x6', 6, 6, {'queens': 2, 'kings': 2, 'knights': 1}),
+    ('queens-8x8', 8, 8, {'queens': 8}),
+)
+FULL_CASES = QUICK_CASES + (
+    ('rooks-7x7', 7, 7, {'rooks': 7}),
+    ('mixed-7x7', 7, 7, {'kings': 2, 'queens': 2, 'bishops': 2,
+                         'knights': 1}),
+    ('mixed-8x8', 8, 8, {'queens': 3, 'bishops': 2, 'rooks': 1,
+                         'knights': 1}),
+    # short-range figures: bitboard and list engines are compared on many
+    # combinations (1356736)
+    ('minor-6x6', 6, 6, {'kings': 2, 'knights': 3, 'bishops': 1}),
+)
+SUITES = {'quick': QUICK_CASES, 'full': FULL_CASES}
+MODES = ('single', 'pool')
+DEFAULT_TOLERANCE = 0.1
+
+
+def run_case(dim_x, dim_y, figures_numbers, mode, engine=DEFAULT_ENGINE,
+             workers=None):
+    """ Run one benchmark case in this process
+
+    :param mode: 'single' (TEST_MODE) or 'pool' (process pool)
+    :return: dict with metrics
+    """
+    if mode == 'single':
+        os.environ['TEST_MODE'] = '1'
+    else:
+        os.environ.pop('TEST_MODE', None)
+
+    game = Game(dim_x, dim_y, figures_numbers, engine=engine, workers=workers)
+    workers = 1 if mode == 'single' else game.workers
+    usage_before = _get_cpu_time()
+    start = time.perf_counter()
+    solutions = 0
+    for _ in game.iter_combinations(ordered=False):
+        solutions += 1
+    wall_time = time.perf_counter() - start
+    cpu_time = _get_cpu_time() - usage_before
+    peak_rss = _get_peak_rss()
+
+    return OrderedDict((
+        ('wall_time', round(wall_time, 4)),
+        ('nodes', _count_nodes(game)),
+        ('solutions', solutions),
+        ('solutions_per_second', round(solutions / wall_time, 1)
+         if wall_time else None),
+        ('peak_rss_kb', peak_rss),
+        ('workers', workers),
+        ('worker_utilization', round(cpu_time / (wall_time * workers), 3)
+         if wall_time and resource else None),
+    ))
+
+
+def _count_nodes(game):
+    """ Number of placed figures during the whole search of the game """
+
+    instrumented_game = Game(game.dimension_x, game.dimension_y,
+                             game.figures_numbers, engine=game.engine,
+                             workers=game.workers, instrument=True)
+    for _ in instrumented_game.iter_combinations(ordered=False):
+        pass
+    return instrumented_game.stats.nodes
+
+
+def _get_cpu_time():
+    """ CPU time of this process and finished worker processes """
+
+    if resource is None:
+        return 0.0
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _get_peak_rss():
+    """ Peak RSS (KB) of this process and the biggest worker process """
+
+    if resource is None:
+        return None
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run_suite(cases, modes=MODES, engine=DEFAULT_ENGINE, workers=None):
+    """ Run every case in every mode in separate processes
+
+    :return: list of dicts with case description and metrics
+    """
+    results = []
+    for name, dim_x, dim_y, figures_numbers in cases:
+        for mode in modes:
+            case = json.dumps([dim_x, dim_y, figures_numbers, mode, engine,
+                               workers])
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'src.benchmark', '--case', case],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            result = OrderedDict((('name', name), ('mode', mode),
+                                  ('engine', engine)))
+            result.update(json.loads(output.decode(),
+                                     object_pairs_hook=OrderedDict))
+            results.append(result)
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """ Compare wall time of cases with the stored baseline
+
+    :return: list of regressions like (name, mode, baseline_time, wall_time)
+    """
+    baseline_times = {(item['name'], item['mode']): item['wall_time']
+                      for item in baseline}
+    regressions = []
+    for result in results:
+        baseline_time = baseline_times.get((result['name'], result['mode']))
+        if baseline_time is None:
+            continue
+        result['baseline_wall_time'] = baseline_time
+        if result['wall_time'] > baseline_time * (1 + tolerance):
+            regressions.append((result['name'], result['mode'],
+                                baseline_time, result['wall_time']))
+    return regressions
+
+
+def format_results(results):
+    """ Text table with results of the benchmark """
+
+    row_format = '{:<18}{:<8}{:>10}{:>12}{:>12}{:>14}{:>12}{:>8}'
+    lines = [row_format.format('case', 'mode', 'time, s', 'nodes',
+                               'solutions', 'solutions/s', 'rss, KB', 'util')]
+    for result in results:
+        lines.append(row_format.format(
+            result['name'], result['mode'], result['wall_time'],
+            result['nodes'], result['solutions'],
+            str(result['solutions_per_second']), str(result['peak_rss_kb']),
+            str(result['worker_utilization'])
+        ))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--suite', default='quick', choices=sorted(SUITES),
+                   help='Set of benchmark cases')
+    p.add_argument('--mode', default=None, choices=MODES,
+                   help='Run cases in this mode only')
+    p.add_argument('--engine', default=DEFAULT_ENGINE, choices=ENGINES,
+                   help='Implementation of the search of combinations')
+    p.add_argument('--workers', type=int, default=None,
+                   help='Number of worker processes for pool mode')
+    p.add_argument('--json', default=False, action='store_true',
+                   help='To print results in JSON format')
+    p.add_argument('--save-baseline', default=None,
+                   help='Path to the file for storing results as baseline')
+    p.add_argument('--baseline', default=None,
+                   help='Path to the stored baseline for comparison')
+    p.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                   help='Allowed slowdown against baseline (0.1 is 10%%)')
+    p.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.case:
+        # internal mode: run one case in this process
+        dim_x, dim_y, figures, mode, engine, workers = json.loads(args.case)
+        print(json.dumps(run_case(dim_x, dim_y, figures, mode, engine,
+                                  workers)))
+        exit(0)
+
+    modes = (args.mode,) if args.mode else MODES
+    suite_results = run_suite(SUITES[args.suite], modes, args.engine,
+                              args.workers)
+
+    found_regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found_regressions = compare_with_baseline(
+                suite_results, json.load(baseline_file), args.tolerance
+            )
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(suite_results, baseline_file, indent=2)
+
+    if args.json:
+        print(json.dumps(suite_results, indent=2))
+    else:
+        print(format_results(suite_results))
+    for case_name, case_mode, old_time, new_time in found_regressions:
+        print('Regression: {} ({}) {}s -> {}s'.format(
+            case_name, case_mode, old_time, new_time
+        ))
+    exit(1 if found_regressions else 0)
@@ -0,0 +1,172 @@
+"""
+This module provides the bitboard engine of the game logic.
+Every cell of the board is represented by one bit of an integer mask
+(the cell index is pos_x * dimension_y + pos_y, so bits follow the same order
+as free cells of the list-based board). Placing a figure is a couple of
+AND/OR operations and a child board is created by copying a few integers.
+"""
+from src.counting import popcount
+from src.figures import StoredFigure
+from src.results import get_combination_key
+
+
+class BitBoard(object):
+    """ Board with integer masks for occupied, attacked and free cells
+        used object's attributes:
+            dimension_x, dimension_y - board's dimensions
+            possible_figures - figure's classes which must be placed yet
+            figure_classes - figure's types indexed by type code
+            figures - placed figures like (figure_class, pos_x, pos_y)
+            occupied - mask of cells taken by figures
+            attacked - mask of cells under attack of placed figures
+            free_mask - mask of cells which are neither taken nor under
+                        attack (it is updated when the figure is placed)
+    """
+
+    def __init__(self, game):
+        self.dimension_x = game.dimension_x
+        self.dimension_y = game.dimension_y
+        self.possible_figures = list(game.possible_figures)
+        self.figure_classes = game.figure_classes
+        self.figures = []
+        self.occupied = 0
+        self.attacked = 0
+        self.full_mask = (1 << (self.dimension_x * self.dimension_y)) - 1
+        self.free_mask = self.full_mask
+        # attack masks per cell for every figure's type (shared by copies)
+        self._attack_masks = {}
+
+    def __hash__(self):
+        """ Used to provide uniq for board's combination"""
+        return hash(self.key())
+
+    def __eq__(self, other):
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def key(self):
+        """ Exact key of placed figures (see <get_combination_key>) """
+
+        cells_number = self.dimension_x * self.dimension_y
+        return get_combination_key(
+            [self.figure_classes.index(figure_class) * cells_number +
+             self.cell_index(pos_x, pos_y)
+             for figure_class, pos_x, pos_y in self.figures],
+            len(self.figure_classes) * cells_number
+        )
+
+    @property
+    def free_cells(self):
+        """ List of free cells in the same format as <Board.free_cells> """
+        return self._mask_to_cells(self.free_mask)
+
+    def free_cells_number(self):
+        """ Number of cells which are neither taken nor under attack """
+        return popcount(self.free_mask)
+
+    def candidate_cells(self, figure_class):
+        """ Free cells which can be tried for the next figure. Identical
+            figures are placed only after the cell of the previous copy, so
+            every multiset placement is built exactly once. Set bits of
+            the free mask are converted to coordinates one by one, so
+            lists of cells are not built.
+
+        :return: generator of coordinates like (pos_x, pos_y)
+        """
+        free_mask = self.free_mask
+        if self.figures and self.figures[-1][0] is figure_class:
+            _, last_x, last_y = self.figures[-1]
+            free_mask &= -1 << (self.cell_index(last_x, last_y) + 1)
+        dim_y = self.dimension_y
+        while free_mask:
+            lowest_bit = free_mask & -free_mask
+            yield divmod(lowest_bit.bit_length() - 1, dim_y)
+            free_mask ^= lowest_bit
+
+    def _mask_to_cells(self, free_mask):
+        """ Convert mask of cells to list of coordinates like [[x, y], ..] """
+
+        free_cells = []
+        while free_mask:
+            lowest_bit = free_mask & -free_mask
+            index = lowest_bit.bit_length() - 1
+            free_cells.append(list(self.cell_coords(index)))
+            free_mask ^= lowest_bit
+        return free_cells
+
+    def cell_index(self, pos_x, pos_y):
+        """ Number of bit which represents the cell (pos_x; pos_y) """
+        return pos_x * self.dimension_y + pos_y
+
+    def cell_coords(self, index):
+        """ Coordinates of the cell represented by bit with number <index> """
+        return divmod(index, self.dimension_y)
+
+    def attack_mask(self, figure_class, pos_x, pos_y):
+        """ Mask of cells which are under attack of the figure placed to
+            (pos_x; pos_y)
+        """
+        masks = self._attack_masks.get(figure_class)
+        if masks is None:
+            masks = self._attack_masks[figure_class] = \
+                figure_class.attack_table(self.dimension_x,
+                                          self.dimension_y).masks
+        return masks[pos_x * self.dimension_y + pos_y]
+
+    def can_place_figure(self, figure_class, pos_x, pos_y):
+        """ Detect possibility for placing figure to the free cell (see
+            <BitBoard.candidate_cells>): no one on the board is under the
+            impact of this figure
+        """
+        return not self.attack_mask(figure_class, pos_x, pos_y) & self.occupied
+
+    def next_figure(self):
+        """ Getting next of possible figure's class for this board
+
+        :return: subclass of <FigureOnBoard>
+        """
+
+        if not self.possible_figures:
+            return None
+        return self.possible_figures.pop(0)
+
+    def place_figure(self, figure_class, pos_x, pos_y):
+        """ Take position for specified figure
+
+        :param figure_class: class for generate instance
+                             (subclass for FigureOnBoard)
+        :param pos_x: coordinate X for figure on this board
+        :param pos_y: coordinate Y for figure on this board
+        """
+        self.figures.append((figure_class, pos_x, pos_y))
+        cell_bit = 1 << self.cell_index(pos_x, pos_y)
+        attack_mask = self.attack_mask(figure_class, pos_x, pos_y)
+        self.occupied |= cell_bit
+        self.attacked |= attack_mask
+        self.free_mask &= ~(cell_bit | attack_mask)
+
+    def copy(self):
+        """ Create child board state without copying figure's objects """
+
+        new_board = self.__class__.__new__(self.__class__)
+        new_board.__dict__.update(self.__dict__)
+        new_board.possible_figures = list(self.possible_figures)
+        new_board.figures = list(self.figures)
+        return new_board
+
+    def cells(self):
+        """ Numbers of cells of placed figures in order of placing """
+
+        return [self.cell_index(pos_x, pos_y)
+                for _, pos_x, pos_y in self.figures]
+
+    def serialize(self):
+        """ Represent all important data for storing to result collection"""
+
+        return [StoredFigure({
+            'type': figure_class.__name__,
+            'pos_x': pos_x,
+            'pos_y': pos_y,
+            'display_char': figure_class.display_char
+        }) for figure_class, pos_x, pos_y in self.figures]
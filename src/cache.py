@@ -0,0 +1,366 @@
+"""
+This module provides persistent cache of results of the game.
+Entries are addressed by hash of the normalized configuration: dimensions
+are sorted (a transposed board has the same combinations with swapped
+coordinates, because attacks of all figures are symmetric under
+transposition) and figures with zero number are dropped. Order of placing
+of figure's types is a part of the key, because figures are listed in
+combinations in this order. Combinations are read in order of the search on
+the requested board: the entry written on the transposed board is sorted
+again (see <sort_combinations>).
+
+Directory structure:
+    index.json - entries like {key: {count, file, size, checksum,
+                 transposed, used}}, where transposed is True if the file
+                 is written by the game on the transposed board
+    index.lock - lock of the index (read-modify-write of the index is
+                 exclusive, so the cache is shared by concurrent processes
+                 and threads)
+    <key>.chsr - combinations in the binary results format (see storage)
+
+Entries with files are evicted in least recently used order when total
+size of files exceeds the limit (files which are not registered in the
+index are removed too). Checksum of the file is verified before reading,
+so damaged entries are dropped instead of being returned.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # the index is not locked on platforms without fcntl
+    fcntl = None
+
+from src.exceptions import ResultsFileError
+from src.figures import StoredFigure
+from src.storage import ResultsReader, ResultsWriter
+
+# Version of the cache: entries of other versions are never used
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache'
+)
+DEFAULT_CACHE_SIZE = 1 << 30
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+ENTRY_EXTENSION = '.chsr'
+
+
+def get_file_checksum(path):
+    """ SHA-256 digest of the file's content """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as entry_file:
+        for chunk in iter(lambda: entry_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transpose_combination(serialized_board):
+    """ The same combination on the transposed board. Identical figures are
+        kept in increasing order of cells (like the search builds them).
+    """
+    types_order = {}
+    for figure in serialized_board:
+        types_order.setdefault(figure['type'], len(types_order))
+    transposed_board = [
+        StoredFigure(figure, pos_x=figure['pos_y'], pos_y=figure['pos_x'])
+        for figure in serialized_board
+    ]
+    transposed_board.sort(key=lambda figure: (types_order[figure['type']],
+                                              figure['pos_x'],
+                                              figure['pos_y']))
+    return transposed_board
+
+
+def sort_combinations(combinations, dim_y):
+    """ Combinations in order of the search on the board with the specified
+        second dimension: cells of figures in order of placing are compared
+        like the search tries them (see <Game.iter_combinations>). Only
+        packed cells of combinations are kept while they are sorted.
+
+    :param combinations: iterable with serialized boards
+    :return: generator of serialized boards
+    """
+    figures = None
+    records = []
+    for serialized_board in combinations:
+        if figures is None:
+            # all combinations have the same types in order of placing
+            figures = [(figure['type'], figure['display_char'])
+                       for figure in serialized_board]
+            # big-endian cells are compared as bytes in order of numbers
+            cells_format = struct.Struct('>{}H'.format(len(figures)))
+        records.append(cells_format.pack(*[
+            figure['pos_x'] * dim_y + figure['pos_y']
+            for figure in serialized_board
+        ]))
+    records.sort()
+    for record in records:
+        serialized_board = []
+        for (figure_type, display_char), cell in zip(
+                figures, cells_format.unpack(record)):
+            pos_x, pos_y = divmod(cell, dim_y)
+            serialized_board.append(StoredFigure({
+                'type': figure_type,
+                'pos_x': pos_x,
+                'pos_y': pos_y,
+                'display_char': display_char
+            }))
+        yield serialized_board
+
+
+class ResultsCache(object):
+    """ Size-bounded on-disk cache of combinations and their numbers
+        used object's attributes:
+            cache_dir - directory with entries of the cache
+            max_size - maximal total size (bytes) of files of entries
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(game):
+        """ Normalized configuration of the game and flag of transposition
+
+        :return: pair like (key, transposed)
+        """
+        dim_x, dim_y = game.dimension_x, game.dimension_y
+        figures = sorted((alias, number)
+                         for alias, number in game.figures_numbers.items()
+                         if number)
+        config = [CACHE_VERSION, min(dim_x, dim_y), max(dim_x, dim_y),
+                  figures, [figure_class.__name__
+                            for figure_class in game.figure_classes]]
+        key = hashlib.sha256(json.dumps(config).encode()).hexdigest()
+        return key, dim_x > dim_y
+
+    def _get_path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """ Exclusive lock of the index: every read-modify-write of the
+            index is done under this lock
+        """
+        with open(self._get_path(LOCK_FILE), 'a') as lock_file:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        """ Read index of entries (damaged index is replaced by empty one)
+        """
+        try:
+            with open(self._get_path(INDEX_FILE)) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {'clock': 0, 'entries': {}}
+        if not isinstance(index, dict) or 'entries' not in index:
+            return {'clock': 0, 'entries': {}}
+        return index
+
+    def _save_index(self, index):
+        """ Atomically replace index of entries """
+
+        self._write_atomically(
+            INDEX_FILE, lambda index_file: json.dump(index, index_file), 'w'
+        )
+
+    def _write_atomically(self, name, write, mode='wb'):
+        """ Write file through temporary one, so other processes never see
+            partially written file
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, mode) as tmp_file:
+                write(tmp_file)
+            os.replace(tmp_path, self._get_path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _touch(self, index, key):
+        """ Mark the entry as recently used """
+
+        index['clock'] = index.get('clock', 0) + 1
+        index['entries'][key]['used'] = index['clock']
+
+    def _drop(self, index, key):
+        """ Remove the entry and its file """
+
+        entry = index['entries'].pop(key)
+        if entry.get('file'):
+            try:
+                os.unlink(self._get_path(entry['file']))
+            except OSError:
+                pass
+
+    def _evict(self, index):
+        """ Remove files which are not registered in the index and least
+            recently used files while total size of files exceeds the limit
+        """
+        entries = index['entries']
+        registered = {entry['file'] for entry in entries.values()
+                      if entry.get('file')}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_EXTENSION) and name not in registered:
+                try:
+                    os.unlink(self._get_path(name))
+                except OSError:
+                    pass
+
+        with_files = sorted((entry['used'], key)
+                            for key, entry in entries.items()
+                            if entry.get('file'))
+        total_size = sum(entries[key]['size'] for _, key in with_files)
+        for _, key in with_files:
+            if total_size <= self.max_size:
+                break
+            total_size -= entries[key]['size']
+            self._drop(index, key)
+
+    def get_count(self, game):
+        """ Cached number of combinations of the game or None """
+
+        key, _ = self.get_key(game)
+        with self._lock():
+            index = self._load_index()
+            entry = index['entries'].get(key)
+            if entry is None:
+                return None
+            self._touch(index, key)
+            self._save_index(index)
+        return entry['count']
+
+    def put_count(self, game, count):
+        """ Store number of combinations of the game """
+
+        key, _ = self.get_key(game)
+        with self._lock():
+            index = self._load_index()
+            if key not in index['entries']:
+                index['entries'][key] = {'count': count, 'file': None,
+                                         'size': 0, 'checksum': None}
+            self._touch(index, key)
+            self._save_index(index)
+
+    def get_results(self, game):
+        """ Cached combinations of the game
+
+        :return: generator of serialized boards or None if combinations of
+                 the game are not cached (or the entry is damaged)
+        """
+        key, transposed = self.get_key(game)
+        with self._lock():
+            entry = self._load_index()['entries'].get(key)
+        if entry is None or not entry.get('file'):
+            return None
+
+        # the file is verified without holding of the lock
+        path = self._get_path(entry['file'])
+        try:
+            valid = get_file_checksum(path) == entry['checksum']
+            if valid:
+                ResultsReader(path).close()
+        except (OSError, ResultsFileError):
+            valid = False
+
+        with self._lock():
+            index = self._load_index()
+            current_entry = index['entries'].get(key)
+            if current_entry is not None and \
+                    current_entry.get('checksum') == entry['checksum']:
+                if valid:
+                    self._touch(index, key)
+                else:
+                    self._drop(index, key)
+                self._save_index(index)
+        if not valid:
+            return None
+        return self._iter_entry(path, transposed,
+                                transposed != entry.get('transposed', False),
+                                game.dimension_y)
+
+    @staticmethod
+    def _iter_entry(path, transposed, reordered, dim_y):
+        """ Read combinations of the entry (on the requested board)
+
+        :param reordered: the entry is written on the other board, so
+                          combinations are sorted in order of the search
+                          on the requested board (see <sort_combinations>)
+        """
+        with ResultsReader(path) as reader:
+            combinations = iter(reader)
+            if transposed:
+                combinations = map(transpose_combination, combinations)
+            if reordered:
+                combinations = sort_combinations(combinations, dim_y)
+            for serialized_board in combinations:
+                yield serialized_board
+
+    def put_results(self, game, combinations):
+        """ Store combinations of the game: they are yielded back as soon as
+            they are written, the entry is added when all of them are written
+            (combinations of the interrupted search are not complete, so
+            the entry is not added then, see <Game.partial>)
+
+        :param combinations: iterable with serialized boards
+        :return: generator of serialized boards
+        """
+        key, transposed = self.get_key(game)
+        figures_counts = [game.possible_figures.count(figure_class)
+                          for figure_class in game.figure_classes]
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            writer = ResultsWriter(
+                tmp_path, min(game.dimension_x, game.dimension_y),
+                max(game.dimension_x, game.dimension_y),
+                game.figure_classes, figures_counts
+            )
+            with writer:
+                for serialized_board in combinations:
+                    writer.write(transpose_combination(serialized_board)
+                                 if transposed else serialized_board)
+                    yield serialized_board
+            if not game.partial:
+                self._add_entry(key, tmp_path, writer.records_number,
+                                transposed)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _add_entry(self, key, tmp_path, count, transposed=False):
+        """ Move written file to the cache and register it in the index
+
+        :param transposed: the file is written on the transposed board
+        """
+
+        name = key + ENTRY_EXTENSION
+        checksum = get_file_checksum(tmp_path)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_size:
+            return
+        with self._lock():
+            os.replace(tmp_path, self._get_path(name))
+            index = self._load_index()
+            index['entries'][key] = {'count': count, 'file': name,
+                                     'size': size, 'checksum': checksum,
+                                     'transposed': transposed}
+            self._touch(index, key)
+            self._evict(index)
+            self._save_index(index)
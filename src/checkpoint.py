@@ -0,0 +1,203 @@
+"""
+This module provides checkpoints of long-running searches: prefixes of all
+subtrees of the search, numbers of finished subtrees and their results are
+periodically written to disk, so the interrupted search can be resumed
+without repeating of finished subtrees.
+
+Directory structure:
+    checkpoint.json - state like {identity, prefixes, parts}, where parts
+                      are like {file, subtrees: [[index, records], ..]}
+    part-<number>.chsr - results of finished subtrees in the binary results
+                         format (see storage), records of every subtree
+                         follow each other in order of the part's subtrees
+
+Files of parts are written before the state and the state is replaced
+atomically, so the checkpoint is consistent after interruption at any
+moment.
+"""
+import json
+import os
+import tempfile
+import time
+
+from src.exceptions import CheckpointError, ResultsFileError
+from src.results import ResultSet
+from src.storage import ResultsReader, ResultsWriter
+
+# Version of the checkpoint: checkpoints of other versions are not resumed
+CHECKPOINT_VERSION = 2
+DEFAULT_CHECKPOINT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.checkpoint'
+)
+# Minimal number of seconds between writes of the checkpoint
+CHECKPOINT_INTERVAL = 60.0
+STATE_FILE = 'checkpoint.json'
+PART_PREFIX = 'part-'
+PART_EXTENSION = '.chsr'
+
+
+class Checkpoint(object):
+    """ Periodically saved state of the search of one game
+        used object's attributes:
+            checkpoint_dir - directory with files of the checkpoint
+            resume - finished subtrees of the saved state are not repeated
+            interval - minimal number of seconds between writes
+    """
+
+    def __init__(self, checkpoint_dir=DEFAULT_CHECKPOINT_DIR, resume=False,
+                 interval=CHECKPOINT_INTERVAL):
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.interval = interval
+        self._game = None
+        self._state = None
+        # finished but not written subtrees like {index: serialized_boards}
+        self._pending = {}
+        self._saved_at = None
+
+    @staticmethod
+    def get_identity(game):
+        """ Parameters of the game which define its subtrees and results """
+
+        figures = sorted([alias, number]
+                         for alias, number in game.figures_numbers.items()
+                         if number)
+        return [CHECKPOINT_VERSION, game.dimension_x, game.dimension_y,
+                figures, [figure_class.__name__
+                          for figure_class in game.figure_classes],
+                game.symmetry, list(game.shard or ())]
+
+    def _get_path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def _load_state(self):
+        """ Saved state or None if the checkpoint does not exist """
+
+        try:
+            with open(self._get_path(STATE_FILE)) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            raise CheckpointError('Checkpoint in {} is damaged'.format(
+                self.checkpoint_dir
+            ))
+
+    def _save_state(self):
+        """ Atomically replace the saved state """
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir,
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(self._state, tmp_file)
+            os.replace(tmp_path, self._get_path(STATE_FILE))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def start(self, game, prefixes):
+        """ Start checkpoints of the search. The saved state is restored
+            in resume mode, otherwise the previous checkpoint is replaced.
+
+        :param prefixes: prefixes of subtrees of the new search
+        :return: pair like (prefixes, finished), where prefixes are taken
+                 from the saved state in resume mode and finished are
+                 results of finished subtrees like {index: <ResultSet>}
+        """
+        self._game = game
+        self._pending = {}
+        self._saved_at = time.time()
+        identity = self.get_identity(game)
+        state = self._load_state() if self.resume else None
+        if state is not None:
+            if state.get('identity') != identity:
+                raise CheckpointError(
+                    'Checkpoint in {} belongs to other game'.format(
+                        self.checkpoint_dir
+                    )
+                )
+            self._state = state
+            prefixes = [tuple(prefix) for prefix in state['prefixes']]
+            return prefixes, self._load_parts()
+
+        self.clear()
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self._state = {'identity': identity,
+                       'prefixes': [list(prefix) for prefix in prefixes],
+                       'parts': []}
+        self._save_state()
+        return prefixes, {}
+
+    def _load_parts(self):
+        """ Results of finished subtrees from files of parts
+            like {index: <ResultSet>}
+        """
+
+        game = self._game
+        finished = {}
+        for part in self._state['parts']:
+            try:
+                with ResultsReader(self._get_path(part['file'])) as reader:
+                    # records are copied as they are, without building of
+                    # serialized boards
+                    start = 0
+                    for index, records in part['subtrees']:
+                        finished[index] = ResultSet(
+                            game.dimension_x, game.dimension_y,
+                            game.figure_classes, len(game.possible_figures),
+                            reader.read_records(start, start + records)
+                        )
+                        start += records
+            except (OSError, ResultsFileError, IndexError):
+                raise CheckpointError(
+                    'Part {} of checkpoint in {} is damaged'.format(
+                        part['file'], self.checkpoint_dir
+                    )
+                )
+        return finished
+
+    def add(self, index, serialized_boards):
+        """ Register results of the finished subtree: they are written with
+            other pending subtrees when the interval is over
+        """
+        self._pending[index] = serialized_boards
+        if time.time() - self._saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        """ Write pending subtrees to the new part and update the state """
+
+        self._saved_at = time.time()
+        if not self._pending:
+            return
+        game = self._game
+        name = '{}{}{}'.format(PART_PREFIX, len(self._state['parts']),
+                               PART_EXTENSION)
+        figures_counts = [game.possible_figures.count(figure_class)
+                          for figure_class in game.figure_classes]
+        subtrees = []
+        with ResultsWriter(self._get_path(name), game.dimension_x,
+                           game.dimension_y, game.figure_classes,
+                           figures_counts) as writer:
+            for index, serialized_boards in self._pending.items():
+                for serialized_board in serialized_boards:
+                    writer.write(serialized_board)
+                subtrees.append([index, len(serialized_boards)])
+        self._state['parts'].append({'file': name, 'subtrees': subtrees})
+        self._save_state()
+        self._pending = {}
+
+    def clear(self):
+        """ Remove all files of the checkpoint (the state is removed first,
+            so the interrupted removal does not leave the damaged state)
+        """
+        if not os.path.isdir(self.checkpoint_dir):
+            return
+        names = sorted(os.listdir(self.checkpoint_dir),
+                       key=lambda name: name != STATE_FILE)
+        for name in names:
+            if name == STATE_FILE or (name.startswith(PART_PREFIX) and
+                                      name.endswith(PART_EXTENSION)):
+                os.unlink(self._get_path(name))
@@ -0,0 +1,279 @@
+"""
+This module provides counting of combinations without building of boards.
+The search state is represented by masks of cells which are still available
+for every remaining figure's type: a cell is available if it is free and a
+figure of this type placed on it does not attack figures already placed.
+Identical states reached by different placement orders are counted once
+(transposition table). Numbers of combinations of states give every
+combination its number, so combinations are drawn at random without
+enumeration of others.
+"""
+import random
+import sys
+
+from src.exceptions import SearchCancelledError
+
+# Maximal number of memoized states of the counter (about 200 bytes per
+# state of the board with 64 cells)
+MEMO_SIZE = 1 << 20
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # python < 3.10
+    def popcount(mask):
+        """ Number of set bits of the mask """
+        return bin(mask).count('1')
+
+
+class CombinationsCounter(object):
+    """ Counter of combinations with memoization of subproblems
+        used object's attributes:
+            figure_classes - types of figures in order of placing
+            figures_counts - numbers of figures for every type
+            attack_masks - attack masks per cell for every type
+            reverse_masks - masks of cells from which a figure of the type
+                            attacks the cell (per cell for every type)
+            is_cancelled - function which returns True when counting is
+                           cancelled by the caller (or None)
+            memo_size - maximal number of memoized states (the table is
+                        cleared when it is full)
+
+        The state is a tuple like (type_index, figures_left, masks), where
+        masks contains available cells for types starting from type_index.
+        Identical figures are placed in increasing order of cells, so the
+        mask of the current type keeps only cells after the last copy.
+    """
+
+    def __init__(self, dim_x, dim_y, figure_classes, figures_counts):
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.figure_classes = list(figure_classes)
+        self.figures_counts = list(figures_counts)
+        if 2 in self.figures_counts[:-1]:
+            # number of combinations does not depend on order of types, and
+            # a pair of the last type is counted without child states
+            pair_index = len(self.figures_counts) - 1 - \
+                self.figures_counts[::-1].index(2)
+            self.figure_classes.append(self.figure_classes.pop(pair_index))
+            self.figures_counts.append(self.figures_counts.pop(pair_index))
+        self.attack_masks = []
+        self.reverse_masks = []
+        cells_number = dim_x * dim_y
+        for figure_class in self.figure_classes:
+            table = figure_class.attack_table(dim_x, dim_y)
+            reverse_masks = [0] * cells_number
+            for cell, attack_cells in enumerate(table.cells):
+                for coord_x, coord_y in attack_cells:
+                    reverse_masks[table.index(coord_x, coord_y)] |= 1 << cell
+            self.attack_masks.append(table.masks)
+            self.reverse_masks.append(reverse_masks)
+        self.is_cancelled = None
+        self.memo_size = MEMO_SIZE
+        # numbers of combinations of expanded states (transposition table)
+        self._memo = {}
+
+    def initial_state(self):
+        """ State of the empty board """
+
+        full_mask = (1 << (self.dimension_x * self.dimension_y)) - 1
+        masks = (full_mask,) * len(self.figure_classes)
+        figures_left = self.figures_counts[0] if self.figures_counts else 0
+        return self._normalize(0, figures_left, masks)
+
+    def _normalize(self, type_index, figures_left, masks):
+        """ Switch the state to the next figure's type when all figures of
+            the current type are placed
+        """
+        types_number = len(self.figure_classes)
+        while figures_left == 0 and type_index < types_number:
+            type_index += 1
+            masks = masks[1:]
+            if type_index < types_number:
+                figures_left = self.figures_counts[type_index]
+        return type_index, figures_left, masks
+
+    def place(self, state, cell):
+        """ Child state after placing the next figure to the cell """
+
+        type_index, figures_left, masks = state
+        bit = 1 << cell
+        attack_mask = self.attack_masks[type_index][cell]
+        new_masks = []
+        for offset, mask in enumerate(masks):
+            new_masks.append(
+                mask & ~bit & ~attack_mask &
+                ~self.reverse_masks[type_index + offset][cell]
+            )
+        # next copy of the same figure is placed after this cell only
+        new_masks[0] &= -1 << (cell + 1)
+        return self._normalize(type_index, figures_left - 1, tuple(new_masks))
+
+    def is_final(self, state):
+        """ Detect that all figures are placed """
+        return state[0] == len(self.figure_classes)
+
+    def candidate_cells(self, state):
+        """ Cells which are available for the next figure """
+
+        cells = []
+        mask = state[2][0]
+        while mask:
+            bit = mask & -mask
+            cells.append(bit.bit_length() - 1)
+            mask ^= bit
+        return cells
+
+    def _is_enough_space(self, state):
+        """ Detect that every remaining figure's type has enough available
+            cells for its figures
+        """
+        type_index, figures_left, masks = state
+        if popcount(masks[0]) < figures_left:
+            return False
+        for offset in range(1, len(masks)):
+            figures_count = self.figures_counts[type_index + offset]
+            if popcount(masks[offset]) < figures_count:
+                return False
+        return True
+
+    def _count_last_figures(self, state):
+        """ Number of combinations for one or two remaining figures of the
+            last type (without building of child states)
+        """
+        type_index, figures_left, masks = state
+        mask = masks[0]
+        if figures_left == 1:
+            # the last figure can be placed to any available cell
+            return popcount(mask)
+
+        # pairs of cells which do not attack each other
+        attack_masks = self.attack_masks[type_index]
+        reverse_masks = self.reverse_masks[type_index]
+        result = 0
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            cell = bit.bit_length() - 1
+            result += popcount(
+                mask & ~(attack_masks[cell] | reverse_masks[cell])
+            )
+        return result
+
+    def _get_known_count(self, state):
+        """ Number of combinations of the state which is known without
+            expanding of child states
+
+        :return: number of combinations or None if the state is expanded
+        """
+        if self.is_final(state):
+            return 1
+        result = self._memo.get(state)
+        if result is not None:
+            return result
+        type_index, figures_left, _ = state
+        if type_index == len(self.figure_classes) - 1 and figures_left <= 2:
+            # cheap states are not memoized (they are most of all states)
+            return self._count_last_figures(state)
+        if not self._is_enough_space(state):
+            # remaining figures can not be placed to available cells
+            return 0
+        return None
+
+    def _check_cancelled(self):
+        """ Stop counting if it is cancelled by the caller """
+
+        if self.is_cancelled is not None and self.is_cancelled():
+            # only finished states are memoized, so counting can be repeated
+            raise SearchCancelledError('Counting is cancelled')
+
+    def count(self, state=None):
+        """ Number of combinations reachable from the state. States are
+            expanded with an explicit stack instead of recursion, so the
+            number of figures is not limited by the recursion limit.
+
+        :param state: search state (the empty board by default)
+        """
+        if state is None:
+            state = self.initial_state()
+        result = self._get_known_count(state)
+        if result is not None:
+            return result
+
+        self._check_cancelled()
+        # frames like [state, not expanded candidate cells, result]
+        stack = [[state, self.candidate_cells(state), 0]]
+        while True:
+            frame = stack[-1]
+            if frame[1]:
+                child = self.place(frame[0], frame[1].pop())
+                result = self._get_known_count(child)
+                if result is None:
+                    self._check_cancelled()
+                    stack.append([child, self.candidate_cells(child), 0])
+                else:
+                    frame[2] += result
+                continue
+
+            stack.pop()
+            state, _, result = frame
+            if len(self._memo) >= self.memo_size:
+                # memory of the transposition table is bounded
+                self._memo.clear()
+            self._memo[state] = result
+            if not stack:
+                return result
+            stack[-1][2] += result
+
+    def clear(self):
+        """ Forget numbers of combinations of memoized states (e.g. when
+            counting is finished)
+        """
+        self._memo.clear()
+
+    def get_combination(self, index):
+        """ Combination with the specified number in order of the search:
+            every placement is chosen by numbers of combinations of child
+            states, so other combinations are not built
+
+        :param index: number of the combination (from 0 to count() - 1)
+        :return: list of placements like (figure_class, cell)
+        """
+        state = self.initial_state()
+        if not 0 <= index < self.count(state):
+            raise IndexError('Combination index out of range')
+
+        placements = []
+        while not self.is_final(state):
+            for cell in self.candidate_cells(state):
+                child = self.place(state, cell)
+                child_count = self.count(child)
+                if index < child_count:
+                    break
+                index -= child_count
+            placements.append((self.figure_classes[state[0]], cell))
+            state = child
+        return placements
+
+    def sample(self, number, seed=None):
+        """ Combinations drawn uniformly at random without repetitions
+
+        :param number: number of combinations (all combinations are given
+                       in random order if there are less of them)
+        :param seed: seed of the random generator (for reproducible samples)
+        :return: generator of combinations (see <get_combination>)
+        """
+        total = self.count()
+        number = min(number, total)
+        rng = random.Random(seed)
+        if total <= sys.maxsize:
+            indexes = rng.sample(range(total), number)
+        else:
+            # range is too large for random.sample, the sample is small
+            indexes = []
+            drawn = set()
+            while len(indexes) < number:
+                index = rng.randrange(total)
+                if index not in drawn:
+                    drawn.add(index)
+                    indexes.append(index)
+        for index in indexes:
+            yield self.get_combination(index)
@@ -5,3 +5,23 @@
 class GameArgumentsValidationError(Exception):
     """ Exception to detect creation of a game with invalid arguments """
     pass
+
+
+class ResultsFileError(Exception):
+    """ Exception to detect reading of incorrect results file """
+    pass
+
+
+class CheckpointError(Exception):
+    """ Exception to detect resuming of incorrect checkpoint """
+    pass
+
+
+class ShardError(Exception):
+    """ Exception to detect merging of incorrect set of shards """
+    pass
+
+
+class SearchCancelledError(Exception):
+    """ Exception to detect the search cancelled by the caller """
+    pass
@@ -1,59 +1,171 @@
 """
 This module provides figures logic and data descriptions.
 You can extend the game logic by adding a new figure's type
-(inherited from the class "FigureOnBoard")
+(inherited from the class "FigureOnBoard", empty "__slots__" keep its
+instances compact)
 """
+import threading
+from collections import namedtuple
+
+# Dimensions of the board used for building attack tables
+BoardDimensions = namedtuple('BoardDimensions', 'dimension_x dimension_y')
+
+# Cached attack tables like {(figure_class, dim_x, dim_y): <AttackTable>}
+# in order of building: at most ATTACK_TABLES_SIZE tables are kept (the
+# long-running process gets queries about many boards), the oldest table is
+# dropped first, so getting of the cached table costs nothing more. Pinned
+# tables (see <pin_attack_tables>) are never dropped and are not limited.
+_attack_tables = {}
+_pinned_tables = set()
+# tables are built and dropped by one thread at once (e.g. query server)
+_attack_tables_lock = threading.Lock()
+ATTACK_TABLES_SIZE = 64
+
+
+class AttackTable(object):
+    """ Precomputed attacks of one figure's type for every cell of the board.
+        Cells are numbered as pos_x * dimension_y + pos_y.
+        used object's attributes:
+            masks - attack masks (one bit per cell) indexed by cell's number
+            cells - tuples of attacked coordinates indexed by cell's number
+            figures - shared figures (see <FigureOnBoard.on_cell>) indexed
+                      by cell's number
+    """
+    __slots__ = ('dimension_x', 'dimension_y', 'masks', 'cells', 'figures')
+
+    def __init__(self, figure_class, dim_x, dim_y):
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.masks = []
+        self.cells = []
+        self.figures = []
+        board = BoardDimensions(dim_x, dim_y)
+        for pos_x in range(dim_x):
+            for pos_y in range(dim_y):
+                figure = figure_class(board, pos_x, pos_y)
+                self.figures.append(figure)
+                attack_cells = []
+                mask = 0
+                for coord_x, coord_y in figure._get_cells_to_attack():
+                    if not (0 <= coord_x < dim_x and 0 <= coord_y < dim_y):
+                        continue
+                    if (coord_x, coord_y) == (pos_x, pos_y):
+                        continue
+                    bit = 1 << self.index(coord_x, coord_y)
+                    if not mask & bit:
+                        mask |= bit
+                        attack_cells.append((coord_x, coord_y))
+                self.masks.append(mask)
+                self.cells.append(tuple(attack_cells))
+
+    def index(self, pos_x, pos_y):
+        """ Number of the cell (pos_x; pos_y) in this table """
+        return pos_x * self.dimension_y + pos_y
+
+
+def get_attack_table(figure_class, dim_x, dim_y):
+    """ Getting (lazily built) attack table for figure's type and board's
+        dimensions. Tables are cached on module level, so they are shared by
+        all placements and inherited by forked worker processes.
+
+    :return: <AttackTable> instance
+    """
+    key = (figure_class, dim_x, dim_y)
+    table = _attack_tables.get(key)
+    if table is not None:
+        return table
+    with _attack_tables_lock:
+        table = _attack_tables.get(key)
+        if table is None:
+            table = AttackTable(figure_class, dim_x, dim_y)
+            unpinned = [cached_key for cached_key in _attack_tables
+                        if cached_key not in _pinned_tables]
+            # the new table is counted too
+            for cached_key in unpinned[:len(unpinned) -
+                                       ATTACK_TABLES_SIZE + 1]:
+                del _attack_tables[cached_key]
+            _attack_tables[key] = table
+    return table
+
+
+def pin_attack_tables(figure_classes, dim_x, dim_y):
+    """ Build attack tables for figure's types and board's dimensions and
+        keep them until the end of the process (e.g. tables of all jobs of
+        the batch which are inherited by workers of the pool)
+    """
+    for figure_class in figure_classes:
+        with _attack_tables_lock:
+            _pinned_tables.add((figure_class, dim_x, dim_y))
+        get_attack_table(figure_class, dim_x, dim_y)
 
 
 class FigureOnBoard(object):
     """ The base class for the description of the figures Logic
         used object's attributes:
             display_char - symbol for display on ASCI board
-            board - current board
+            board - current board (dimensions only for shared figures)
             pos_x, pos_y - current position on the board
     """
+    __slots__ = ('board', 'pos_x', 'pos_y')
 
     display_char = None
 
     def __init__(self, board, pos_x, pos_y):
-        self._cells_to_attack = []
         self.board = board
         self.pos_x, self.pos_y = pos_x, pos_y
 
+    @classmethod
+    def attack_table(cls, dim_x, dim_y):
+        """ Precomputed attacks of this figure's type for the board with
+            specified dimensions (see <AttackTable>)
+        """
+        return get_attack_table(cls, dim_x, dim_y)
+
+    @classmethod
+    def on_cell(cls, dim_x, dim_y, pos_x, pos_y):
+        """ Shared (immutable) figure of this type on the cell of the board
+            with specified dimensions: figures are created once per cell
+            with attack tables, so placing of figures allocates nothing.
+            Its "board" is dimensions of the board only.
+        """
+        table = get_attack_table(cls, dim_x, dim_y)
+        return table.figures[table.index(pos_x, pos_y)]
+
     def can_take_position(self):
         """ Detect possibility for taking position: No one on the board is
             under the impact of this figure
         :return: True | False
         """
+        return not self.attacks_any(self.board.figures)
 
-        figure_positions = {(f.pos_x, f.pos_y) for f in self.board.figures}
-        attack_cells = set(self.cells_to_attack())
-        return not bool(figure_positions.intersection(attack_cells))
-
-    def cells_to_attack(self):
-        """ Return cells for attack this figure on this board. This method
-            gets correct attack cells and filters them
+    def attacks_any(self, figures):
+        """ Detect that some of figures is under the impact of this figure
 
-        :return: list of coordinates of cells to attack.
-                 For example: [(0,1),(1,1)..]
+        :param figures: figures placed on the board
+        :return: True | False
         """
-        if self._cells_to_attack:
-            return self._cells_to_attack
+        table = self.attack_table(self.board.dimension_x,
+                                  self.board.dimension_y)
+        attack_mask = table.masks[table.index(self.pos_x, self.pos_y)]
+        for figure in figures:
+            if attack_mask >> table.index(figure.pos_x, figure.pos_y) & 1:
+                return True
+        return False
 
-        attack_cells = self._get_cells_to_attack()
-        # removing self position
-        while (self.pos_x, self.pos_y) in attack_cells:
-            attack_cells.remove((self.pos_x, self.pos_y))
-
-        # filtering cells outside of the board
-        self._cells_to_attack = \
-            list(filter(lambda x: x[0] >= 0 and x[1] >= 0, attack_cells))
+    def cells_to_attack(self):
+        """ Return cells for attack this figure on this board (taken from
+            the precomputed attack table)
 
-        return self._cells_to_attack
+        :return: tuple of coordinates of cells to attack.
+                 For example: ((0,1),(1,1)..)
+        """
+        table = self.attack_table(self.board.dimension_x,
+                                  self.board.dimension_y)
+        return table.cells[table.index(self.pos_x, self.pos_y)]
 
     def _get_cells_to_attack(self):
         """ Every subclass must to override this method for getting correct
-            cells to attack
+            cells to attack. Result may contain cells outside of the board
+            and self position: they are filtered by <AttackTable>
         :return: list of coordinates of cells to attack.
         """
         raise NotImplementedError
@@ -94,6 +206,8 @@ class King(FigureOnBoard):
        1 | - * K *
        2 | - * * *
     """
+    __slots__ = ()
+
     display_char = 'K'
 
     def _get_cells_to_attack(self):
@@ -115,6 +229,8 @@ class Rook(FigureOnBoard):
        1 | * * R *
        2 | - - * -
     """
+    __slots__ = ()
+
     display_char = 'R'
 
     def _get_cells_to_attack(self):
@@ -137,6 +253,8 @@ class Queen(FigureOnBoard):
        1 | * * Q *
        2 | - * * *
     """
+    __slots__ = ()
+
     display_char = 'Q'
 
     def _get_cells_to_attack(self):
@@ -188,6 +306,7 @@ class Bishop(FigureOnBoard):
        1 | - - B -
        2 | - * - *
     """
+    __slots__ = ()
 
     display_char = 'B'
 
@@ -234,6 +353,7 @@ class Knight(FigureOnBoard):
        1 | - - N -
        2 | * - - -
     """
+    __slots__ = ()
 
     display_char = 'N'
 
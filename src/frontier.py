@@ -0,0 +1,271 @@
+"""
+This module provides the level-synchronous engine of the game logic based
+on NumPy (optional dependency: the engine is not available without it).
+The search places one figure per level for the whole frontier of partial
+combinations at once: the frontier is kept as boolean arrays of occupied
+and blocked cells, and candidate placements for all its states are found
+and filtered by vectorized operations with precomputed attack matrices.
+States with less free cells than remaining figures are dropped (and states
+which are not prefixes of canonical combinations in symmetry mode, see
+<BoardSymmetry.reduce_transforms>).
+
+The frontier is split to chunks and chunks are expanded depth-first, so
+memory is bounded by the chunk size and number of figures, and combinations
+are generated in the same order as by <CombinationsSearch>.
+"""
+try:
+    import numpy
+except ImportError:  # NumPy is not installed
+    numpy = None
+
+from src.symmetry import get_type_blocks
+
+# Maximal number of states in one chunk of the frontier
+MAX_FRONTIER = 1 << 15
+
+
+class FrontierSearch(object):
+    """ Breadth-first (level by level) search of combinations over chunks
+        of the frontier
+        used object's attributes:
+            figures - figure's classes in order of placing
+            attack_matrices - boolean matrices like [cell, attacked_cell]
+                              for every placed figure
+            same_as_previous - flags: figure has the same type as previous
+                               one (it is placed after the previous copy only)
+            max_frontier - maximal number of states in one chunk
+            symmetry - symmetries of the board (<BoardSymmetry>) or None:
+                       only canonical combinations are found then
+            orbit_sizes - sizes of orbits of the last batch (symmetry mode)
+
+        Combinations are generated by batches: integer arrays with one row
+        of cells numbers (aligned with figures) per combination.
+    """
+
+    def __init__(self, dim_x, dim_y, figures, max_frontier=MAX_FRONTIER,
+                 symmetry=None):
+        if numpy is None:
+            raise ImportError('NumPy is required for the frontier engine')
+
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.cells_number = dim_x * dim_y
+        self.figures = list(figures)
+        self.max_frontier = max_frontier
+        self.same_as_previous = [
+            index > 0 and figure_class is self.figures[index - 1]
+            for index, figure_class in enumerate(self.figures)
+        ]
+
+        matrices = {}
+        for figure_class in self.figures:
+            if figure_class in matrices:
+                continue
+            table = figure_class.attack_table(dim_x, dim_y)
+            matrix = numpy.zeros((self.cells_number, self.cells_number),
+                                 dtype=bool)
+            for cell, attack_cells in enumerate(table.cells):
+                for coord_x, coord_y in attack_cells:
+                    matrix[cell, table.index(coord_x, coord_y)] = True
+            # the figure blocks its own cell too
+            numpy.fill_diagonal(matrix, True)
+            matrices[figure_class] = matrix
+        self.attack_matrices = [matrices[figure_class]
+                                for figure_class in self.figures]
+        # conflicts[state, cell] = occupied[state] @ matrix.T[:, cell]:
+        # the figure on the cell attacks some occupied cell
+        self._conflict_matrices = [
+            numpy.ascontiguousarray(matrix.T, dtype=numpy.float32)
+            for matrix in self.attack_matrices
+        ]
+        # cells after the cell like [cell, next_cell]
+        cells = numpy.arange(self.cells_number)
+        self._after_cell = cells[None, :] > cells[:, None]
+
+        self.symmetry = symmetry
+        self.orbit_sizes = None
+        self._transforms = None
+        if symmetry is not None:
+            self._transforms = numpy.array(symmetry.transforms,
+                                           dtype=numpy.int32)
+        # depth of the first figure of the same type and flags: the last
+        # figure of its type (for checking of canonical order by types)
+        self.type_starts, self.type_ends = get_type_blocks(self.figures)
+
+    def run(self, prefix=(), stats=None, is_stopped=None):
+        """ Generate all combinations which start with specified placements
+
+        :param prefix: cells of the first figures (already placed figures)
+        :param stats: <SearchStats> for counters of the search
+        :param is_stopped: function which returns True when the search
+                           must be stopped (e.g. the timeout is over), it is
+                           called before every chunk
+        :return: generator of arrays of combinations (one row per
+                 combination like [cell, cell, ...])
+        """
+        root = self._place_prefix(prefix)
+        if root is None:
+            return
+
+        # chunks of every level are expanded lazily (depth-first)
+        levels = [iter([root])]
+        while levels:
+            if is_stopped is not None and is_stopped():
+                return
+            chunk = next(levels[-1], None)
+            if chunk is None:
+                levels.pop()
+                continue
+            depth, cells, occupied, blocked, stabilizers = chunk
+            if depth == len(self.figures):
+                if stabilizers is not None:
+                    self.orbit_sizes = len(self._transforms) // \
+                        numpy.count_nonzero(stabilizers, axis=1)
+                yield cells
+                continue
+            levels.append(self._expand(depth, cells, occupied, blocked,
+                                       stabilizers, stats))
+
+    def _place_prefix(self, prefix):
+        """ The first chunk with one state: placed figures of the prefix
+
+        :return: tuple like (depth, cells, occupied, blocked, stabilizers)
+                 or None if figures of the prefix can not be placed
+                 (stabilizers are flags of transformations which keep
+                 placed figures, they are None without symmetry)
+        """
+        cells = numpy.zeros((1, len(self.figures)), dtype=numpy.int32)
+        occupied = numpy.zeros((1, self.cells_number), dtype=bool)
+        blocked = numpy.zeros((1, self.cells_number), dtype=bool)
+        stabilizers = None
+        if self._transforms is not None:
+            stabilizers = numpy.ones((1, len(self._transforms)), dtype=bool)
+        for depth, cell in enumerate(prefix):
+            attack_row = self.attack_matrices[depth][cell]
+            if blocked[0, cell] or (occupied[0] & attack_row).any():
+                return None
+            if self.same_as_previous[depth] and cell <= cells[0, depth - 1]:
+                return None
+            cells[0, depth] = cell
+            occupied[0, cell] = True
+            blocked[0] |= attack_row
+            if stabilizers is not None and \
+                    not self._reduce_symmetries(depth, cells, stabilizers)[0]:
+                return None
+        return len(prefix), cells, occupied, blocked, stabilizers
+
+    def _reduce_symmetries(self, depth, cells, stabilizers):
+        """ Check canonical order of figures of the type placed on the depth
+            for all states (see <BoardSymmetry.reduce_transforms>):
+            transformations which do not keep complete types are dropped
+            from stabilizers in place
+
+        :param stabilizers: boolean array like [state, transform]
+        :return: boolean array: the state is a prefix of canonical
+                 combination
+        """
+        block = cells[:, self.type_starts[depth]:depth + 1]
+        complete = self.type_ends[depth]
+        rows = numpy.arange(len(cells))
+        canonical = numpy.ones(len(cells), dtype=bool)
+        # identity keeps every state
+        for index in range(1, len(self._transforms)):
+            active = stabilizers[:, index]
+            if not active.any():
+                continue
+            image = numpy.sort(self._transforms[index][block], axis=1)
+            differs = image != block
+            first = differs.argmax(axis=1)
+            changed = differs[rows, first]
+            canonical &= ~(active & changed &
+                           (image[rows, first] < block[rows, first]))
+            if complete:
+                stabilizers[:, index] = active & ~changed
+        return canonical
+
+    def _expand(self, depth, cells, occupied, blocked, stabilizers=None,
+                stats=None):
+        """ Place the figure of this level for all states of the chunk
+
+        :return: generator of child chunks like (depth, cells, occupied,
+                 blocked, stabilizers), every chunk has at most
+                 max_frontier states
+        """
+        free = ~blocked
+        if self.same_as_previous[depth]:
+            free &= self._after_cell[cells[:, depth - 1]]
+        if depth:
+            conflicts = numpy.dot(occupied.astype(numpy.float32),
+                                  self._conflict_matrices[depth]) > 0
+            valid = free & ~conflicts
+        else:
+            conflicts = None
+            valid = free
+
+        if stats is not None:
+            depth_nodes = [0] * (depth + 1)
+            depth_nodes[depth] = int(numpy.count_nonzero(valid))
+            stats.add_search(
+                depth_nodes,
+                int(numpy.count_nonzero(free & conflicts))
+                if conflicts is not None else 0,
+                int(numpy.count_nonzero(~valid.any(axis=1)))
+            )
+
+        # states are split to groups which give at most max_frontier children
+        totals = numpy.cumsum(numpy.count_nonzero(valid, axis=1))
+        figures_left = len(self.figures) - depth - 1
+        is_last = not figures_left
+        start, done = 0, 0
+        while start < len(valid):
+            stop = int(numpy.searchsorted(totals, done + self.max_frontier,
+                                          side='right'))
+            stop = max(stop, start + 1)
+            parents, new_cells = numpy.nonzero(valid[start:stop])
+            parents += start
+            start, done = stop, int(totals[stop - 1])
+            if not len(parents):
+                continue
+
+            child_cells = cells[parents]
+            child_cells[:, depth] = new_cells
+            child_stabilizers = None
+            if stabilizers is not None:
+                # prune: states which have smaller images
+                child_stabilizers = stabilizers[parents]
+                canonical = self._reduce_symmetries(depth, child_cells,
+                                                    child_stabilizers)
+                if not canonical.all():
+                    if stats is not None:
+                        stats.dead_ends += int(len(canonical) -
+                                               numpy.count_nonzero(canonical))
+                    parents = parents[canonical]
+                    new_cells = new_cells[canonical]
+                    child_cells = child_cells[canonical]
+                    child_stabilizers = child_stabilizers[canonical]
+                    if not len(parents):
+                        continue
+            if is_last:
+                # boards of combinations are not required
+                yield depth + 1, child_cells, None, None, child_stabilizers
+                continue
+            child_occupied = occupied[parents]
+            child_occupied[numpy.arange(len(parents)), new_cells] = True
+            child_blocked = blocked[parents]
+            child_blocked |= self.attack_matrices[depth][new_cells]
+            if figures_left > 1:
+                # prune: not enough free cells for the remaining figures
+                enough = numpy.count_nonzero(~child_blocked, axis=1) >= \
+                    figures_left
+                if not enough.all():
+                    if stats is not None:
+                        stats.dead_ends += int(len(enough) -
+                                               numpy.count_nonzero(enough))
+                    child_cells = child_cells[enough]
+                    child_occupied = child_occupied[enough]
+                    child_blocked = child_blocked[enough]
+                    if child_stabilizers is not None:
+                        child_stabilizers = child_stabilizers[enough]
+                    if not len(child_cells):
+                        continue
+            yield depth + 1, child_cells, child_occupied, child_blocked, \
+                child_stabilizers
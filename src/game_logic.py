@@ -2,14 +2,31 @@
 It is using for run-mode (basic usages) and test-mode (check of the game logic)
 
 """
-import copy
-import gc
+import collections
 import concurrent.futures
 import os
+import signal
+import sys
+import time
 
-from src.exceptions import GameArgumentsValidationError
-from src.figures import King, Rook, Queen, Bishop, Knight
+from src.bitboard import BitBoard
+from src.counting import CombinationsCounter
+from src.exceptions import GameArgumentsValidationError, \
+    SearchCancelledError
+from src.frontier import FrontierSearch, numpy
+from src.figures import King, Rook, Queen, Bishop, Knight, StoredFigure
 from src.logger import get_logger, get_log_file_handler
+from src.ordering import get_placing_order
+from src.render import CombinationsRenderer, DATA_FORMATS, \
+    format_combination
+from src.results import CanonicalResultSet, CombinationKeys, ResultSet, \
+    get_combination_key, get_key_bits
+from src.search import CombinationsSearch
+from src.sharding import SHARD_SUBTREES, assign_subtrees, \
+    get_split_checksum, write_manifest
+from src.stats import ProgressReporter, SearchStats
+from src.storage import ResultsWriter
+from src.symmetry import BoardSymmetry, get_type_blocks
 
 # Sorted by the number of attacked cells
 ALIASES_FIGURES_MAP = (
@@ -20,28 +37,136 @@ ALIASES_FIGURES_MAP = (
     ('knights', Knight)   # special attacks
 )
 
+# Engine "stack" uses <CombinationsSearch>, engine "numpy" uses
+# <FrontierSearch> (requires NumPy), other engines use recursive search over
+# board's objects (see BOARD_ENGINES)
+STACK_ENGINE = 'stack'
+FRONTIER_ENGINE = 'numpy'
+DEFAULT_ENGINE = STACK_ENGINE
+
+# Figure's types are placed in order of ALIASES_FIGURES_MAP ("static") or in
+# order with the smallest estimated search tree ("adaptive", see
+# <get_placing_order>). The order does not change found combinations, but
+# figures are listed in combinations in order of placing
+STATIC_ORDERING = 'static'
+ADAPTIVE_ORDERING = 'adaptive'
+ORDERINGS = (STATIC_ORDERING, ADAPTIVE_ORDERING)
+DEFAULT_ORDERING = STATIC_ORDERING
+
+# Maximal number of cells of the board for every engine. Bitmask engines
+# keep one attack mask per cell for every figure's type (memory grows as
+# square of cells), the frontier engine keeps the same attacks as matrices of
+# bytes and floats, the list engine copies all free cells for every placement
+ENGINES_MAX_CELLS = {
+    STACK_ENGINE: 64 * 64,
+    FRONTIER_ENGINE: 32 * 32,
+    'bitboard': 64 * 64,
+    'list': 16 * 16,
+}
+
+# Number of subtrees per worker which are enough for balancing of the pool
+TASKS_PER_WORKER = 16
+# Number of games with prepared search (attack matrices of the frontier
+# engine take megabytes on large boards) kept by every worker process
+WORKER_GAMES_SIZE = 8
+
 
 class Game(object):
     """ The main class for creating possible chess combinations """
     logger = get_logger()
 
-    def __init__(self, dim_x, dim_y, figures_numbers, result_to_file=False):
+    def __init__(self, dim_x, dim_y, figures_numbers, result_to_file=False,
+                 engine=DEFAULT_ENGINE, symmetry=False, workers=None,
+                 split_depth=None, instrument=False, progress=False,
+                 cache=None, ordering=DEFAULT_ORDERING, checkpoint=None,
+                 shard=None, limit=None, timeout=None):
+        # found combinations (see <ResultSet>)
         self.serialized_boards = []
-        self._result_boards_dict = {}  # uses for tmp storing uniq boards comb.
+        # canonical combinations like (serialized_board, orbit_size) (see
+        # <CanonicalResultSet>, are filled instead of serialized_boards in
+        # symmetry mode)
+        self.canonical_boards = []
+        self.symmetry = symmetry
+        self._board_symmetry = None
         self.dimension_x = dim_x
         self.dimension_y = dim_y
         self.possible_figures = []
         self.figures_numbers = figures_numbers
+        self.engine = engine
+        self.workers = workers if workers is not None \
+            else os.cpu_count() or 1
+        self.split_depth = split_depth
+        self.ordering = ordering
+        # part of the search like (shard_index, shards_number)
+        self.shard = shard
+        # enumeration is stopped after the number of combinations or
+        # the number of seconds (see <Game._iter_limited_results>)
+        self.limit = limit
+        self.timeout = timeout
+        # the last enumeration was stopped before the end of the search
+        # (by the limit, the timeout or the interruption)
+        self.partial = False
+        self._deadline = None
+        # function which returns True when the search (or counting) is
+        # cancelled by the caller, e.g. by the client of the query server
+        self.is_cancelled = None
+        # periodically saved state of the search (see <Checkpoint>)
+        self.checkpoint = checkpoint
         self._validate_params()
+        self.board_class = BOARD_ENGINES.get(engine)
+        self._frontier_search = None
+        # counter of combinations (see <Game._get_counter>)
+        self._counter = None
+        # prefixes of subtrees of the last search
+        self._subtrees_prefixes = []
+        # checksum of all subtrees of the last split in shard mode
+        self._split_checksum = None
 
         for alias, figure_type in ALIASES_FIGURES_MAP:
             # initial list of possible figure's types.Such as: [KING, QUEEN,..]
             figures_count = figures_numbers.get(alias, 0)
             self.possible_figures.extend([figure_type] * figures_count)
+        # types of figures in order of placing
+        self.figure_classes = sorted(set(self.possible_figures),
+                                     key=self.possible_figures.index)
+        if self.ordering == ADAPTIVE_ORDERING:
+            self.figure_classes = get_placing_order(
+                dim_x, dim_y, self.figure_classes,
+                [self.possible_figures.count(figure_class)
+                 for figure_class in self.figure_classes]
+            )
+            self.possible_figures.sort(key=self.figure_classes.index)
+        self._figures_order = {
+            figure_class.__name__: order
+            for order, figure_class in enumerate(self.figure_classes)
+        }
+        # order of type for every figure in self.possible_figures
+        self._placing_orders = [self.figure_classes.index(figure_class)
+                                for figure_class in self.possible_figures]
+        # blocks of figures of the same type (see <get_type_blocks>)
+        self._type_starts, self._type_ends = get_type_blocks(
+            self.possible_figures
+        )
+        self.serialized_boards = self._create_result_set()
+        self.canonical_boards = self._create_canonical_set()
+        # counters of the search (see <SearchStats>) are collected only
+        # in instrumented mode
+        self.instrument = instrument
+        self.stats = SearchStats(self.possible_figures) if instrument \
+            else None
+        # display periodic progress line to stderr
+        self.progress = progress
+        # persistent cache of results (see <ResultsCache>): results of
+        # the shard and limited results are not complete, so they are not
+        # cached
+        self.cache = cache if shard is None and limit is None and \
+            timeout is None else None
 
+        self._file_handler = None
         if result_to_file:
             file_handler = get_log_file_handler()
             self.logger.addHandler(file_handler)
+            self._file_handler = file_handler
 
     def _validate_params(self):
         """ This method helps to check incoming params for combinations """
@@ -53,82 +178,976 @@ class Game(object):
             )
         assert isinstance(self.figures_numbers, dict)
 
+        if self.engine not in ENGINES:
+            raise GameArgumentsValidationError(
+                'Unknown engine "{}". Available engines: {}'.format(
+                    self.engine, ', '.join(ENGINES)
+                )
+            )
+        if self.engine == FRONTIER_ENGINE and numpy is None:
+            raise GameArgumentsValidationError(
+                'Engine "{}" requires NumPy package'.format(self.engine)
+            )
+
+        max_cells = ENGINES_MAX_CELLS[self.engine]
+        if dimensions > max_cells:
+            raise GameArgumentsValidationError(
+                'Board {} x {} is too large for engine "{}": at most {} '
+                'cells are supported'.format(self.dimension_x,
+                                             self.dimension_y, self.engine,
+                                             max_cells)
+            )
+
         if dimensions <= sum(self.figures_numbers.values()):
             raise GameArgumentsValidationError(
                 'Dimensions must be greater then total number of figures'
             )
 
-    def _create_combinations(self, board):
-        """ Recursive logic for calculating combinations """
+        if self.ordering not in ORDERINGS:
+            raise GameArgumentsValidationError(
+                'Unknown ordering "{}". Available orderings: {}'.format(
+                    self.ordering, ', '.join(ORDERINGS)
+                )
+            )
+
+        if self.shard is not None:
+            shard_index, shards_number = self.shard
+            if not 0 <= shard_index < shards_number:
+                raise GameArgumentsValidationError(
+                    'Shard must be like "i/N" where 0 <= i < N'
+                )
 
+        if self.limit is not None and self.limit < 1:
+            raise GameArgumentsValidationError(
+                'Limit must be greater then 0'
+            )
+        if self.timeout is not None and self.timeout <= 0:
+            raise GameArgumentsValidationError(
+                'Timeout must be greater then 0'
+            )
+        if self.shard is not None and (self.limit is not None or
+                                       self.timeout is not None):
+            raise GameArgumentsValidationError(
+                'Shard can not be limited by number of combinations or time'
+            )
+        if self.checkpoint is not None and self.limit is not None:
+            raise GameArgumentsValidationError(
+                'Checkpoint can not be used with limit of combinations'
+            )
+
+        if self.workers < 1:
+            raise GameArgumentsValidationError(
+                'Number of workers must be greater then 0'
+            )
+        if self.split_depth is not None and self.split_depth < 1:
+            raise GameArgumentsValidationError(
+                'Split depth must be greater then 0'
+            )
+
+    @property
+    def config(self):
+        """ Compact description of the game: it is sent to worker processes
+            instead of the game itself (see <Game.from_config>)
+        """
+        return (self.dimension_x, self.dimension_y,
+                tuple(sorted(self.figures_numbers.items())),
+                self.engine, self.symmetry, self.instrument, self.ordering,
+                self.limit)
+
+    @classmethod
+    def from_config(cls, config):
+        """ Create the game from compact description (see <Game.config>) """
+
+        (dim_x, dim_y, figures_numbers, engine, symmetry, instrument,
+         ordering, limit) = config
+        return cls(dim_x, dim_y, dict(figures_numbers), engine=engine,
+                   symmetry=symmetry, instrument=instrument, ordering=ordering,
+                   limit=limit)
+
+    def _create_result_set(self):
+        """ Empty container for combinations of this game """
+
+        return ResultSet(self.dimension_x, self.dimension_y,
+                         self.figure_classes, len(self.possible_figures))
+
+    def _create_canonical_set(self):
+        """ Empty container for canonical combinations of this game """
+
+        return CanonicalResultSet(self.dimension_x, self.dimension_y,
+                                  self.figure_classes,
+                                  len(self.possible_figures))
+
+    def _create_results(self):
+        """ Empty results of the subtree: <ResultSet> or
+            <CanonicalResultSet> in symmetry mode
+        """
+        if self.symmetry:
+            return self._create_canonical_set()
+        return self._create_result_set()
+
+    def _create_combinations(self, board, results=None, transforms=None):
+        """ Recursive logic for calculating combinations.
+            Identical figures are placed in increasing order of cells
+            (see <Board.candidate_cells>), so every combination is found
+            exactly once and no deduplication of results is required.
+            Boards with less free cells than remaining figures are not
+            expanded. The search is stopped as soon as the subtree has
+            the limit of combinations (see <Game.limit>) or the timeout is
+            over (see <Game._check_stopped>). In symmetry mode
+            boards which are not prefixes of canonical combinations are
+            not expanded (see <Game._reduce_symmetries>).
+
+        :param transforms: transformations which keep placed figures
+                           (symmetry mode)
+        :return: combinations found in this subtree
+                 (see <Game._create_results>)
+        """
+        if results is None:
+            results = self._create_results()
+        self._check_stopped()
+
+        stats = self.stats
+        depth = len(board.figures)
+        expanded = False
         next_figure_class = board.next_figure()
 
-        for pos_x, pos_y in board.free_cells:
+        for pos_x, pos_y in board.candidate_cells(next_figure_class):
+            if self._is_subtree_full(results):
+                break
             # step over free cells for trying to place figure on this board
-            new_figure = next_figure_class(board, pos_x, pos_y)
-            if not new_figure.can_take_position():
-                del new_figure
+            if not board.can_place_figure(next_figure_class, pos_x, pos_y):
+                if stats is not None:
+                    stats.rejected += 1
                 continue
 
-            new_board = copy.deepcopy(board)
+            expanded = True
+            if stats is not None:
+                stats.depth_nodes[depth] += 1
+            new_board = board.copy()
             new_board.place_figure(next_figure_class, pos_x, pos_y)
+            new_transforms = transforms
+            if transforms is not None:
+                new_transforms = self._reduce_symmetries(new_board,
+                                                         transforms)
+
+            figures_left = len(new_board.possible_figures)
+            if transforms is not None and new_transforms is None or \
+                    figures_left > 1 and \
+                    new_board.free_cells_number() < figures_left:
+                # prune: the board has a smaller image or free cells are
+                # not enough for the remaining figures
+                if stats is not None:
+                    stats.dead_ends += 1
+            elif figures_left:
+                self._create_combinations(new_board, results, new_transforms)
+            else:
+                self._store_board(new_board, results, new_transforms)
+
+        if not expanded and stats is not None:
+            stats.dead_ends += 1
+        return results
+
+    def _store_board(self, board, results, transforms=None):
+        """ Add board with all placed figures to results of the search
+            (in symmetry mode canonical boards are added with size of
+            their orbits)
+
+        :param transforms: transformations which keep the board
+                           (symmetry mode, see <Game._reduce_symmetries>)
+        """
+        serialized_board = board.serialize()
+        if self._board_symmetry is None:
+            results.append(serialized_board)
+            return
+        results.append((
+            serialized_board,
+            self._board_symmetry.stabilizer_orbit_size(transforms)
+        ))
+
+    def _reduce_symmetries(self, board, transforms):
+        """ Transformations which keep figures placed on the board (see
+            <BoardSymmetry.reduce_transforms>)
+
+        :return: tuple of transformations or None if placed figures are
+                 not a prefix of canonical combination
+        """
+        if len(transforms) == 1:
+            # only identity is left: the board is canonical
+            return transforms
+        cells = board.cells()
+        depth = len(cells) - 1
+        return self._board_symmetry.reduce_transforms(
+            transforms, cells[self._type_starts[depth]:],
+            self._type_ends[depth]
+        )
+
+    def _run_subtree(self, prefix):
+        """ Generate combinations which start with specified placements
+
+        :param prefix: cells numbers of the first figures
+        :return: combinations found in this subtree
+                 (see <Game._create_results>)
+        """
+        results = self._create_results()
+        if self.board_class is not None:
+            board = self.board_class(self)
+            transforms = None
+            if self._board_symmetry is not None:
+                transforms = tuple(self._board_symmetry.transforms)
+            for cell in prefix:
+                pos_x, pos_y = divmod(cell, self.dimension_y)
+                board.place_figure(board.next_figure(), pos_x, pos_y)
+                if transforms is not None:
+                    transforms = self._reduce_symmetries(board, transforms)
+                    if transforms is None:
+                        return results
+            if board.possible_figures:
+                return self._create_combinations(board, results, transforms)
+            self._store_board(board, results, transforms)
+            return results
+
+        if self.engine == FRONTIER_ENGINE:
+            return self._run_frontier_subtree(prefix, results)
+
+        search = CombinationsSearch(self.dimension_x, self.dimension_y,
+                                    self.possible_figures,
+                                    self._board_symmetry)
+        for cells in search.run(prefix, self.stats, self._get_stop_check()):
+            if self._is_subtree_full(results):
+                break
+            if self._board_symmetry is None:
+                results.append_cells(cells, self._placing_orders)
+            else:
+                results.append_cells(cells, self._placing_orders,
+                                     search.orbit_size)
+        self._check_stopped()
+        return results
+
+    def _is_subtree_full(self, results):
+        """ Results of the subtree have the limit of combinations: more
+            combinations of the subtree are not required
+        """
+        return self.limit is not None and len(results) >= self.limit
+
+    def _get_stop_check(self):
+        """ Function for engines which returns True when the search of the
+            subtree must be stopped (None if the search is not stopped)
+        """
+        if self._deadline is None and self.is_cancelled is None:
+            return None
+        return self._is_stopped
 
-            if new_board.possible_figures:
-                self._create_combinations(new_board)
+    def _is_stopped(self):
+        """ The timeout is over (single process mode) or the search is
+            cancelled by the caller
+        """
+        return (self._deadline is not None and
+                time.monotonic() >= self._deadline) or \
+            (self.is_cancelled is not None and self.is_cancelled())
+
+    def _check_stopped(self):
+        """ Stop the search of the subtree if the timeout is over or the
+            search is cancelled: the subtree is not finished, so its results
+            are dropped (see <Game._iter_limited_results>)
+        """
+        if self.is_cancelled is not None and self.is_cancelled():
+            raise SearchCancelledError('The search is cancelled')
+        if self._deadline is not None and \
+                time.monotonic() >= self._deadline:
+            raise concurrent.futures.TimeoutError()
+
+    def _run_frontier_subtree(self, prefix, results):
+        """ Generate combinations of the subtree by the frontier engine:
+            batches of cells are packed to results at once (only canonical
+            combinations in symmetry mode: other branches are cut)
+
+        :return: results with combinations of this subtree
+        """
+        if self._frontier_search is None:
+            # attack matrices are built once for all subtrees
+            self._frontier_search = FrontierSearch(
+                self.dimension_x, self.dimension_y, self.possible_figures,
+                symmetry=self._board_symmetry
+            )
+        for batch in self._frontier_search.run(prefix, self.stats,
+                                               self._get_stop_check()):
+            if self._is_subtree_full(results):
+                break
+            if self.limit is not None:
+                batch = batch[:self.limit - len(results)]
+            if self._board_symmetry is None:
+                results.append_cell_array(batch, self._placing_orders)
             else:
-                board_hash = hash(new_board)
-                self._result_boards_dict.setdefault(
-                    board_hash, new_board.serialize()
+                orbit_sizes = self._frontier_search.orbit_sizes
+                results.append_cell_array(
+                    batch, self._placing_orders, orbit_sizes[:len(batch)]
                 )
-        del board
-        gc.collect()
-        return self._result_boards_dict
+        self._check_stopped()
+        return results
 
-    def generate_combinations(self):
-        """ It runs logic to generate all combinations.
-            Founded combinations will store to self.serialized_boards.
+    def _run_measured_subtree(self, prefix):
+        """ Run logic for the subtree with separate counters of the search
+            (in instrumented mode) and timing of this process
+
+        :return: pair like (results, <SearchStats> of the subtree or None)
+        """
+        if self.stats is None:
+            return self._run_subtree(prefix), None
+
+        game_stats = self.stats
+        self.stats = SearchStats(self.possible_figures)
+        try:
+            start = time.perf_counter()
+            results = self._run_subtree(prefix)
+            self.stats.add_worker_time(os.getpid(),
+                                       time.perf_counter() - start)
+            self.stats.solutions = len(results)
+            self.stats.subtrees = 1
+            return results, self.stats
+        finally:
+            self.stats = game_stats
+
+    def iter_subtrees(self, in_pool=True):
+        """ Prefixes of subtrees of the search which are run separately
+            (e.g. by the query server, see <Game.run_subtree>): data which
+            is shared by all subtrees is built first
+
+        :param in_pool: subtrees are run in the process pool (the search is
+                        split deeper to give every worker enough subtrees)
+        :return: generator of prefixes like (cell, cell, ...)
+        """
+        self._prepare_search()
+        prefixes, _ = self._get_subtrees(in_pool)
+        for prefix in prefixes:
+            yield prefix
+
+    def run_subtree(self, prefix):
+        """ Run the search for one subtree (see <Game.iter_subtrees>):
+            results are expanded by <Game.iter_subtree_combinations>
+
+        :return: pair like (results, <SearchStats> of the subtree or None)
+        """
+        self._prepare_search()
+        return self._run_measured_subtree(prefix)
+
+    def _prepare_search(self):
+        """ Build data which is shared by all subtrees of the search """
+
+        # attack tables are built before starting of the process pool,
+        # so all workers use them without re-calculation
+        for figure_class in self.figure_classes:
+            figure_class.attack_table(self.dimension_x, self.dimension_y)
+
+        if self.symmetry and self._board_symmetry is None:
+            self._board_symmetry = BoardSymmetry(
+                self.dimension_x, self.dimension_y, self.figure_classes
+            )
+
+    def _get_subtrees(self, in_pool):
+        """ Prefixes of subtrees of the search. The search is split to the
+            specified depth or deep enough to give every worker of the pool
+            TASKS_PER_WORKER subtrees (or every shard SHARD_SUBTREES
+            subtrees, only subtrees of this shard are returned then).
+
+        :param in_pool: subtrees are run in the process pool
+        :return: list of prefixes like (cell, cell, ...)
+        """
+        search = CombinationsSearch(self.dimension_x, self.dimension_y,
+                                    self.possible_figures,
+                                    self._board_symmetry)
+        first_cells = None
+        if self._board_symmetry is not None:
+            # only canonical cells (under rotations and reflections of the
+            # board) are tried for the first figure
+            first_cells = self._board_symmetry.canonical_cells()
+
+        max_depth = max(len(self.possible_figures) - 1, 1)
+        depth = min(self.split_depth or 1, max_depth)
+        prefixes = list(search.split(depth, first_cells))
+        min_tasks = 0
+        if self.shard is not None:
+            # all shards must get the same split (whatever the workers are)
+            min_tasks = SHARD_SUBTREES * self.shard[1]
+        elif in_pool:
+            min_tasks = TASKS_PER_WORKER * self.workers
+        if self.split_depth is None:
+            while len(prefixes) < min_tasks and depth < max_depth:
+                depth += 1
+                prefixes = list(search.split(depth, first_cells))
+        if self.stats is not None:
+            # placements of figures of prefixes are counted once
+            for _ in search.split(depth, first_cells, self.stats):
+                pass
+        if self.shard is not None:
+            self._split_checksum = get_split_checksum(prefixes)
+            shard_index, shards_number = self.shard
+            assignment = assign_subtrees(
+                [search.estimate(prefix) for prefix in prefixes],
+                shards_number
+            )
+            prefixes = [prefix for prefix, shard in zip(prefixes, assignment)
+                        if shard == shard_index]
+        return prefixes, search
+
+    def _iter_subtrees_results(self, ordered=True):
+        """ Run logic for all subtrees of the search and yield their results.
+            Finished subtrees are saved to the checkpoint (if it is used),
+            subtrees which are finished in the resumed checkpoint are not
+            run again (counters of the search do not include them).
+
+        :param ordered: results are yielded in stable order of subtrees,
+                        otherwise they are yielded as soon as they are ready
+        :return: generator of pairs like (subtree_index, results)
         """
         if not self.possible_figures:
             return
-        # get next figure
-        next_figure = self.possible_figures.pop(0)
-        start_board = Board(self)
-        st_boards = []
-        for pos_x, pos_y in start_board.free_cells:
-            board = copy.deepcopy(start_board)
-            board.place_figure(next_figure, pos_x, pos_y)
-            st_boards.append(board)
-
-        if os.getenv('TEST_MODE'):
+        self._prepare_search()
+        in_pool = not os.getenv('TEST_MODE') and self.workers > 1
+        if self.stats is not None:
+            self.stats = SearchStats(self.possible_figures)
+        prefixes, search = self._get_subtrees(in_pool)
+        checkpoint = self.checkpoint
+        restored = {}
+        if checkpoint is not None:
+            prefixes, restored = checkpoint.start(self, prefixes)
+        self._subtrees_prefixes = prefixes
+        progress = ProgressReporter(len(prefixes)) if self.progress else None
+        if progress is not None and restored:
+            progress.update(len(restored))
+
+        indexes = [index for index in range(len(prefixes))
+                   if index not in restored]
+        subtrees_results = self._iter_search_subtrees(
+            prefixes, indexes, search, in_pool, ordered, progress
+        )
+        try:
+            if not ordered:
+                for result in self._iter_restored(restored):
+                    yield result
+            for index, res in subtrees_results:
+                if checkpoint is not None:
+                    checkpoint.add(index, self._get_subtree_boards(res))
+                # restored subtrees are yielded in their places
+                for result in self._iter_restored(restored, index):
+                    yield result
+                yield index, res
+            for result in self._iter_restored(restored):
+                yield result
+        except BaseException:
+            if checkpoint is not None:
+                checkpoint.save()
+            raise
+        finally:
+            # worker processes are stopped if results are not required
+            subtrees_results.close()
+        if checkpoint is not None:
+            checkpoint.clear()
+
+    def _iter_limited_results(self, ordered=True):
+        """ Results of subtrees of the search (see
+            <Game._iter_subtrees_results>) until the limit of combinations
+            is reached, the timeout is over or the search is interrupted
+            (SIGINT). Self.partial is set if the search is stopped before
+            the end: worker processes are terminated then, results of
+            finished subtrees are kept. The timeout is checked inside the
+            search of the subtree in single process mode too (results of
+            the unfinished subtree are dropped, like results of running
+            subtrees of worker processes).
+
+        :return: generator of pairs like (subtree_index, results)
+        """
+        self.partial = False
+        self._deadline = None
+        if self.timeout is not None:
+            self._deadline = time.monotonic() + self.timeout
+        combinations_left = self.limit
+        subtrees_results = self._iter_subtrees_results(ordered)
+        try:
+            for index, res in subtrees_results:
+                if combinations_left is not None:
+                    res, combinations_left = self._limit_results(
+                        res, combinations_left
+                    )
+                yield index, res
+                if combinations_left == 0 or (
+                        self._deadline is not None and
+                        time.monotonic() >= self._deadline):
+                    self.partial = True
+                    return
+        except (KeyboardInterrupt, concurrent.futures.TimeoutError):
+            self.partial = True
+        finally:
+            subtrees_results.close()
+            self._deadline = None
+
+    def _limit_results(self, results, combinations_left):
+        """ Results of the subtree which do not exceed the number of
+            combinations left. Canonical combinations are kept with their
+            whole orbits in symmetry mode.
+
+        :return: pair like (results, number of combinations left)
+        """
+        if not self.symmetry:
+            results = results[:combinations_left]
+            return results, combinations_left - len(results)
+
+        kept_number = 0
+        for orbit_size in results.orbit_sizes:
+            if combinations_left <= 0:
+                break
+            kept_number += 1
+            combinations_left -= orbit_size
+        return results[:kept_number], max(combinations_left, 0)
+
+    def _iter_restored(self, restored, before=None):
+        """ Pop results of restored subtrees in order of their indexes
+
+        :param restored: results of subtrees like {index: <ResultSet>}
+        :param before: only subtrees with smaller indexes are popped
+        :return: generator of pairs like (subtree_index, results)
+        """
+        if not restored:
+            return
+        for index in sorted(restored):
+            if before is not None and index >= before:
+                break
+            yield index, self._restore_subtree(restored.pop(index))
+
+    def _iter_search_subtrees(self, prefixes, indexes, search, in_pool,
+                              ordered, progress):
+        """ Run the search for subtrees with specified indexes
+            (see <Game._iter_subtrees_results>)
+        """
+        if not in_pool:
             # running generation in single process (for correct coverage)
-            for _board in st_boards:
-                self._create_combinations(_board)
+            for index in indexes:
+                res, subtree_stats = self._run_measured_subtree(
+                    prefixes[index]
+                )
+                self._register_subtree(subtree_stats, progress)
+                yield index, res
+            return
+
+        # using process pull for running the program in main case:
+        # biggest subtrees are started first if order is not required
+        if not ordered:
+            indexes = sorted(indexes,
+                             key=lambda i: search.estimate(prefixes[i]),
+                             reverse=True)
+        config = self.config
+        tasks = [(config, prefixes[index]) for index in indexes]
+        pool_results = iter_pool_results(run_subtree_task, tasks,
+                                         self.workers, ordered,
+                                         self._deadline)
+        for task_index, (res, subtree_stats) in pool_results:
+            self._register_subtree(subtree_stats, progress)
+            yield indexes[task_index], res
+
+    def _get_subtree_boards(self, results):
+        """ Serialized boards of results of the subtree """
+
+        if self._board_symmetry is None:
+            return results
+        # records of canonical combinations are copied without orbits
+        serialized_boards = self._create_result_set()
+        serialized_boards.extend(results)
+        return serialized_boards
+
+    def _restore_subtree(self, serialized_boards):
+        """ Results of the subtree from its serialized boards
+            (see <Game._get_subtree_boards>): sizes of orbits of canonical
+            combinations are restored from raw records, type codes of
+            records are orders of types (see <BoardSymmetry>)
+
+        :param serialized_boards: <ResultSet> loaded from the checkpoint
+        """
+        if self._board_symmetry is None:
+            return serialized_boards
+        results = self._create_canonical_set()
+        for record in serialized_boards.iter_records():
+            cells, type_codes = record[::2], record[1::2]
+            results.append_cells(cells, type_codes,
+                                 self._board_symmetry.orbit_size(
+                                     zip(type_codes, cells)
+                                 ))
+        return results
+
+    def _register_subtree(self, subtree_stats, progress):
+        """ Add counters of the finished subtree and display progress """
+
+        if subtree_stats is not None:
+            self.stats.merge(subtree_stats)
+        if progress is not None:
+            progress.update()
+
+    def generate_combinations(self):
+        """ It runs logic to generate all combinations.
+            Founded combinations will store to self.serialized_boards
+            (or to self.canonical_boards in symmetry mode).
+            Cached combinations are loaded without running of the search.
+            Only found combinations are stored if the search is stopped by
+            the limit or the timeout (see <Game._iter_limited_results>).
+
+        :return: found combinations (<ResultSet>) or canonical combinations
+                 in symmetry mode
+        """
+        if self.cache is not None:
+            cached_combinations = self.cache.get_results(self)
+            if cached_combinations is not None:
+                self._load_combinations(cached_combinations)
+                return self.canonical_boards if self.symmetry \
+                    else self.serialized_boards
+
+        subtrees_results = dict(self._iter_limited_results(ordered=False))
+        results = self._create_results()
+        # indexes are not contiguous if the search is stopped
+        for index in sorted(subtrees_results):
+            results.extend(subtrees_results.pop(index))
+
+        if self.symmetry:
+            self.serialized_boards = self._create_result_set()
+            self.canonical_boards = results
         else:
-            # using process pull for running the program in main case
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                for res in executor.map(self._create_combinations, st_boards):
-                    self._result_boards_dict.update(res)
+            self.serialized_boards = results
 
-        del start_board
-        gc.collect()
-        self.serialized_boards = self._result_boards_dict.values()
+        if self.cache is not None and not self.partial:
+            self.expand_combinations()
+            for _ in self.cache.put_results(self, self.serialized_boards):
+                pass
+        return results
 
-    def render_boards(self):
-        """ Display result of work this application. """
+    def _load_combinations(self, combinations):
+        """ Store ready combinations to self.serialized_boards (canonical
+            ones are selected in symmetry mode too)
+        """
+        self.serialized_boards = self._create_result_set()
+        self.serialized_boards.extend(combinations)
+        self.canonical_boards = self._create_canonical_set()
+        if not self.symmetry:
+            return
+
+        self._prepare_search()
+        for serialized_board in self.serialized_boards:
+            orbit_size = self._board_symmetry.orbit_size(
+                self._get_placements(serialized_board)
+            )
+            if orbit_size:
+                self.canonical_boards.append((serialized_board, orbit_size))
+
+    def iter_combinations(self, ordered=True):
+        """ Lazily generate combinations: they are yielded as soon as
+            every subtree of the search is finished (in stable order),
+            without storing of all results. Cached combinations are read
+            from the cache, otherwise they are added to the cache.
+            At most self.limit combinations are yielded.
+
+        :param ordered: keep stable order of subtrees (otherwise results of
+                        subtrees are yielded as soon as they are ready)
+        :return: generator of serialized boards
+        """
+        combinations = self._iter_search_combinations(ordered)
+        if self.cache is None:
+            return combinations
+
+        cached_combinations = self.cache.get_results(self)
+        if cached_combinations is not None:
+            return cached_combinations
+        return self.cache.put_results(self, combinations)
+
+    def _iter_search_combinations(self, ordered):
+        """ Run the search and yield combinations of every finished subtree
+            (see <Game.iter_combinations>)
+        """
+        count = 0
+        for _, res in self._iter_limited_results(ordered):
+            for serialized_board in self.iter_subtree_combinations(res):
+                if count == self.limit:
+                    # the rest of the orbit of the last canonical one
+                    break
+                count += 1
+                yield serialized_board
+
+    def iter_subtree_combinations(self, results):
+        """ Combinations of results of the subtree (canonical ones are
+            expanded in symmetry mode, see <Game.run_subtree>)
+        """
+        for result in results:
+            if self.symmetry:
+                for serialized_board in self._expand_canonical(result[0]):
+                    yield serialized_board
+            else:
+                yield result
+
+    def collect_keys(self):
+        """ Exact keys of all combinations (see <CombinationKeys>): every
+            subtree returns the set of its keys only, so worker processes
+            do not send serialized boards. Number of repeated combinations
+            is the difference between the number of combinations and the
+            number of keys.
+
+        :return: <CombinationKeys>
+        """
+        keys = CombinationKeys(get_key_bits(
+            self.serialized_boards.key_base, len(self.possible_figures)
+        ))
+        if not self.possible_figures:
+            return keys
+        self._prepare_search()
+        in_pool = not os.getenv('TEST_MODE') and self.workers > 1
+        prefixes, _ = self._get_subtrees(in_pool)
+        # keys of subtrees are merged once (see <CombinationKeys.update_all>)
+        if not in_pool:
+            keys.update_all([
+                self._get_subtree_keys(self._run_subtree(prefix))
+                for prefix in prefixes
+            ])
+            return keys
+
+        config = self.config
+        tasks = [(config, prefix) for prefix in prefixes]
+        keys.update_all([
+            subtree_keys for _, subtree_keys in iter_pool_results(
+                run_subtree_keys_task, tasks, self.workers, ordered=False
+            )
+        ])
+        return keys
+
+    def _get_subtree_keys(self, results):
+        """ Keys of all combinations of results of the subtree """
+
+        result_set = results
+        if self.symmetry:
+            result_set = self._create_result_set()
+            result_set.extend(self.iter_subtree_combinations(results))
+        return result_set.create_keys()
+
+    def count_combinations(self):
+        """ Calculate number of combinations without building of boards
+            (see <CombinationsCounter>)
+
+        :return: number of combinations
+        """
+        self._validate_counting()
+        if not self.possible_figures:
+            return 0
+        if self.shard is not None:
+            # combinations of subtrees of the shard are counted by the search
+            count = 0
+            for _, res in self._iter_subtrees_results(ordered=False):
+                if self.symmetry:
+                    count += res.combinations_count
+                else:
+                    count += len(res)
+            return count
+        if self.cache is not None:
+            count = self.cache.get_count(self)
+            if count is not None:
+                return count
+
+        counter = self._get_counter()
+        counter.is_cancelled = self.is_cancelled
+        try:
+            count = counter.count()
+        finally:
+            # memoized states are not kept by the game
+            counter.clear()
+        if self.cache is not None:
+            self.cache.put_count(self, count)
+        return count
+
+    def _validate_counting(self):
+        """ Counting and sampling of combinations do not run the search, so
+            the limit and the timeout of the search are not supported
+        """
+        if self.limit is not None or self.timeout is not None:
+            raise GameArgumentsValidationError(
+                'Limit and timeout are not supported for counting and '
+                'sampling of combinations'
+            )
+
+    def _get_counter(self):
+        """ Counter of combinations of the game: numbers of combinations of
+            subproblems are kept during counting or sampling only
+        """
+        if self._counter is None:
+            self._counter = CombinationsCounter(
+                self.dimension_x, self.dimension_y, self.figure_classes,
+                [self.possible_figures.count(figure_class)
+                 for figure_class in self.figure_classes]
+            )
+        return self._counter
+
+    def sample_combinations(self, number, seed=None):
+        """ Combinations drawn uniformly at random from all combinations
+            without running of the search: every placement is chosen by
+            numbers of combinations of subproblems (see
+            <CombinationsCounter.sample>), so memory does not depend on
+            the number of all combinations.
+
+        :param number: size of the sample (all combinations are returned
+                       in random order if there are less of them)
+        :param seed: seed of the random generator (for reproducible samples)
+        :return: <ResultSet> of serialized boards in order of drawing
+        """
+        self._validate_counting()
+        if number < 1:
+            raise GameArgumentsValidationError(
+                'Sample size must be greater then 0'
+            )
+        results = self._create_result_set()
+        if not self.possible_figures:
+            return results
+        counter = self._get_counter()
+        try:
+            for placements in counter.sample(number, seed):
+                results.append(self._serialize_placements(sorted(
+                    (self._figures_order[figure_class.__name__], cell)
+                    for figure_class, cell in placements
+                )))
+        finally:
+            counter.clear()
+        return results
+
+    @property
+    def combinations_count(self):
+        """ Total number of found combinations (including symmetric ones) """
+
+        if self.symmetry:
+            return self.canonical_boards.combinations_count
+        return len(self.serialized_boards)
+
+    def expand_combinations(self):
+        """ Restore all combinations from canonical ones (symmetry mode).
+            Combinations will store to self.serialized_boards.
+        """
+        if not self.symmetry or self.serialized_boards:
+            return
+
+        for serialized_board, _ in self.canonical_boards:
+            self.serialized_boards.extend(
+                self._expand_canonical(serialized_board)
+            )
+
+    def _expand_canonical(self, serialized_board):
+        """ All combinations which are represented by canonical one """
+
+        placements = self._get_placements(serialized_board)
+        for image in sorted(self._board_symmetry.images(placements)):
+            yield self._serialize_placements(image)
+
+    def _get_placements(self, serialized_board):
+        """ Represent serialized board as placements like ((order, cell),..)
+            (see <BoardSymmetry>)
+        """
+        return tuple(sorted(
+            (self._figures_order[figure['type']],
+             figure['pos_x'] * self.dimension_y + figure['pos_y'])
+            for figure in serialized_board
+        ))
+
+    def _serialize_placements(self, placements):
+        """ Represent placements as serialized board (like <Board.serialize>)
+        """
+        serialized_board = []
+        for order, cell in placements:
+            figure_class = self.figure_classes[order]
+            pos_x, pos_y = divmod(cell, self.dimension_y)
+            serialized_board.append(StoredFigure({
+                'type': figure_class.__name__,
+                'pos_x': pos_x,
+                'pos_y': pos_y,
+                'display_char': figure_class.display_char
+            }))
+        return serialized_board
+
+    def render_boards(self, combinations=None):
+        """ Display result of work this application.
+
+        :param combinations: iterable with serialized boards which are
+                             displayed as soon as they are received
+                             (like <Game.iter_combinations>). Number of
+                             combinations is displayed at the end in this case.
+        """
 
         self.logger.info('Result'.center(40, '-'))
+        if combinations is not None:
+            count = 0
+            for combination in combinations:
+                self._render_combination(combination)
+                count += 1
+            if count:
+                self.logger.info('Found {} combinations'.format(count))
+            else:
+                self.logger.info(
+                    'Sorry, no matches were found for your query.'
+                )
+            self._render_partial()
+            self.logger.info('-'.center(40, '-'))
+            return
+
+        self.expand_combinations()
         if self.serialized_boards:
             self.logger.info(
                 'Found {} combinations:'.format(len(self.serialized_boards))
             )
-            for combinations in self.serialized_boards:
-                self.logger.info(' | '.join(map(str, combinations)))
-                self._render_graphic_board(combinations)
-                self.logger.info('-'.center(20, '-'))
+            for combination in self.serialized_boards:
+                self._render_combination(combination)
         else:
             self.logger.info('Sorry, no matches were found for your query.')
+        self._render_partial()
         self.logger.info('-'.center(40, '-'))
 
+    def _render_partial(self):
+        """ Display the note if the search was stopped before the end
+            (see <Game.partial>)
+        """
+        if self.partial:
+            self.logger.info('The search was stopped: combinations are '
+                             'partial')
+
+    def _render_combination(self, combination):
+        """ Display one combination: list of figures and ASCI board """
+
+        self.logger.info(format_combination(combination, self.dimension_x,
+                                            self.dimension_y))
+
+    def render_bulk(self, output_format='board', threaded=False,
+                    streams=None):
+        """ Display combinations as soon as they are found through the
+            buffered renderer (see <CombinationsRenderer>). Initial data and
+            number of combinations are not displayed for data formats.
+
+        :param output_format: one of render.OUTPUT_FORMATS
+        :param threaded: write output from the background thread
+        :param streams: text streams for output (stdout and results file
+                        by default)
+        :return: number of combinations
+        """
+        if streams is None:
+            streams = [sys.stdout]
+            if self._file_handler is not None:
+                streams.append(self._file_handler.stream)
+
+        data_only = output_format in DATA_FORMATS
+        if not data_only:
+            self.logger.info('Result'.center(40, '-'))
+        renderer = CombinationsRenderer(streams, output_format,
+                                        self.dimension_x, self.dimension_y,
+                                        threaded=threaded)
+        with renderer:
+            count = renderer.write_all(self.iter_combinations())
+
+        if not data_only:
+            if count:
+                self.logger.info('Found {} combinations'.format(count))
+            else:
+                self.logger.info(
+                    'Sorry, no matches were found for your query.'
+                )
+            self._render_partial()
+            self.logger.info('-'.center(40, '-'))
+        return count
+
     def render_initial_data(self):
         """ Display data received to generate combinations """
 
@@ -142,30 +1161,228 @@ class Game(object):
                     '{:^12}:{:^5}'.format(alias.capitalize(), numbers)
                 )
 
-    def _render_graphic_board(self, combinations):
-        """ Render ASCI board with generated combination """
+    def save_combinations(self, path):
+        """ Write all combinations to the binary results file as soon as
+            they are found (see <ResultsWriter>). The manifest of the shard
+            is written next to the file in shard mode (see <write_manifest>).
 
-        cells = {(cell['pos_x'], cell['pos_y']): cell for cell in combinations}
-        res = '    '
-        for coord_x in range(self.dimension_x):
-            res += '{} '.format(coord_x+1)
-        self.logger.info(res)
-        for coord_y in range(self.dimension_y):
-            res = '{} | '.format(coord_y+1)
-            for coord_x in range(self.dimension_x):
-                if (coord_x, coord_y) in cells:
-                    res += cells[(coord_x, coord_y)]['display_char'] + ' '
-                else:
-                    res += '- '
-            self.logger.info(res)
+        :param path: path to the results file
+        :return: number of written combinations
+        """
+        figures_counts = [self.possible_figures.count(figure_class)
+                          for figure_class in self.figure_classes]
+        with ResultsWriter(path, self.dimension_x, self.dimension_y,
+                           self.figure_classes, figures_counts) as writer:
+            if self.shard is None:
+                for combination in self.iter_combinations():
+                    writer.write(combination)
+                return writer.records_number
+
+            # numbers of combinations of subtrees are written to the
+            # manifest for merging of shards (see <merge_shards>)
+            subtrees = []
+            for index, res in self._iter_subtrees_results():
+                records_number = writer.records_number
+                for combination in self.iter_subtree_combinations(res):
+                    writer.write(combination)
+                subtrees.append((self._subtrees_prefixes[index],
+                                 writer.records_number - records_number))
+        write_manifest(path, self, subtrees, self._split_checksum)
+        return writer.records_number
+
+    def render_count(self):
+        """ Display number of combinations only (without boards) """
+
+        self.logger.info('Result'.center(40, '-'))
+        self.logger.info(
+            'Found {} combinations'.format(self.count_combinations())
+        )
+        self.logger.info('-'.center(40, '-'))
+
+    def render_sample(self, number, seed=None):
+        """ Display combinations drawn at random (see
+            <Game.sample_combinations>) and number of all combinations
+        """
+        self.logger.info('Result'.center(40, '-'))
+        combinations = self.sample_combinations(number, seed)
+        for combination in combinations:
+            self._render_combination(combination)
+        self.logger.info('Sampled {} of {} combinations'.format(
+            len(combinations), self.count_combinations()
+        ))
+        self.logger.info('-'.center(40, '-'))
+
+    def render_stats(self):
+        """ Display counters of the search (in instrumented mode) """
 
-    def run(self):
+        if self.stats is None:
+            return
+        self.logger.info('Statistics'.center(40, '-'))
+        for line in self.stats.render():
+            self.logger.info(line)
+        self.logger.info('-'.center(40, '-'))
+
+    def run(self, count_only=False, stream=False, output=None,
+            output_format=None, threaded=False, sample=None, seed=None):
         """ Run generation of all possible combinations and display them to
             the screen
+
+        :param count_only: display number of combinations only
+        :param stream: display combinations as soon as they are found
+        :param output: path to the binary results file: combinations are
+                       written to this file instead of the screen
+        :param output_format: display combinations through the buffered
+                              renderer in this format (see <render_bulk>)
+        :param threaded: write buffered output from the background thread
+        :param sample: display this number of combinations drawn at random
+                       (see <Game.sample_combinations>)
+        :param seed: seed of the random generator for the sample
         """
+        if output_format:
+            if output_format not in DATA_FORMATS:
+                self.render_initial_data()
+                self.render_bulk(output_format, threaded=threaded)
+                self.render_stats()
+            else:
+                self.render_bulk(output_format, threaded=threaded)
+            return
+
         self.render_initial_data()
-        self.generate_combinations()
-        self.render_boards()
+        if count_only:
+            self.render_count()
+            return
+        if sample is not None:
+            self.render_sample(sample, seed)
+            return
+
+        if output:
+            self.logger.info('Result'.center(40, '-'))
+            self.logger.info('Saved {} combinations to {}'.format(
+                self.save_combinations(output), output
+            ))
+            self._render_partial()
+            self.logger.info('-'.center(40, '-'))
+        elif stream:
+            self.render_boards(self.iter_combinations())
+        else:
+            self.generate_combinations()
+            self.render_boards()
+        self.render_stats()
+
+
+def _ignore_interrupts():
+    """ Initializer of worker processes: SIGINT is handled by the main
+        process only (see <iter_pool_results>)
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _terminate_workers(executor):
+    """ Stop worker processes of the pool without waiting of their tasks """
+
+    terminate_workers = getattr(executor, 'terminate_workers', None)
+    if terminate_workers is not None:
+        terminate_workers()
+        return
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+
+def iter_pool_results(function, tasks, workers, ordered=True,
+                      deadline=None):
+    """ Run function for every task in the process pool (e.g. subtrees of
+        the game or jobs of the batch). Only a few tasks are submitted in
+        advance (idle workers pick up the next ones), so finished but not
+        consumed results do not pile up in memory. Worker processes ignore
+        SIGINT: they are terminated as soon as results are not required
+        anymore (the generator is closed, the main process is interrupted
+        or the deadline is over).
+
+    :param ordered: results are yielded in order of tasks
+    :param deadline: value of time.monotonic() when waiting of results
+                     is stopped with concurrent.futures.TimeoutError
+    :return: generator of pairs like (task_index, result)
+    """
+    max_pending = 2 * workers
+    pending = collections.OrderedDict()
+    tasks = iter(enumerate(tasks))
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_ignore_interrupts
+    )
+    with executor:
+        try:
+            while True:
+                for task_index, task in tasks:
+                    future = executor.submit(function, task)
+                    pending[future] = task_index
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                timeout = None
+                if deadline is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                if ordered:
+                    future = next(iter(pending))
+                else:
+                    future = next(concurrent.futures.as_completed(
+                        pending, timeout=timeout
+                    ))
+                yield pending.pop(future), future.result(timeout=timeout)
+        except BaseException:
+            _terminate_workers(executor)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Games used by this worker process like {game_config: <Game>}
+_worker_games = collections.OrderedDict()
+
+
+def get_worker_game(config):
+    """ The game of this worker process with prepared search: recently used
+        games are kept (at most WORKER_GAMES_SIZE), so memory of workers of
+        the long-running pool is bounded
+    """
+    game = _worker_games.get(config)
+    if game is not None:
+        _worker_games.move_to_end(config)
+        return game
+    game = _worker_games[config] = Game.from_config(config)
+    game._prepare_search()
+    while len(_worker_games) > WORKER_GAMES_SIZE:
+        _worker_games.popitem(last=False)
+    return game
+
+
+def run_subtree_task(task):
+    """ Entry point for worker processes of the pool
+
+    :param task: compact description like (game_config, prefix)
+    :return: results of the subtree and its counters
+             (see <Game._run_measured_subtree>)
+    """
+    config, prefix = task
+    return get_worker_game(config)._run_measured_subtree(prefix)
+
+
+def run_subtree_keys_task(task):
+    """ Entry point for worker processes which collect keys of combinations
+        (see <Game.collect_keys>)
+
+    :param task: compact description like (game_config, prefix)
+    :return: <CombinationKeys> of the subtree
+    """
+    config, prefix = task
+    game = get_worker_game(config)
+    return game._get_subtree_keys(game._run_subtree(prefix))
 
 
 class Board(object):
@@ -176,7 +1393,9 @@ class Board(object):
     def __init__(self, game):
         self.dimension_x = game.dimension_x
         self.dimension_y = game.dimension_y
-        self.possible_figures = game.possible_figures
+        self.possible_figures = list(game.possible_figures)
+        # figure's types indexed by type code (see <Board.key>)
+        self.figure_classes = game.figure_classes
         self.figures = []
         self.free_cells = []
 
@@ -186,9 +1405,57 @@ class Board(object):
 
     def __hash__(self):
         """ Used to provide uniq for board's combination"""
+        return hash(self.key())
+
+    def __eq__(self, other):
+        if not isinstance(other, Board):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def key(self):
+        """ Exact key of placed figures (see <get_combination_key>) """
+
+        cells_number = self.dimension_x * self.dimension_y
+        return get_combination_key(
+            [self.figure_classes.index(figure.__class__) * cells_number +
+             figure.pos_x * self.dimension_y + figure.pos_y
+             for figure in self.figures],
+            len(self.figure_classes) * cells_number
+        )
+
+    def free_cells_number(self):
+        """ Number of cells which are neither taken nor under attack """
+        return len(self.free_cells)
+
+    def candidate_cells(self, figure_class):
+        """ Free cells which can be tried for the next figure. Identical
+            figures are placed only after the cell of the previous copy, so
+            every multiset placement is built exactly once.
+        """
+        if self.figures and self.figures[-1].__class__ is figure_class:
+            last_figure = self.figures[-1]
+            last_cell = [last_figure.pos_x, last_figure.pos_y]
+            return [cell for cell in self.free_cells if cell > last_cell]
+        return self.free_cells
+
+    def can_place_figure(self, figure_class, pos_x, pos_y):
+        """ Detect possibility for placing figure to this board """
 
-        str_repr = ' | '.join(sorted([str(figure) for figure in self.figures]))
-        return hash(str_repr)
+        new_figure = figure_class.on_cell(self.dimension_x, self.dimension_y,
+                                          pos_x, pos_y)
+        return not new_figure.attacks_any(self.figures)
+
+    def copy(self):
+        """ Create child board state for the next placement: figures are
+            shared (see <FigureOnBoard.on_cell>) and cells are never
+            changed, so only lists are copied
+        """
+        new_board = self.__class__.__new__(self.__class__)
+        new_board.__dict__.update(self.__dict__)
+        new_board.possible_figures = list(self.possible_figures)
+        new_board.figures = list(self.figures)
+        new_board.free_cells = list(self.free_cells)
+        return new_board
 
     def decrease_free_space(self, pos_x, pos_y):
         """ Removing free cells after placing a new figure to the board """
@@ -216,13 +1483,28 @@ class Board(object):
         :param pos_x: coordinate X for figure on this board
         :param pos_y: coordinate Y for figure on this board
         """
-        figure = figure_class(board=self, pos_x=pos_x, pos_y=pos_y)
+        figure = figure_class.on_cell(self.dimension_x, self.dimension_y,
+                                      pos_x, pos_y)
         self.figures.append(figure)
         self.decrease_free_space(figure.pos_x, figure.pos_y)
         for coord_x, coord_y in figure.cells_to_attack():
             self.decrease_free_space(coord_x, coord_y)
 
+    def cells(self):
+        """ Numbers of cells of placed figures in order of placing """
+
+        return [figure.pos_x * self.dimension_y + figure.pos_y
+                for figure in self.figures]
+
     def serialize(self):
         """ Represent all important data for storing to result collection"""
 
         return [figure.serialize() for figure in self.figures]
+
+
+# Available implementations of the board (see <Game.board_class>)
+BOARD_ENGINES = {
+    'list': Board,
+    'bitboard': BitBoard,
+}
+ENGINES = (STACK_ENGINE, FRONTIER_ENGINE) + tuple(sorted(BOARD_ENGINES))
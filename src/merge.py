@@ -0,0 +1,39 @@
+"""
+This module helps to merge results of shards of one search
+(see <src.run> with --shard option):
+position arguments:
+    shards: results files of all shards (written with --output option)
+keyword arguments:
+    --output: path to the merged results file (only number of
+              combinations is displayed by default)
+
+Example:
+    python3 -m src.run 8 8 --queens 3 --kings 3 --shard 0/2 --output s0.chsr
+    python3 -m src.run 8 8 --queens 3 --kings 3 --shard 1/2 --output s1.chsr
+    python3 -m src.merge s0.chsr s1.chsr --output results.chsr
+
+"""
+import argparse
+
+from src.exceptions import ResultsFileError, ShardError
+from src.logger import get_logger
+from src.sharding import merge_shards
+
+if __name__ == '__main__':
+    logger = get_logger(__name__)
+
+    p = argparse.ArgumentParser()
+    p.add_argument('shards', nargs='+', help='Results files of shards')
+    p.add_argument('--output', default=None,
+                   help='Path to the merged results file')
+    args = p.parse_args()
+
+    try:
+        count = merge_shards(args.shards, args.output)
+    except (ResultsFileError, ShardError) as error:
+        logger.critical('{}.\nPlease, specify results files of all shards '
+                        'of the search.'.format(error))
+        exit(1)
+    logger.info('Found {} combinations'.format(count))
+    if args.output:
+        logger.info('Saved {} combinations to {}'.format(count, args.output))
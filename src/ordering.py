@@ -0,0 +1,101 @@
+"""
+This module helps to choose the order of placing of figure's types.
+Number of nodes of the search is the sum of numbers of partial combinations
+for every prefix of the placing order, so the order does not change the
+result set, but it changes the size of the search tree a lot. The number of
+partial combinations is estimated with probabilities that two figures placed
+to random cells do not attack each other (as if pairs were independent),
+and the order with the smallest estimated tree is selected.
+"""
+import itertools
+import math
+
+from src.counting import popcount
+
+
+def get_peace_probability(dim_x, dim_y, first_class, second_class):
+    """ Probability that figures of two types placed to random different
+        cells do not attack each other
+    """
+    cells_number = dim_x * dim_y
+    if cells_number < 2:
+        return 0.0
+    first_table = first_class.attack_table(dim_x, dim_y)
+    second_table = second_class.attack_table(dim_x, dim_y)
+
+    # ordered pairs of cells (first, second) where some figure is attacked;
+    # attacks of figures are symmetric (the figure on the cell A attacks the
+    # cell B if and only if it attacks A from B), so pairs where both figures
+    # attack each other are counted twice
+    attacks = 0
+    for first_mask, second_mask in zip(first_table.masks, second_table.masks):
+        attacks += popcount(first_mask) + popcount(second_mask) - \
+            popcount(first_mask & second_mask)
+    return 1.0 - attacks / (cells_number * (cells_number - 1))
+
+
+def estimate_nodes(dim_x, dim_y, order, figures_counts, probabilities):
+    """ Estimated number of nodes of the search for the placing order
+
+    :param order: figure's types in order of placing
+    :param figures_counts: numbers of figures like {figure_class: number}
+    :param probabilities: like {(first_class, second_class): probability}
+                          (see <get_peace_probability>)
+    """
+    cells_number = dim_x * dim_y
+    placed = {figure_class: 0 for figure_class in order}
+    placed_number = 0
+    total = 0.0
+    for figure_class in order:
+        for _ in range(figures_counts[figure_class]):
+            placed[figure_class] += 1
+            placed_number += 1
+            if placed_number > cells_number:
+                return total
+            # ways to put placed figures to different cells
+            nodes = math.exp(
+                math.lgamma(cells_number + 1) -
+                math.lgamma(cells_number - placed_number + 1) -
+                sum(math.lgamma(number + 1) for number in placed.values())
+            )
+            for first_class, second_class in \
+                    itertools.combinations_with_replacement(order, 2):
+                if first_class is second_class:
+                    number = placed[first_class]
+                    pairs = number * (number - 1) // 2
+                else:
+                    pairs = placed[first_class] * placed[second_class]
+                if pairs:
+                    nodes *= probabilities[first_class, second_class] ** pairs
+            total += nodes
+    return total
+
+
+def get_placing_order(dim_x, dim_y, figure_classes, figures_counts):
+    """ Order of figure's types with the smallest estimated search tree.
+        The given order is kept if orders are estimated equally.
+
+    :param figure_classes: figure's types in default order
+    :param figures_counts: numbers of figures for every type
+    :return: list of figure's types
+    """
+    figure_classes = list(figure_classes)
+    if len(figure_classes) < 2:
+        return figure_classes
+
+    counts = dict(zip(figure_classes, figures_counts))
+    probabilities = {}
+    for first_class, second_class in \
+            itertools.combinations_with_replacement(figure_classes, 2):
+        probability = get_peace_probability(dim_x, dim_y, first_class,
+                                            second_class)
+        probabilities[first_class, second_class] = probability
+        probabilities[second_class, first_class] = probability
+
+    best_order, best_nodes = figure_classes, None
+    for order in itertools.permutations(figure_classes):
+        nodes = estimate_nodes(dim_x, dim_y, order, counts, probabilities)
+        # small relative differences are treated as equal estimations
+        if best_nodes is None or nodes < best_nodes * (1 - 1e-9):
+            best_order, best_nodes = list(order), nodes
+    return best_order
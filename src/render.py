@@ -0,0 +1,180 @@
+"""
+This module provides bulk rendering of combinations.
+Text of combinations is built in memory and written to the stream by big
+chunks (optionally from a background thread), so output of millions of
+combinations does not go through the logging machinery line by line.
+
+Supported formats:
+    board - list of figures and ASCI board (like <Game.render_boards>)
+    line - one line with list of figures per combination
+    ndjson - one JSON array of figures per line
+    csv - one row per combination: type, pos_x, pos_y for every figure
+"""
+import json
+import queue
+import threading
+
+OUTPUT_FORMATS = ('board', 'line', 'ndjson', 'csv')
+# Formats which contain only data (without initial configuration and totals)
+DATA_FORMATS = ('ndjson', 'csv')
+BUFFER_SIZE = 1 << 20
+
+
+def format_board(combination, dim_x, dim_y):
+    """ Text of ASCI board with the combination """
+
+    cells = {(cell['pos_x'], cell['pos_y']): cell['display_char']
+             for cell in combination}
+    # columns and rows are aligned by width of the biggest number
+    cell_width = len(str(dim_x))
+    label_width = len(str(dim_y))
+    lines = [' ' * (label_width + 3) + ''.join(
+        str(coord_x + 1).ljust(cell_width) + ' ' for coord_x in range(dim_x)
+    )]
+    for coord_y in range(dim_y):
+        lines.append(str(coord_y + 1).rjust(label_width) + ' | ' + ''.join(
+            cells.get((coord_x, coord_y), '-').ljust(cell_width) + ' '
+            for coord_x in range(dim_x)
+        ))
+    return '\n'.join(lines)
+
+
+def format_combination(combination, dim_x, dim_y):
+    """ Text of the combination: list of figures, ASCI board and separator
+    """
+    return '\n'.join((' | '.join(map(str, combination)),
+                      format_board(combination, dim_x, dim_y),
+                      '-'.center(20, '-')))
+
+
+class CombinationsRenderer(object):
+    """ Buffered writer of combinations to text streams
+        used object's attributes:
+            streams - text streams for output (like [sys.stdout])
+            output_format - one of OUTPUT_FORMATS
+            count - number of written combinations
+    """
+
+    def __init__(self, streams, output_format, dim_x, dim_y, threaded=False,
+                 buffer_size=BUFFER_SIZE):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                'Unknown output format "{}"'.format(output_format)
+            )
+
+        self.streams = list(streams)
+        self.output_format = output_format
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._chunks = []
+        self._chunks_size = 0
+        self._header_written = False
+
+        self._queue = None
+        self._thread = None
+        self._thread_error = None
+        if threaded:
+            # only a few chunks can wait for writing: memory is bounded
+            self._queue = queue.Queue(maxsize=4)
+            self._thread = threading.Thread(target=self._write_chunks,
+                                            daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, combination):
+        """ Add the combination to the output buffer """
+
+        if self.output_format == 'board':
+            text = format_combination(combination, self.dimension_x,
+                                      self.dimension_y)
+        elif self.output_format == 'line':
+            text = ' | '.join(map(str, combination))
+        elif self.output_format == 'ndjson':
+            text = json.dumps(combination, separators=(',', ':'))
+        else:
+            if not self._header_written:
+                self._add_text(','.join(
+                    'type_{0},pos_x_{0},pos_y_{0}'.format(index + 1)
+                    for index in range(len(combination))
+                ))
+                self._header_written = True
+            text = ','.join('{},{},{}'.format(figure['type'], figure['pos_x'],
+                                               figure['pos_y'])
+                            for figure in combination)
+        self._add_text(text)
+        self.count += 1
+
+    def write_all(self, combinations):
+        """ Add all combinations from iterable to the output buffer
+
+        :return: number of written combinations
+        """
+        for combination in combinations:
+            self.write(combination)
+        return self.count
+
+    def _add_text(self, text):
+        self._chunks.append(text)
+        self._chunks_size += len(text) + 1
+        if self._chunks_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Send buffered text to the stream (or to the writer thread) """
+
+        if self._chunks:
+            data = '\n'.join(self._chunks) + '\n'
+            self._chunks = []
+            self._chunks_size = 0
+            if self._queue is None:
+                self._write_data(data)
+            else:
+                self._check_thread()
+                self._queue.put(data)
+        if self._queue is None:
+            self._flush_streams()
+
+    def close(self):
+        """ Write all buffered text and stop the writer thread """
+
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._check_thread()
+            self._flush_streams()
+
+    def _write_chunks(self):
+        """ Target of the writer thread """
+
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._thread_error is not None:
+                continue
+            try:
+                self._write_data(data)
+            except Exception as error:
+                self._thread_error = error
+
+    def _write_data(self, data):
+        for stream in self.streams:
+            stream.write(data)
+
+    def _flush_streams(self):
+        for stream in self.streams:
+            stream.flush()
+
+    def _check_thread(self):
+        """ Raise the error which was caught by the writer thread """
+
+        if self._thread_error is not None:
+            raise self._thread_error
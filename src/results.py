@@ -0,0 +1,384 @@
+"""
+This module provides compact container of combinations. Every combination
+is stored as the packed record of the binary results format (see storage):
+(cell, type_code) for every figure, where cell is pos_x * dimension_y + pos_y.
+So one figure takes 3 bytes instead of the dictionary (see <StoredFigure>),
+serialized boards are built on access only and the container is pickled
+as one block of bytes (e.g. results of subtrees sent by worker processes).
+
+Canonical combinations of the symmetry mode are kept with sizes of their
+orbits in the array of bytes (see <CanonicalResultSet>).
+
+Combinations are identified by exact keys (see <get_combination_key>), sets
+of keys (see <CombinationKeys>) find repeated combinations without keeping
+of boards.
+"""
+import array
+import bisect
+import heapq
+
+try:
+    import numpy
+except ImportError:  # NumPy is not installed (bulk appending is disabled)
+    numpy = None
+
+from src.figures import StoredFigure
+from src.storage import get_record_format
+
+# Maximal number of bits of keys which are kept in the array of integers
+ARRAY_KEY_BITS = 64
+
+
+def get_combination_key(values, base):
+    """ Exact key of the combination: figures are represented as values
+        like type_code * cells_number + cell (less than base, which is
+        types_number * cells_number), sorted values are digits of the key.
+        So the key does not depend on order of figures and different
+        combinations have different keys.
+
+    :param values: values of all figures of the combination
+    :return: non-negative integer
+    """
+    key = 0
+    for value in sorted(values):
+        key = key * base + value
+    return key
+
+
+def get_key_bits(base, figures_number):
+    """ Maximal number of bits of keys of combinations """
+    return (base ** figures_number - 1).bit_length()
+
+
+class CombinationKeys(object):
+    """ Set of keys of combinations (see <get_combination_key>). Keys which
+        fit 64 bits are kept in the sorted array (8 bytes per combination),
+        other keys are kept in the set of integers. Sets are pickled
+        compactly, so sets of keys of worker processes are merged without
+        sending of serialized boards.
+        used object's attributes:
+            key_bits - maximal number of bits of keys
+    """
+
+    def __init__(self, key_bits, keys=()):
+        self.key_bits = key_bits
+        if key_bits <= ARRAY_KEY_BITS:
+            self._keys = array.array('Q')
+        else:
+            self._keys = set()
+        self.update(keys)
+
+    def __reduce__(self):
+        return self.__class__, (self.key_bits, self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        if isinstance(self._keys, set):
+            return key in self._keys
+        index = bisect.bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index] == key
+
+    def update(self, keys):
+        """ Add keys (e.g. other <CombinationKeys>)
+
+        :return: number of added keys (repeated keys are not added)
+        """
+        return self.update_all([keys])
+
+    def update_all(self, key_sets):
+        """ Add keys of many sets at once (e.g. <CombinationKeys> of all
+            subtrees): sorted keys of all sets are merged in one pass, so
+            adding of many sets is not quadratic
+
+        :return: number of added keys (repeated keys are not added)
+        """
+        keys_number = len(self._keys)
+        if isinstance(self._keys, set):
+            for keys in key_sets:
+                self._keys.update(keys)
+            return len(self._keys) - keys_number
+
+        sorted_sets = [self._keys]
+        for keys in key_sets:
+            if not isinstance(keys, CombinationKeys) or \
+                    isinstance(keys._keys, set):
+                keys = sorted(set(keys))
+            sorted_sets.append(keys)
+        merged = array.array('Q')
+        last = None
+        for key in heapq.merge(*sorted_sets):
+            if key != last:
+                merged.append(key)
+                last = key
+        self._keys = merged
+        return len(merged) - keys_number
+
+
+class ResultSet(object):
+    """ Sequence of combinations stored in the packed array. It supports
+        len, iteration, indexing and slicing (like the list of serialized
+        boards, see <Board.serialize>).
+        used object's attributes:
+            dimension_x, dimension_y - board's dimensions
+            figure_classes - figure's types indexed by type code
+            figures_number - number of figures in every combination
+    """
+
+    def __init__(self, dim_x, dim_y, figure_classes, figures_number,
+                 data=b''):
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.figure_classes = list(figure_classes)
+        self.figures_number = figures_number
+        self._record_format = get_record_format(figures_number)
+        self._data = bytearray(data)
+        self._type_codes = {
+            figure_class.__name__: code
+            for code, figure_class in enumerate(self.figure_classes)
+        }
+        self._template = [0] * (2 * figures_number)
+
+    def __reduce__(self):
+        return self.__class__, (self.dimension_x, self.dimension_y,
+                                self.figure_classes, self.figures_number,
+                                bytes(self._data))
+
+    def __len__(self):
+        if not self._record_format.size:
+            return 0
+        return len(self._data) // self._record_format.size
+
+    def __getitem__(self, index):
+        """ Combination with specified number like <Board.serialize>
+            (or new <ResultSet> for the slice)
+        """
+        records_number = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(records_number)
+            size = self._record_format.size
+            if step == 1:
+                data = self._data[start * size:max(stop, start) * size]
+            else:
+                data = b''.join(self._data[position * size:
+                                           (position + 1) * size]
+                                for position in range(start, stop, step))
+            return self._create(data)
+
+        if index < 0:
+            index += records_number
+        if not 0 <= index < records_number:
+            raise IndexError('Combination index out of range')
+        return self._serialize(self._record_format.unpack_from(
+            self._data, index * self._record_format.size
+        ))
+
+    def __iter__(self):
+        for record in self.iter_records():
+            yield self._serialize(record)
+
+    def __eq__(self, other):
+        if isinstance(other, ResultSet):
+            return self._is_compatible(other) and self._data == other._data
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def _create(self, data=b''):
+        return self.__class__(self.dimension_x, self.dimension_y,
+                              self.figure_classes, self.figures_number, data)
+
+    def _is_compatible(self, other):
+        return (other.dimension_x, other.dimension_y,
+                other.figure_classes, other.figures_number) == \
+            (self.dimension_x, self.dimension_y, self.figure_classes,
+             self.figures_number)
+
+    def _serialize(self, record):
+        """ Represent raw record as serialized board """
+
+        serialized_board = []
+        for position in range(0, len(record), 2):
+            pos_x, pos_y = divmod(record[position], self.dimension_y)
+            figure_class = self.figure_classes[record[position + 1]]
+            serialized_board.append(StoredFigure({
+                'type': figure_class.__name__,
+                'pos_x': pos_x,
+                'pos_y': pos_y,
+                'display_char': figure_class.display_char
+            }))
+        return serialized_board
+
+    @property
+    def key_base(self):
+        """ Base of keys of combinations (see <get_combination_key>) """
+        return len(self.figure_classes) * self.dimension_x * self.dimension_y
+
+    def keys(self):
+        """ Exact keys of combinations (see <get_combination_key>)
+
+        :return: generator of integers
+        """
+        cells_number = self.dimension_x * self.dimension_y
+        base = self.key_base
+        for record in self.iter_records():
+            yield get_combination_key(
+                [record[position + 1] * cells_number + record[position]
+                 for position in range(0, len(record), 2)], base
+            )
+
+    def create_keys(self):
+        """ Set of keys of combinations (see <CombinationKeys>) """
+
+        return CombinationKeys(
+            get_key_bits(self.key_base, self.figures_number), self.keys()
+        )
+
+    def iter_records(self, batch_size=65536):
+        """ Raw records like (cell, type_code, cell, type_code, ...).
+            Records are unpacked from copies of batches, so combinations
+            can be added during the iteration.
+        """
+        size = self._record_format.size
+        for start in range(0, len(self), batch_size):
+            chunk = bytes(self._data[start * size:(start + batch_size) * size])
+            for record in self._record_format.iter_unpack(chunk):
+                yield record
+
+    def append(self, serialized_board):
+        """ Add combination like <Board.serialize> """
+
+        values = []
+        for figure in serialized_board:
+            values.append(figure['pos_x'] * self.dimension_y + figure['pos_y'])
+            values.append(self._type_codes[figure['type']])
+        self._data += self._record_format.pack(*values)
+
+    def append_cells(self, cells, type_codes):
+        """ Add combination given by cells of figures and their type codes
+            (without building of serialized board)
+        """
+        record = self._template
+        record[::2] = cells
+        record[1::2] = type_codes
+        self._data += self._record_format.pack(*record)
+
+    def append_cell_array(self, cells, type_codes):
+        """ Add combinations given by the array of cells of figures like
+            (combinations_number, figures_number) and type codes of
+            figures: all records are packed at once (requires NumPy)
+        """
+        records = numpy.empty(len(cells), dtype=numpy.dtype([
+            field
+            for position in range(self.figures_number)
+            for field in (('cell{}'.format(position), '<u2'),
+                          ('type{}'.format(position), 'u1'))
+        ]))
+        for position, type_code in enumerate(type_codes):
+            records['cell{}'.format(position)] = cells[:, position]
+            records['type{}'.format(position)] = type_code
+        self._data += records.tobytes()
+
+    def extend(self, combinations):
+        """ Add combinations (records of other <ResultSet> of the same game
+            are copied as they are)
+        """
+        if isinstance(combinations, ResultSet) and \
+                self._is_compatible(combinations):
+            self._data += combinations._data
+            return
+        for serialized_board in combinations:
+            self.append(serialized_board)
+
+
+class CanonicalResultSet(ResultSet):
+    """ Canonical combinations (symmetry mode) with sizes of their orbits:
+        items are pairs like (serialized_board, orbit_size), so the set
+        replaces the list of such pairs.
+        used object's attributes:
+            orbit_sizes - array of sizes of orbits of combinations
+    """
+
+    def __init__(self, dim_x, dim_y, figure_classes, figures_number,
+                 data=b'', orbit_sizes=b''):
+        super(CanonicalResultSet, self).__init__(
+            dim_x, dim_y, figure_classes, figures_number, data
+        )
+        # the board has at most 8 symmetries
+        self.orbit_sizes = array.array('B', orbit_sizes)
+
+    def __reduce__(self):
+        return self.__class__, (self.dimension_x, self.dimension_y,
+                                self.figure_classes, self.figures_number,
+                                bytes(self._data), self.orbit_sizes.tobytes())
+
+    def __getitem__(self, index):
+        """ Pair like (serialized_board, orbit_size) (or new
+            <CanonicalResultSet> for the slice)
+        """
+        if isinstance(index, slice):
+            result = super(CanonicalResultSet, self).__getitem__(index)
+            result.orbit_sizes = self.orbit_sizes[index]
+            return result
+        serialized_board = super(CanonicalResultSet, self).__getitem__(index)
+        return serialized_board, self.orbit_sizes[index]
+
+    def __iter__(self):
+        return zip(super(CanonicalResultSet, self).__iter__(),
+                   self.orbit_sizes)
+
+    def __eq__(self, other):
+        if isinstance(other, CanonicalResultSet):
+            return super(CanonicalResultSet, self).__eq__(other) and \
+                self.orbit_sizes == other.orbit_sizes
+        return super(CanonicalResultSet, self).__eq__(other)
+
+    __hash__ = None
+
+    @property
+    def combinations_count(self):
+        """ Number of all combinations represented by canonical ones """
+        return sum(self.orbit_sizes)
+
+    def append(self, canonical_board):
+        """ Add pair like (serialized_board, orbit_size) """
+
+        serialized_board, orbit_size = canonical_board
+        super(CanonicalResultSet, self).append(serialized_board)
+        self.orbit_sizes.append(orbit_size)
+
+    def append_cells(self, cells, type_codes, orbit_size=1):
+        """ Add canonical combination given by cells of figures and their
+            type codes (see <ResultSet.append_cells>)
+        """
+        super(CanonicalResultSet, self).append_cells(cells, type_codes)
+        self.orbit_sizes.append(orbit_size)
+
+    def append_cell_array(self, cells, type_codes, orbit_sizes=None):
+        """ Add canonical combinations given by the array of cells of
+            figures and sizes of their orbits (see
+            <ResultSet.append_cell_array>)
+        """
+        super(CanonicalResultSet, self).append_cell_array(cells, type_codes)
+        if orbit_sizes is None:
+            orbit_sizes = numpy.ones(len(cells))
+        self.orbit_sizes.frombytes(
+            numpy.asarray(orbit_sizes, dtype=numpy.uint8).tobytes()
+        )
+
+    def extend(self, canonical_boards):
+        """ Add pairs like (serialized_board, orbit_size) (records of other
+            <CanonicalResultSet> of the same game are copied as they are)
+        """
+        if isinstance(canonical_boards, CanonicalResultSet) and \
+                self._is_compatible(canonical_boards):
+            self._data += canonical_boards._data
+            self.orbit_sizes.extend(canonical_boards.orbit_sizes)
+            return
+        for canonical_board in canonical_boards:
+            self.append(canonical_board)
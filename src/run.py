@@ -10,6 +10,43 @@ keyword arguments:
     --bishops: Number of Bishops
     --knights: Number of Knights
     --file: storing all result to <project_dir>/results.log file
+    --engine: implementation of the search (stack | numpy | bitboard | list)
+    --symmetry: search only combinations which are unique under rotations
+                and reflections of the board (result is expanded back)
+    --ordering: order of placing of figure's types (static | adaptive):
+                adaptive order is selected by the estimated size of
+                the search (figures are listed in this order)
+    --count: display number of combinations only
+    --sample: display the number of combinations drawn uniformly at random
+              (without running of the whole search)
+    --seed: seed of the random generator for --sample
+    --stream: display combinations as soon as they are found
+    --format: display combinations as soon as they are found through the
+              buffered renderer (board | line | ndjson | csv)
+    --threaded: write buffered output from the background thread
+    --output: path to the binary file for storing of combinations
+    --workers: number of worker processes (number of CPUs by default)
+    --split-depth: number of figures placed before sending subtrees of
+                   the search to workers (selected automatically by default)
+    --stats: collect counters of the search and display them at the end
+    --progress: display periodic progress line (to stderr)
+    --no-cache: do not use the persistent cache of results
+    --cache-dir: directory of the cache (<project_dir>/.cache by default)
+    --cache-size: maximal size of the cache in megabytes
+    --checkpoint: periodically save finished subtrees of the search
+    --resume: continue the search from the checkpoint (finished subtrees
+              are not repeated)
+    --checkpoint-dir: directory of the checkpoint
+                      (<project_dir>/.checkpoint by default)
+    --checkpoint-interval: minimal number of seconds between checkpoints
+    --shard: run only the part i of N of the search (like "i/N", from 0);
+             with --output the manifest is written next to the results
+             file and shards are merged by src.merge
+    --limit: stop the search after the number of combinations (e.g. 1 for
+             checking that any combination exists)
+    --timeout: stop the search after the number of seconds; combinations
+               found before the limit or the timeout are displayed
+               and marked as partial (like after Ctrl+C)
 
 Example:
     python3 src.run 3 4 --kings 3 --bishops 2
@@ -21,7 +58,14 @@ $ python3 -m src.run --help
 """
 import argparse
 
-from src.game_logic import Game
+from src.cache import ResultsCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from src.checkpoint import Checkpoint, DEFAULT_CHECKPOINT_DIR, \
+    CHECKPOINT_INTERVAL
+from src.exceptions import GameArgumentsValidationError, CheckpointError
+from src.game_logic import Game, ENGINES, DEFAULT_ENGINE, ORDERINGS, \
+    DEFAULT_ORDERING
+from src.render import OUTPUT_FORMATS
+from src.sharding import parse_shard
 from src.logger import get_logger
 
 if __name__ == '__main__':
@@ -29,10 +73,8 @@ if __name__ == '__main__':
 
     p = argparse.ArgumentParser()
     p.add_argument('dimension_x', metavar='Dimension X', type=int,
-                   choices=range(1, 9),
                    help='Number of cells by X: like A,B,C,D ... N')
     p.add_argument('dimension_y', metavar='Dimension Y', type=int,
-                   choices=range(1, 9),
                    help='Number of cells by Y: like 1,2,3,4 ... M')
 
     p.add_argument('--kings', type=int, default=0, help='Number of Kings')
@@ -43,6 +85,58 @@ if __name__ == '__main__':
 
     p.add_argument('--file', default=False, action='store_true',
                    help='To write result to file')
+    p.add_argument('--engine', default=DEFAULT_ENGINE,
+                   choices=ENGINES,
+                   help='Implementation of the search of combinations')
+    p.add_argument('--symmetry', default=False, action='store_true',
+                   help='To reduce the search by symmetries of the board')
+    p.add_argument('--ordering', default=DEFAULT_ORDERING, choices=ORDERINGS,
+                   help='Order of placing of figure\'s types')
+    p.add_argument('--count', default=False, action='store_true',
+                   help='To display number of combinations only')
+    p.add_argument('--sample', type=int, default=None,
+                   help='Number of combinations drawn at random')
+    p.add_argument('--seed', type=int, default=None,
+                   help='Seed of the random generator for --sample')
+    p.add_argument('--stream', default=False, action='store_true',
+                   help='To display combinations as soon as they are found')
+    p.add_argument('--format', default=None, choices=OUTPUT_FORMATS,
+                   help='Format of buffered output of combinations')
+    p.add_argument('--threaded', default=False, action='store_true',
+                   help='To write buffered output from the background thread')
+    p.add_argument('--output', default=None,
+                   help='Path to the binary file for storing of combinations')
+    p.add_argument('--workers', type=int, default=None,
+                   help='Number of worker processes')
+    p.add_argument('--split-depth', type=int, default=None,
+                   help='Number of figures placed before splitting the '
+                        'search between workers')
+    p.add_argument('--stats', default=False, action='store_true',
+                   help='To collect and display counters of the search')
+    p.add_argument('--progress', default=False, action='store_true',
+                   help='To display progress of the search')
+    p.add_argument('--no-cache', default=False, action='store_true',
+                   help='To run the search without the cache of results')
+    p.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                   help='Directory of the cache of results')
+    p.add_argument('--cache-size', type=int,
+                   default=DEFAULT_CACHE_SIZE >> 20,
+                   help='Maximal size of the cache of results (MB)')
+    p.add_argument('--checkpoint', default=False, action='store_true',
+                   help='To save finished parts of the search periodically')
+    p.add_argument('--resume', default=False, action='store_true',
+                   help='To continue the search from the checkpoint')
+    p.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR,
+                   help='Directory of the checkpoint')
+    p.add_argument('--checkpoint-interval', type=float,
+                   default=CHECKPOINT_INTERVAL,
+                   help='Minimal number of seconds between checkpoints')
+    p.add_argument('--shard', type=parse_shard, default=None,
+                   help='Part of the search like "i/N" (from 0)')
+    p.add_argument('--limit', type=int, default=None,
+                   help='Maximal number of combinations')
+    p.add_argument('--timeout', type=float, default=None,
+                   help='Maximal number of seconds of the search')
     args = p.parse_args()
 
     total_figure_numbers = sum(
@@ -61,6 +155,13 @@ if __name__ == '__main__':
                             'arguments for needed combinations.')
             exit(1)
 
+    if (args.count or args.sample is not None) and \
+            (args.limit is not None or args.timeout is not None):
+        logger.critical('Options --limit and --timeout are not supported '
+                        'with --count and --sample.\nPlease, specify other '
+                        'arguments for needed combinations.')
+        exit(1)
+
     figures_set = {
         'kings': args.kings,
         'queens': args.queens,
@@ -68,6 +169,40 @@ if __name__ == '__main__':
         'bishops': args.bishops,
         'knights': args.knights
     }
-    game = Game(args.dimension_x, args.dimension_y, figures_set,
-                result_to_file=args.file)
-    game.run()
+    # counters of the search are collected only by running of the search
+    cache = None
+    if not args.no_cache and not args.stats:
+        cache = ResultsCache(args.cache_dir, args.cache_size << 20)
+    checkpoint = None
+    if args.checkpoint or args.resume:
+        checkpoint = Checkpoint(args.checkpoint_dir, resume=args.resume,
+                                interval=args.checkpoint_interval)
+    try:
+        game = Game(args.dimension_x, args.dimension_y, figures_set,
+                    result_to_file=args.file, engine=args.engine,
+                    symmetry=args.symmetry, workers=args.workers,
+                    split_depth=args.split_depth, instrument=args.stats,
+                    progress=args.progress, cache=cache,
+                    ordering=args.ordering, checkpoint=checkpoint,
+                    shard=args.shard, limit=args.limit,
+                    timeout=args.timeout)
+    except GameArgumentsValidationError as error:
+        logger.critical('{}.\nPlease, specify other arguments for needed '
+                        'combinations.'.format(error))
+        exit(1)
+    try:
+        game.run(count_only=args.count, stream=args.stream,
+                 output=args.output, output_format=args.format,
+                 threaded=args.threaded, sample=args.sample,
+                 seed=args.seed)
+    except GameArgumentsValidationError as error:
+        logger.critical('{}.\nPlease, specify other arguments for needed '
+                        'combinations.'.format(error))
+        exit(1)
+    except CheckpointError as error:
+        logger.critical('{}.\nPlease, run the search without --resume '
+                        'option.'.format(error))
+        exit(1)
+    except KeyboardInterrupt:
+        # interrupted while combinations are displayed
+        exit(130)
@@ -0,0 +1,316 @@
+"""
+This module provides the search core of the game logic.
+The search keeps one board state (masks of occupied and blocked cells for
+every depth of the search), places and undoes figures in place and uses an
+explicit stack instead of recursion, so it does not create board's objects
+and does not require garbage collection.
+The branch is cut as soon as free cells are not enough for the remaining
+figures (or as soon as placed figures are not a prefix of canonical
+combination in symmetry mode, see <BoardSymmetry.reduce_transforms>).
+"""
+from src.counting import popcount
+from src.symmetry import get_type_blocks
+
+# Minimal number of placed figures between checks of stopping of the search
+# (stopping is checked when the figure is unmade)
+STOP_CHECK_NODES = 1 << 12
+
+
+class CombinationsSearch(object):
+    """ Depth-first search of combinations with make/unmake of placements
+        used object's attributes:
+            figures - figure's classes in order of placing
+            attack_masks - attack masks per cell for every placed figure
+            same_as_previous - flags: figure has the same type as previous
+                               one (it is placed after the previous copy only)
+            nodes - number of placed figures during the last run
+            symmetry - symmetries of the board (<BoardSymmetry>) or None:
+                       only canonical combinations are found then
+            orbit_size - size of the orbit of the last found combination
+
+        Combinations are represented as tuples of cells numbers aligned with
+        figures (cell number is pos_x * dimension_y + pos_y).
+    """
+
+    def __init__(self, dim_x, dim_y, figures, symmetry=None):
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.figures = list(figures)
+        self.full_mask = (1 << (dim_x * dim_y)) - 1
+        self.attack_masks = [
+            figure_class.attack_table(dim_x, dim_y).masks
+            for figure_class in self.figures
+        ]
+        self.same_as_previous = [
+            index > 0 and figure_class is self.figures[index - 1]
+            for index, figure_class in enumerate(self.figures)
+        ]
+        self.nodes = 0
+        self.symmetry = symmetry
+        self.orbit_size = 1
+        # depth of the first figure of the same type and flags: the last
+        # figure of its type (for checking of canonical order by types)
+        self.type_starts, self.type_ends = get_type_blocks(self.figures)
+
+    def run(self, prefix=(), stats=None, is_stopped=None):
+        """ Generate all combinations which start with specified placements
+
+        :param prefix: cells of the first figures (already placed figures)
+        :param stats: <SearchStats> for counters of the search (the
+                      instrumented loop of the search is used in this case)
+        :param is_stopped: function which returns True when the search
+                           must be stopped (e.g. the timeout is over), it is
+                           called every STOP_CHECK_NODES placed figures
+        :return: generator of combinations like (cell, cell, ...)
+        """
+        if stats is not None:
+            return self._run_instrumented(prefix, stats, is_stopped)
+        return self._run(prefix, is_stopped)
+
+    def _place_prefix(self, prefix):
+        """ State of the search after placing of the prefix
+
+        :return: tuple like (depth, cells, occupied, blocked, stabilizers)
+                 or None if figures of the prefix can not be placed
+                 (stabilizers are transformations which keep placed
+                 figures for every depth, they are None without symmetry)
+        """
+        figures_number = len(self.figures)
+        cells = [0] * figures_number
+        occupied = [0] * (figures_number + 1)
+        blocked = [0] * (figures_number + 1)  # occupied or under attack
+        stabilizers = None
+        if self.symmetry is not None:
+            stabilizers = [None] * (figures_number + 1)
+            stabilizers[0] = tuple(self.symmetry.transforms)
+
+        depth = 0
+        for cell in prefix:
+            bit = 1 << cell
+            attack_mask = self.attack_masks[depth][cell]
+            if blocked[depth] & bit or attack_mask & occupied[depth]:
+                return None
+            if self.same_as_previous[depth] and cell <= cells[depth - 1]:
+                return None
+            cells[depth] = cell
+            occupied[depth + 1] = occupied[depth] | bit
+            blocked[depth + 1] = blocked[depth] | bit | attack_mask
+            if stabilizers is not None:
+                stabilizers[depth + 1] = self._reduce_symmetries(
+                    depth, cells, stabilizers[depth]
+                )
+                if stabilizers[depth + 1] is None:
+                    return None
+            depth += 1
+        return depth, cells, occupied, blocked, stabilizers
+
+    def _reduce_symmetries(self, depth, cells, transforms):
+        """ Transformations which keep figures placed up to the depth
+            (see <BoardSymmetry.reduce_transforms>)
+
+        :return: tuple of transformations or None if placed figures are
+                 not a prefix of canonical combination
+        """
+        if len(transforms) == 1:
+            # only identity is left: the prefix is canonical
+            return transforms
+        return self.symmetry.reduce_transforms(
+            transforms, cells[self.type_starts[depth]:depth + 1],
+            self.type_ends[depth]
+        )
+
+    def _run(self, prefix, is_stopped=None):
+        """ The main loop of the search (see <CombinationsSearch.run>) """
+
+        figures_number = len(self.figures)
+        attack_masks = self.attack_masks
+        same_as_previous = self.same_as_previous
+        full_mask = self.full_mask
+        nodes = self.nodes = 0
+
+        # state of the board for every depth of the search
+        state = self._place_prefix(prefix)
+        if state is None:
+            return
+        depth, cells, occupied, blocked, stabilizers = state
+        if depth == figures_number:
+            self._set_orbit_size(stabilizers)
+            yield tuple(cells)
+            return
+
+        start_depth = depth
+        check_at = STOP_CHECK_NODES
+        candidates = [0] * figures_number
+        candidates[depth] = self._free_cells(depth, cells, blocked)
+        while depth >= start_depth:
+            mask = candidates[depth]
+            if not mask:
+                # unmake: all cells for this figure are tried
+                depth -= 1
+                if nodes >= check_at:
+                    check_at = nodes + STOP_CHECK_NODES
+                    if is_stopped is not None and is_stopped():
+                        break
+                continue
+
+            bit = mask & -mask
+            candidates[depth] = mask ^ bit
+            cell = bit.bit_length() - 1
+            attack_mask = attack_masks[depth][cell]
+            if attack_mask & occupied[depth]:
+                continue
+
+            # make: place figure to the cell
+            nodes += 1
+            cells[depth] = cell
+            occupied[depth + 1] = occupied[depth] | bit
+            blocked[depth + 1] = blocked[depth] | bit | attack_mask
+            if stabilizers is not None:
+                transforms = stabilizers[depth]
+                if len(transforms) > 1:
+                    # prune: placed figures have a smaller image
+                    transforms = self._reduce_symmetries(depth, cells,
+                                                         transforms)
+                    if transforms is None:
+                        continue
+                stabilizers[depth + 1] = transforms
+            if depth + 1 == figures_number:
+                self.nodes = nodes
+                self._set_orbit_size(stabilizers)
+                yield tuple(cells)
+                continue
+            remaining = figures_number - depth - 1
+            if remaining > 1 and popcount(
+                    full_mask & ~blocked[depth + 1]) < remaining:
+                # prune: not enough free cells for the remaining figures
+                continue
+
+            depth += 1
+            free_mask = full_mask & ~blocked[depth]
+            if same_as_previous[depth]:
+                free_mask &= -1 << (cell + 1)
+            candidates[depth] = free_mask
+        self.nodes = nodes
+
+    def _run_instrumented(self, prefix, stats, is_stopped=None):
+        """ The main loop of the search with counters of placed figures per
+            depth, rejected placements and dead ends (see <SearchStats>).
+            Counters are added to stats when the search is finished.
+        """
+        figures_number = len(self.figures)
+        attack_masks = self.attack_masks
+        same_as_previous = self.same_as_previous
+        full_mask = self.full_mask
+        depth_nodes = [0] * figures_number
+        rejected = dead_ends = nodes = 0
+
+        state = self._place_prefix(prefix)
+        if state is None:
+            return
+        depth, cells, occupied, blocked, stabilizers = state
+        if depth == figures_number:
+            self._set_orbit_size(stabilizers)
+            yield tuple(cells)
+            return
+
+        start_depth = depth
+        check_at = STOP_CHECK_NODES
+        candidates = [0] * figures_number
+        # flags: some figure was placed on this depth for the current parent
+        expanded = [False] * figures_number
+        candidates[depth] = self._free_cells(depth, cells, blocked)
+        while depth >= start_depth:
+            mask = candidates[depth]
+            if not mask:
+                if not expanded[depth]:
+                    dead_ends += 1
+                depth -= 1
+                if nodes >= check_at:
+                    check_at = nodes + STOP_CHECK_NODES
+                    if is_stopped is not None and is_stopped():
+                        break
+                continue
+
+            bit = mask & -mask
+            candidates[depth] = mask ^ bit
+            cell = bit.bit_length() - 1
+            attack_mask = attack_masks[depth][cell]
+            if attack_mask & occupied[depth]:
+                rejected += 1
+                continue
+
+            depth_nodes[depth] += 1
+            expanded[depth] = True
+            nodes += 1
+            cells[depth] = cell
+            occupied[depth + 1] = occupied[depth] | bit
+            blocked[depth + 1] = blocked[depth] | bit | attack_mask
+            if stabilizers is not None:
+                transforms = self._reduce_symmetries(depth, cells,
+                                                     stabilizers[depth])
+                if transforms is None:
+                    dead_ends += 1
+                    continue
+                stabilizers[depth + 1] = transforms
+            if depth + 1 == figures_number:
+                self._set_orbit_size(stabilizers)
+                yield tuple(cells)
+                continue
+            remaining = figures_number - depth - 1
+            if remaining > 1 and popcount(
+                    full_mask & ~blocked[depth + 1]) < remaining:
+                dead_ends += 1
+                continue
+
+            depth += 1
+            free_mask = full_mask & ~blocked[depth]
+            if same_as_previous[depth]:
+                free_mask &= -1 << (cell + 1)
+            candidates[depth] = free_mask
+            expanded[depth] = False
+        self.nodes = sum(depth_nodes)
+        stats.add_search(depth_nodes, rejected, dead_ends)
+
+    def split(self, depth, first_cells=None, stats=None):
+        """ Prefixes of all subtrees on the specified depth of the search
+
+        :param depth: number of placed figures in every prefix (at least 1)
+        :param first_cells: cells which are allowed for the first figure
+        :param stats: <SearchStats> for counters of the search of prefixes
+        :return: generator of prefixes like (cell, cell, ...)
+        """
+        head_search = CombinationsSearch(self.dimension_x, self.dimension_y,
+                                         self.figures[:depth], self.symmetry)
+        for cell in range(self.dimension_x * self.dimension_y):
+            if first_cells is not None and cell not in first_cells:
+                continue
+            if stats is not None:
+                # the first figure is placed by the prefix of the head search
+                stats.add_search([1])
+            for prefix in head_search.run((cell,), stats):
+                yield prefix
+
+    def estimate(self, prefix):
+        """ Rough size of the subtree: number of cells which are still free
+            after placing of the prefix in power of remaining figures
+        """
+        blocked = 0
+        for depth, cell in enumerate(prefix):
+            blocked |= 1 << cell | self.attack_masks[depth][cell]
+        free_number = popcount(self.full_mask & ~blocked)
+        return free_number ** (len(self.figures) - len(prefix))
+
+    def _set_orbit_size(self, stabilizers):
+        """ Keep the orbit size of the found combination (symmetry mode) """
+
+        if stabilizers is not None:
+            self.orbit_size = self.symmetry.stabilizer_orbit_size(
+                stabilizers[-1]
+            )
+
+    def _free_cells(self, depth, cells, blocked):
+        """ Mask of cells which can be tried for the figure on this depth """
+
+        free_mask = self.full_mask & ~blocked[depth]
+        if self.same_as_previous[depth]:
+            free_mask &= -1 << (cells[depth - 1] + 1)
+        return free_mask
@@ -0,0 +1,455 @@
+"""
+This module provides local query server: the long-running process which
+keeps the process pool, attack tables, prefixes of subtrees of recent games
+and the persistent cache of results warm, and answers queries of many
+clients concurrently (asyncio). The server listens on Unix socket or on
+localhost TCP port.
+
+Protocol: JSON lines in both directions. Queries:
+    {"id": 1, "op": "count", "dims": [5, 5], "figures": {"kings": 2},
+     "symmetry": false, "engine": "stack"}
+    {"id": 2, "op": "combinations", "dims": [5, 5], "figures": {...}}
+    {"id": 2, "op": "cancel"}
+("symmetry" and "engine" are optional, "id" is any value which is unique
+among running queries of the connection). Cancelled queries are stopped in
+worker processes too: every running query holds the slot of the shared
+array of generations, the search and counting are stopped as soon as the
+generation of the slot is changed (see <Game.is_cancelled>).
+Answers:
+    {"id": 1, "count": 200} - number of combinations
+    {"id": 2, "combinations": [[figure, ...], ...]} - next part of
+        combinations (they are streamed as soon as subtrees are finished)
+    {"id": 2, "done": true, "count": 200} - all combinations are sent
+    {"id": 2, "cancelled": true} - the query is cancelled
+    {"id": 3, "error": "description of the error"}
+
+Example:
+    python3 -m src.server --socket /tmp/chess.sock
+    python3 -m src.server --port 8765 --workers 4
+
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+
+from src.batch import create_game, COUNT_MODE
+from src.cache import ResultsCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from src.exceptions import GameArgumentsValidationError
+from src.game_logic import Game, get_worker_game
+from src.logger import get_logger
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+CANCEL_OP = 'cancel'
+# Number of games with prepared subtrees kept in memory
+GAMES_CACHE_SIZE = 64
+# Maximal number of combinations in one answer
+CHUNK_SIZE = 1024
+# Number of slots of cancellation shared with worker processes (queries
+# over this number are cancelled only before their tasks are started)
+CANCEL_SLOTS = 1024
+
+# generations of slots of cancellation in worker processes (see
+# <init_worker>)
+_slot_generations = None
+
+
+def init_worker(slot_generations):
+    """ Initializer of worker processes: the array of generations of slots
+        of cancellation is shared with the server
+    """
+    global _slot_generations
+    _slot_generations = slot_generations
+
+
+def get_cancel_check(slot):
+    """ Function which returns True when the query which holds the slot of
+        cancellation is finished: the generation of the slot is changed
+        then, so tasks of the finished query are stopped even when the
+        slot is already reused by the next query
+
+    :param slot: pair like (slot_index, generation) or None
+    :return: function or None if there is no slot
+    """
+    if slot is None or _slot_generations is None:
+        return None
+    index, generation = slot
+    return lambda: _slot_generations[index] != generation
+
+
+def count_task(config, slot=None):
+    """ Count combinations of the game in the worker process
+
+    :param config: compact description of the game (see <Game.config>)
+    :param slot: slot of cancellation of the query (see <get_cancel_check>)
+    """
+    game = Game.from_config(config)
+    game.is_cancelled = get_cancel_check(slot)
+    return game.count_combinations()
+
+
+def subtree_task(task):
+    """ Run the subtree of the query in the worker process (see
+        <run_subtree_task>): the search is stopped when the query is
+        cancelled
+
+    :param task: compact description like (game_config, prefix, slot)
+    """
+    config, prefix, slot = task
+    game = get_worker_game(config)
+    game.is_cancelled = get_cancel_check(slot)
+    try:
+        return game.run_subtree(prefix)
+    finally:
+        game.is_cancelled = None
+
+
+def iter_fed(buffer):
+    """ Items of the buffer which is refilled by the caller between
+        iterations: the generator is finished by None in the buffer
+    """
+    while True:
+        item = buffer.popleft()
+        if item is None:
+            return
+        yield item
+
+
+class QueryServer(object):
+    """ Server of queries about combinations
+        used object's attributes:
+            workers - number of worker processes of the pool
+            cache - persistent cache of results (see <ResultsCache>) or None
+    """
+    logger = get_logger()
+
+    def __init__(self, workers=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self._executor = None
+        self._server = None
+        # generations of slots of cancellation shared with worker processes
+        # and free slots (slots are reused in order of releasing)
+        self._slot_generations = None
+        self._free_slots = collections.deque()
+        # prepared games like {game_config: (game, prefixes)}
+        self._games = collections.OrderedDict()
+        self._games_lock = threading.Lock()
+
+    async def start(self, socket_path=None, host=DEFAULT_HOST,
+                    port=DEFAULT_PORT):
+        """ Start the pool and listen on Unix socket (if the path is
+            specified) or on TCP port
+        """
+        # workers are started by the fork server: forked workers would
+        # inherit sockets of open connections (and threads of the server)
+        start_method = 'forkserver' \
+            if 'forkserver' in multiprocessing.get_all_start_methods() \
+            else None
+        context = multiprocessing.get_context(start_method)
+        self._slot_generations = context.RawArray('Q', CANCEL_SLOTS)
+        self._free_slots = collections.deque(range(CANCEL_SLOTS))
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=init_worker, initargs=(self._slot_generations,)
+        )
+        if socket_path is not None:
+            self._server = await asyncio.start_unix_server(
+                self.handle_connection, path=socket_path
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_connection, host=host, port=port
+            )
+        return self._server
+
+    async def close(self):
+        """ Stop listening and shut down the pool """
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        """ Read queries of the connection and run them concurrently """
+
+        queries = {}
+
+        def send(answer):
+            if writer.is_closing():
+                return
+            writer.write(json.dumps(answer, separators=(',', ':')).encode() +
+                         b'\n')
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    query = json.loads(line)
+                    if not isinstance(query, dict):
+                        raise ValueError('query must be an object')
+                except ValueError as error:
+                    send({'error': 'Incorrect query: {}'.format(error)})
+                    continue
+
+                query_id = query.get('id')
+                if query.get('op') == CANCEL_OP:
+                    task = queries.get(query_id)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                if query_id in queries:
+                    send({'id': query_id,
+                          'error': 'Query with this id is running'})
+                    continue
+                task = asyncio.ensure_future(
+                    self._answer(query, send, writer)
+                )
+                queries[query_id] = task
+                task.add_done_callback(
+                    lambda _, query_id=query_id: queries.pop(query_id, None)
+                )
+            # the client does not send queries anymore, but it waits for
+            # answers of running queries
+            if queries:
+                await asyncio.wait(list(queries.values()))
+        finally:
+            # queries of the lost connection are not required anymore
+            for task in list(queries.values()):
+                task.cancel()
+            writer.close()
+
+    def _acquire_slot(self):
+        """ Free slot of cancellation like (slot_index, generation)
+            (or None, see <get_cancel_check>)
+        """
+        if not self._free_slots:
+            return None
+        index = self._free_slots.popleft()
+        return index, self._slot_generations[index]
+
+    def _release_slot(self, slot):
+        """ Stop tasks of the finished query which are still running in
+            worker processes (the generation of the slot is changed) and
+            make the slot free
+        """
+        if slot is None:
+            return
+        index, generation = slot
+        self._slot_generations[index] = generation + 1
+        self._free_slots.append(index)
+
+    async def _answer(self, query, send, writer):
+        """ Run the query and send answers to the client """
+
+        query_id = query.get('id')
+        slot = self._acquire_slot()
+        try:
+            game = create_game(query, query.get('op'), self.cache,
+                               workers=self.workers)
+            if query['op'] == COUNT_MODE:
+                send({'id': query_id, 'count': await self.count(game, slot)})
+            else:
+                count = 0
+                parts = self.iter_combinations(game, slot)
+                try:
+                    async for combinations in parts:
+                        count += len(combinations)
+                        send({'id': query_id, 'combinations': combinations})
+                        await writer.drain()
+                finally:
+                    await parts.aclose()
+                send({'id': query_id, 'done': True, 'count': count})
+        except asyncio.CancelledError:
+            send({'id': query_id, 'cancelled': True})
+        except GameArgumentsValidationError as error:
+            send({'id': query_id, 'error': str(error)})
+        except ConnectionError:
+            # the client is disconnected, nobody waits for answers
+            pass
+        except Exception as error:
+            self.logger.exception('Query {} is failed'.format(query_id))
+            send({'id': query_id, 'error': 'Internal error: {}'.format(
+                error
+            )})
+        finally:
+            self._release_slot(slot)
+
+    async def _run_in_thread(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def count(self, game, slot=None):
+        """ Number of combinations of the game (cached counts are used)
+
+        :param slot: slot of cancellation of the query
+        """
+        if self.cache is not None:
+            count = await self._run_in_thread(self.cache.get_count, game)
+            if count is not None:
+                return count
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(self._executor, count_task,
+                                           game.config, slot)
+        if self.cache is not None:
+            await self._run_in_thread(self.cache.put_count, game, count)
+        return count
+
+    async def iter_combinations(self, game, slot=None):
+        """ Generate parts of combinations of the game: combinations of
+            every subtree are yielded as soon as it is finished (in stable
+            order). Cached combinations are read from the cache, otherwise
+            they are written to the cache as soon as they are found (see
+            <ResultsCache.put_results>), the entry is added when all of
+            them are found.
+
+        :param slot: slot of cancellation of the query
+        :return: asynchronous generator of lists of serialized boards
+        """
+        if self.cache is not None:
+            cached = await self._run_in_thread(self.cache.get_results, game)
+            if cached is not None:
+                while True:
+                    combinations = await self._run_in_thread(
+                        list, itertools.islice(cached, CHUNK_SIZE)
+                    )
+                    if not combinations:
+                        return
+                    yield combinations
+
+        game, prefixes = await self._run_in_thread(self._prepare_game, game)
+        # combinations are passed to the writer of the cache by parts
+        buffer = collections.deque()
+        cache_writer = None
+        if self.cache is not None:
+            cache_writer = self.cache.put_results(game, iter_fed(buffer))
+        writing = None
+        subtrees_results = self._iter_subtrees_results(game, prefixes, slot)
+        try:
+            async for results in subtrees_results:
+                combinations = list(game.iter_subtree_combinations(results))
+                if cache_writer is not None:
+                    buffer.extend(combinations)
+                    writing = self._write_to_cache(cache_writer,
+                                                   len(combinations))
+                    await asyncio.shield(writing)
+                for start in range(0, len(combinations), CHUNK_SIZE):
+                    yield combinations[start:start + CHUNK_SIZE]
+            if cache_writer is not None:
+                buffer.append(None)
+                writing = self._write_to_cache(cache_writer)
+                await asyncio.shield(writing)
+        finally:
+            await subtrees_results.aclose()
+            if cache_writer is not None:
+                # the written file of the unfinished query is removed (after
+                # the running writing of the cancelled query)
+                if writing is not None:
+                    await asyncio.wait([writing])
+                cache_writer.close()
+
+    def _write_to_cache(self, cache_writer, number=None):
+        """ Write the number of combinations from the buffer to the cache
+            in the thread (all combinations if the number is not specified)
+
+        :return: future of the writing
+        """
+        def write():
+            for _ in itertools.islice(cache_writer, number):
+                pass
+
+        return asyncio.get_running_loop().run_in_executor(None, write)
+
+    def _prepare_game(self, game):
+        """ The game with prepared search and prefixes of its subtrees
+            (they are kept for next queries of the same game)
+        """
+        config = game.config
+        with self._games_lock:
+            prepared = self._games.get(config)
+            if prepared is not None:
+                self._games.move_to_end(config)
+                return prepared
+
+        prefixes = list(game.iter_subtrees())
+        with self._games_lock:
+            prepared = self._games.setdefault(config, (game, prefixes))
+            self._games.move_to_end(config)
+            while len(self._games) > GAMES_CACHE_SIZE:
+                self._games.popitem(last=False)
+        return prepared
+
+    async def _iter_subtrees_results(self, game, prefixes, slot=None):
+        """ Run subtrees in the pool: only a few tasks are submitted in
+            advance, so other queries share the pool and not started
+            tasks of the cancelled query are dropped (started tasks are
+            stopped by the slot of cancellation, see <get_cancel_check>)
+        """
+        loop = asyncio.get_running_loop()
+        config = game.config
+        tasks = iter(prefixes)
+        pending = collections.deque()
+        try:
+            while True:
+                for prefix in tasks:
+                    pending.append(loop.run_in_executor(
+                        self._executor, subtree_task, (config, prefix, slot)
+                    ))
+                    if len(pending) >= 2 * self.workers:
+                        break
+                if not pending:
+                    break
+                results, _ = await pending.popleft()
+                yield results
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--socket', default=None,
+                   help='Path to Unix socket (TCP port is used otherwise)')
+    p.add_argument('--host', default=DEFAULT_HOST, help='Host of TCP port')
+    p.add_argument('--port', type=int, default=DEFAULT_PORT,
+                   help='TCP port')
+    p.add_argument('--workers', type=int, default=None,
+                   help='Number of worker processes')
+    p.add_argument('--no-cache', default=False, action='store_true',
+                   help='To answer queries without the cache of results')
+    p.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                   help='Directory of the cache of results')
+    p.add_argument('--cache-size', type=int,
+                   default=DEFAULT_CACHE_SIZE >> 20,
+                   help='Maximal size of the cache of results (MB)')
+    args = p.parse_args()
+
+    server_cache = None
+    if not args.no_cache:
+        server_cache = ResultsCache(args.cache_dir, args.cache_size << 20)
+    query_server = QueryServer(args.workers, server_cache)
+
+    async def serve():
+        server = await query_server.start(args.socket, args.host, args.port)
+        QueryServer.logger.info('Listening on {}'.format(
+            args.socket or '{}:{}'.format(args.host, args.port)
+        ))
+        try:
+            await server.serve_forever()
+        finally:
+            await query_server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,201 @@
+"""
+This module helps to split one search between several independent runs
+(shards), e.g. on different hosts. Every shard splits the search to the
+same subtrees (the split does not depend on number of workers), subtrees
+are assigned to shards by their estimated sizes (the biggest subtree goes
+to the least loaded shard), so all shards get the same assignment without
+any coordination.
+
+Every shard writes its combinations to the binary results file (see
+storage) with the manifest next to it (<results_file>.json):
+    {version, identity, shard, shards, count,
+     subtrees: [[prefix, records], ..]}
+The identity includes the checksum of prefixes of all subtrees of the split
+(see <get_split_checksum>), so shards of different splits (e.g. other split
+depth or symmetry mode) are not merged, and subtrees of merged shards must
+cover the split exactly once. Shards are merged in order of prefixes of
+subtrees, so merged results are the same (and in the same order) as results
+of a single run.
+"""
+import hashlib
+import heapq
+import json
+
+from src.exceptions import ResultsFileError, ShardError
+from src.storage import ResultsReader, ResultsWriter
+
+# Minimal number of subtrees per shard which are enough for balancing
+SHARD_SUBTREES = 64
+MANIFEST_VERSION = 2
+MANIFEST_EXTENSION = '.json'
+
+
+def parse_shard(value):
+    """ Parse shard like "i/N" (shard number i of N shards, from 0)
+
+    :return: pair like (shard_index, shards_number)
+    """
+    try:
+        shard_index, shards_number = (int(part) for part in value.split('/'))
+    except (AttributeError, ValueError):
+        raise ValueError('Shard must be like "i/N"')
+    return shard_index, shards_number
+
+
+def assign_subtrees(estimates, shards_number):
+    """ Assign subtrees to shards: the biggest subtrees are assigned first,
+        every subtree is assigned to the least loaded shard
+
+    :param estimates: estimated sizes of subtrees
+    :return: list of shard's indexes for every subtree
+    """
+    loads = [(0, shard_index) for shard_index in range(shards_number)]
+    assignment = [None] * len(estimates)
+    order = sorted(range(len(estimates)),
+                   key=lambda index: (-estimates[index], index))
+    for index in order:
+        load, shard_index = heapq.heappop(loads)
+        assignment[index] = shard_index
+        heapq.heappush(loads, (load + estimates[index], shard_index))
+    return assignment
+
+
+def get_split_checksum(prefixes):
+    """ Checksum of prefixes of all subtrees of the split (in any order) """
+
+    data = json.dumps(sorted(list(prefix) for prefix in prefixes))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_identity(game, split_checksum):
+    """ Parameters of the game and its split which define combinations of
+        shards
+
+    :param split_checksum: checksum of the split (see <get_split_checksum>)
+    """
+    figures = sorted([alias, number]
+                     for alias, number in game.figures_numbers.items()
+                     if number)
+    return [game.dimension_x, game.dimension_y, figures,
+            [figure_class.__name__ for figure_class in game.figure_classes],
+            game.symmetry, split_checksum]
+
+
+def get_type_classes(types):
+    """ Figure's types of the results file (see <ResultsReader.types>) for
+        <ResultsWriter>: only names and display chars are written, so
+        results of any figure's types are merged (not only of built-in ones)
+    """
+    return [type(name, (object,), {'display_char': display_char})
+            for name, display_char, _ in types]
+
+
+def get_manifest_path(path):
+    return path + MANIFEST_EXTENSION
+
+
+def write_manifest(path, game, subtrees, split_checksum):
+    """ Write manifest of the shard's results file
+
+    :param path: path to the results file of the shard
+    :param subtrees: list like [(prefix, records), ..] in order of records
+    :param split_checksum: checksum of the split (see <get_split_checksum>)
+    """
+    shard_index, shards_number = game.shard
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'identity': get_identity(game, split_checksum),
+        'shard': shard_index,
+        'shards': shards_number,
+        'count': sum(records for _, records in subtrees),
+        'subtrees': [[list(prefix), records] for prefix, records in subtrees],
+    }
+    with open(get_manifest_path(path), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def read_manifest(path):
+    """ Manifest of the shard's results file """
+
+    try:
+        with open(get_manifest_path(path)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        raise ShardError('Manifest of shard {} is not found or damaged'.format(
+            path
+        ))
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') != MANIFEST_VERSION:
+        raise ShardError('Manifest of shard {} is not of version {}'.format(
+            path, MANIFEST_VERSION
+        ))
+    return manifest
+
+
+def merge_shards(paths, output=None):
+    """ Check that results files of all shards of one game are given and
+        merge them to one results file
+
+    :param paths: paths to results files of shards (in any order)
+    :param output: path to the merged results file (only number of
+                   combinations is calculated if it is not specified)
+    :return: number of combinations
+    """
+    manifests = [read_manifest(path) for path in paths]
+    if not manifests:
+        raise ShardError('No shards to merge')
+    first = manifests[0]
+    shards_number = first['shards']
+    for path, manifest in zip(paths, manifests):
+        if manifest['identity'] != first['identity'] or \
+                manifest['shards'] != shards_number:
+            raise ShardError('Shard {} belongs to other game'.format(path))
+    shards = sorted(manifest['shard'] for manifest in manifests)
+    if shards != list(range(shards_number)):
+        raise ShardError('Shards {} are expected, got {}'.format(
+            ', '.join(str(shard) for shard in range(shards_number)),
+            ', '.join(str(shard) for shard in shards)
+        ))
+    prefixes = [tuple(prefix) for manifest in manifests
+                for prefix, _ in manifest['subtrees']]
+    if len(set(prefixes)) != len(prefixes):
+        raise ShardError('Subtrees of shards overlap')
+    if get_split_checksum(prefixes) != first['identity'][-1]:
+        raise ShardError('Subtrees of shards do not cover the whole search')
+
+    count = sum(manifest['count'] for manifest in manifests)
+    if output is None:
+        return count
+
+    readers = []
+    try:
+        # records of every subtree like (prefix, reader, start, records)
+        subtrees = []
+        for path, manifest in zip(paths, manifests):
+            reader = ResultsReader(path)
+            readers.append(reader)
+            if len(reader) != manifest['count']:
+                raise ResultsFileError(
+                    'Shard {} has {} combinations, {} are expected'.format(
+                        path, len(reader), manifest['count']
+                    )
+                )
+            start = 0
+            for prefix, records in manifest['subtrees']:
+                subtrees.append((prefix, reader, start, records))
+                start += records
+        subtrees.sort(key=lambda subtree: subtree[0])
+
+        reader = readers[0]
+        figures_counts = [count for _, _, count in reader.types]
+        with ResultsWriter(output, reader.dimension_x, reader.dimension_y,
+                           get_type_classes(reader.types),
+                           figures_counts) as writer:
+            for _, reader, start, records in subtrees:
+                for index in range(start, start + records):
+                    writer.write(reader[index])
+    finally:
+        for reader in readers:
+            reader.close()
+    return count
+
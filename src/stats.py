@@ -0,0 +1,162 @@
+"""
+This module provides instrumentation of the search of combinations.
+Counters are collected only by the game created with instrument=True (the
+search uses a separate instrumented loop in this case), so the usual search
+does not spend any time for them.
+"""
+import sys
+import time
+
+# Minimal number of seconds between two progress lines
+PROGRESS_INTERVAL = 1.0
+
+
+class SearchStats(object):
+    """ Counters of the search of combinations
+        used object's attributes:
+            figures - names of figure's types in order of placing
+            depth_nodes - number of placed figures (expanded nodes of the
+                          search) for every depth of the search
+            rejected - number of placements which were rejected because
+                       the figure attacks already placed figures
+            dead_ends - number of partial combinations which can not be
+                        continued by any placement
+            solutions - number of found combinations (canonical ones in
+                        symmetry mode)
+            subtrees - number of finished top-level subtrees
+            workers - timings of processes like {pid: [subtrees, seconds]}
+    """
+
+    def __init__(self, figures):
+        self.figures = [figure_class.__name__ for figure_class in figures]
+        self.depth_nodes = [0] * len(self.figures)
+        self.rejected = 0
+        self.dead_ends = 0
+        self.solutions = 0
+        self.subtrees = 0
+        self.workers = {}
+
+    @property
+    def nodes(self):
+        """ Total number of placed figures """
+        return sum(self.depth_nodes)
+
+    @property
+    def type_nodes(self):
+        """ Number of placed figures for every type like {type_name: number}
+        """
+        result = {}
+        for name, nodes in zip(self.figures, self.depth_nodes):
+            result[name] = result.get(name, 0) + nodes
+        return result
+
+    def add_search(self, depth_nodes, rejected=0, dead_ends=0):
+        """ Add counters of one run of the search
+
+        :param depth_nodes: number of placed figures for every depth
+                            (starting from the first figure)
+        """
+        for depth, nodes in enumerate(depth_nodes):
+            self.depth_nodes[depth] += nodes
+        self.rejected += rejected
+        self.dead_ends += dead_ends
+
+    def add_worker_time(self, pid, seconds):
+        """ Register one finished subtree of the process """
+
+        timing = self.workers.setdefault(pid, [0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+
+    def merge(self, other):
+        """ Add counters of other stats (like stats of the worker's task) """
+
+        self.add_search(other.depth_nodes, other.rejected, other.dead_ends)
+        self.solutions += other.solutions
+        self.subtrees += other.subtrees
+        for pid, (subtrees, seconds) in other.workers.items():
+            timing = self.workers.setdefault(pid, [0, 0.0])
+            timing[0] += subtrees
+            timing[1] += seconds
+
+    def as_dict(self):
+        """ Represent all counters as dict (for JSON output) """
+
+        return {
+            'nodes': self.nodes,
+            'rejected': self.rejected,
+            'dead_ends': self.dead_ends,
+            'solutions': self.solutions,
+            'subtrees': self.subtrees,
+            'depth_nodes': list(self.depth_nodes),
+            'type_nodes': self.type_nodes,
+            'workers': {str(pid): {'subtrees': subtrees,
+                                   'seconds': round(seconds, 4)}
+                        for pid, (subtrees, seconds) in self.workers.items()},
+        }
+
+    def render(self):
+        """ Text lines with all counters """
+
+        lines = [
+            'Nodes: {}'.format(self.nodes),
+            'Rejected placements: {}'.format(self.rejected),
+            'Dead ends: {}'.format(self.dead_ends),
+            'Solutions: {}'.format(self.solutions),
+            'Nodes per depth:',
+        ]
+        for depth, nodes in enumerate(self.depth_nodes):
+            lines.append('{:>6} {:<8}:{:>12}'.format(
+                depth + 1, self.figures[depth], nodes
+            ))
+        lines.append('Nodes per figure:')
+        for name, nodes in sorted(self.type_nodes.items()):
+            lines.append('{:>15}:{:>12}'.format(name, nodes))
+        lines.append('Workers:')
+        for pid, (subtrees, seconds) in sorted(self.workers.items()):
+            lines.append('{:>8}: {} subtrees in {:.3f}s'.format(
+                pid, subtrees, seconds
+            ))
+        return lines
+
+
+class ProgressReporter(object):
+    """ Periodic progress line: percentage of finished top-level subtrees
+        and estimated time of finishing
+    """
+
+    def __init__(self, total, stream=None, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.done = 0
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self._reported_time = self.start_time
+
+    def update(self, done=1):
+        """ Register finished subtrees and display progress if it is time """
+
+        self.done += done
+        now = time.perf_counter()
+        if self.done >= self.total or \
+                now - self._reported_time >= self.interval:
+            self._reported_time = now
+            self.stream.write(self.format(now) + '\n')
+            self.stream.flush()
+
+    def format(self, now=None):
+        """ Text of the progress line """
+
+        elapsed = (now or time.perf_counter()) - self.start_time
+        if self.total:
+            percentage = 100.0 * self.done / self.total
+        else:
+            percentage = 100.0
+        if self.done:
+            eta = '{:.1f}s'.format(
+                elapsed * (self.total - self.done) / self.done
+            )
+        else:
+            eta = 'unknown'
+        return 'Progress: {:5.1f}% ({}/{} subtrees), elapsed {:.1f}s, ' \
+               'ETA {}'.format(percentage, self.done, self.total, elapsed, eta)
@@ -0,0 +1,231 @@
+"""
+This module provides compact binary format for storing of combinations.
+
+File structure (little-endian):
+    header: magic (4 bytes), version, dimension X, dimension Y,
+            number of figures in every combination, number of types
+            and number of records
+    types: type code, display char, number of figures, length of the name
+           and the name (UTF-8) for every type
+    records: fixed-width records like (cell, type code) for every figure,
+             where cell is pos_x * dimension_y + pos_y
+
+The reader memory-maps the file and gives random access to records and
+batched iteration over them without parsing of the whole file.
+"""
+import mmap
+import struct
+
+from src.exceptions import ResultsFileError
+from src.figures import StoredFigure
+
+MAGIC = b'CHSR'
+VERSION = 2
+HEADER_FORMAT = struct.Struct('<4sHHHHHQ')
+# the name of the type follows its fixed part
+TYPE_FORMAT = struct.Struct('<BcHB')
+MAX_NAME_LENGTH = 255
+# position of records number in the header
+RECORDS_NUMBER_OFFSET = HEADER_FORMAT.size - 8
+
+
+def get_record_format(figures_number):
+    """ Format of the record like (cell, type_code) for every figure """
+    return struct.Struct('<' + 'HB' * figures_number)
+
+
+class ResultsWriter(object):
+    """ Writer of combinations to the binary results file.
+        Number of records is written to the header when the writer is closed.
+    """
+
+    def __init__(self, path, dim_x, dim_y, figure_classes, figures_counts):
+        self.path = path
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.records_number = 0
+        self._type_codes = {
+            figure_class.__name__: code
+            for code, figure_class in enumerate(figure_classes)
+        }
+        figures_number = sum(figures_counts)
+        self._record_format = get_record_format(figures_number)
+
+        names = [figure_class.__name__.encode()
+                 for figure_class in figure_classes]
+        for name in names:
+            if len(name) > MAX_NAME_LENGTH:
+                raise ResultsFileError(
+                    'Name of figure\'s type {} is longer than {} '
+                    'bytes'.format(name.decode(), MAX_NAME_LENGTH)
+                )
+
+        self._file = open(path, 'wb')
+        self._file.write(HEADER_FORMAT.pack(
+            MAGIC, VERSION, dim_x, dim_y, figures_number,
+            len(figure_classes), 0
+        ))
+        for code, figure_class in enumerate(figure_classes):
+            self._file.write(TYPE_FORMAT.pack(
+                code, figure_class.display_char.encode(),
+                figures_counts[code], len(names[code])
+            ))
+            self._file.write(names[code])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, serialized_board):
+        """ Write combination (like <Board.serialize>) to the file """
+
+        values = []
+        for figure in serialized_board:
+            values.append(figure['pos_x'] * self.dimension_y + figure['pos_y'])
+            values.append(self._type_codes[figure['type']])
+        self._file.write(self._record_format.pack(*values))
+        self.records_number += 1
+
+    def close(self):
+        """ Write number of records to the header and close the file """
+
+        if self._file.closed:
+            return
+        self._file.seek(RECORDS_NUMBER_OFFSET)
+        self._file.write(struct.pack('<Q', self.records_number))
+        self._file.close()
+
+
+class ResultsReader(object):
+    """ Reader of the binary results file based on memory mapping
+        used object's attributes:
+            dimension_x, dimension_y - board's dimensions
+            figures_number - number of figures in every combination
+            types - list of types like (name, display_char, figures_count)
+                    indexed by type code
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except ValueError:  # empty file can not be mapped
+            self._file.close()
+            raise ResultsFileError('Results file {} is empty'.format(path))
+
+        try:
+            (magic, version, self.dimension_x, self.dimension_y,
+             self.figures_number, types_number, self._records_number) = \
+                HEADER_FORMAT.unpack_from(self._mmap)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ResultsFileError(
+                'File {} is not a results file of version {}'.format(
+                    path, VERSION
+                )
+            )
+
+        self.types = []
+        offset = HEADER_FORMAT.size
+        for _ in range(types_number):
+            try:
+                _, display_char, figures_count, name_length = \
+                    TYPE_FORMAT.unpack_from(self._mmap, offset)
+            except struct.error:
+                self.close()
+                raise ResultsFileError(
+                    'Results file {} is truncated'.format(path)
+                )
+            offset += TYPE_FORMAT.size
+            name = self._mmap[offset:offset + name_length]
+            self.types.append((name.decode(), display_char.decode(),
+                               figures_count))
+            offset += name_length
+
+        self._records_offset = offset
+        self._record_format = get_record_format(self.figures_number)
+        expected_size = offset + \
+            self._records_number * self._record_format.size
+        if len(self._mmap) < expected_size:
+            self.close()
+            raise ResultsFileError('Results file {} is truncated'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._records_number
+
+    def __getitem__(self, index):
+        """ Combination with specified number like <Board.serialize> """
+        return self._serialize(self.record(index))
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            for record in batch:
+                yield self._serialize(record)
+
+    def record(self, index):
+        """ Raw record like (cell, type_code, cell, type_code, ...) """
+
+        if index < 0:
+            index += self._records_number
+        if not 0 <= index < self._records_number:
+            raise IndexError('Record index out of range')
+        return self._record_format.unpack_from(
+            self._mmap, self._records_offset + index * self._record_format.size
+        )
+
+    def read_records(self, start, stop):
+        """ Packed records with numbers from start to stop as they are
+            stored in the file (like data of <ResultSet>)
+
+        :return: bytes
+        """
+        if not 0 <= start <= stop <= self._records_number:
+            raise IndexError('Record index out of range')
+        record_size = self._record_format.size
+        return self._mmap[self._records_offset + start * record_size:
+                          self._records_offset + stop * record_size]
+
+    def iter_batches(self, batch_size=65536):
+        """ Iterate over raw records by batches
+
+        :return: generator of lists of raw records (see <ResultsReader.record>)
+        """
+        record_size = self._record_format.size
+        for start in range(0, self._records_number, batch_size):
+            stop = min(start + batch_size, self._records_number)
+            chunk = self._mmap[self._records_offset + start * record_size:
+                               self._records_offset + stop * record_size]
+            yield list(self._record_format.iter_unpack(chunk))
+
+    def _serialize(self, record):
+        """ Represent raw record as serialized board """
+
+        serialized_board = []
+        for position in range(0, len(record), 2):
+            pos_x, pos_y = divmod(record[position], self.dimension_y)
+            name, display_char, _ = self.types[record[position + 1]]
+            serialized_board.append(StoredFigure({
+                'type': name,
+                'pos_x': pos_x,
+                'pos_y': pos_y,
+                'display_char': display_char
+            }))
+        return serialized_board
+
+    def close(self):
+        """ Close memory mapping and the file """
+
+        if not self._mmap.closed:
+            self._mmap.close()
+        self._file.close()
@@ -0,0 +1,151 @@
+"""
+This module provides symmetries of the board (rotations and reflections).
+Square boards have 8 symmetries and rectangular boards have 4. Only those
+symmetries which keep attacks of all used figures are taken into account,
+so new figure's types with asymmetric attacks are still handled correctly.
+
+Combinations are represented as placements: sorted tuples like
+((figure_order, cell), ...), where figure_order is the position of figure's
+type in the placement order and cell is pos_x * dimension_y + pos_y.
+The search places figures in this order, so every branch is cut as soon as
+placed figures can be mapped to a smaller prefix (see
+<BoardSymmetry.reduce_transforms>): only canonical combinations are built.
+"""
+
+
+
+def get_type_blocks(figures):
+    """ Blocks of figures of the same type in order of placing (for checking
+        of canonical order by types, see <BoardSymmetry.reduce_transforms>)
+
+    :param figures: figure's classes in order of placing
+    :return: pair like (type_starts, type_ends), where type_starts are
+             depths of the first figures of the same type and type_ends
+             are flags: the figure is the last one of its type
+    """
+    type_starts = []
+    for index, figure_class in enumerate(figures):
+        if index and figures[index - 1] is figure_class:
+            type_starts.append(type_starts[index - 1])
+        else:
+            type_starts.append(index)
+    type_ends = [index + 1 == len(figures) or
+                 figures[index + 1] is not figure_class
+                 for index, figure_class in enumerate(figures)]
+    return type_starts, type_ends
+
+
+class BoardSymmetry(object):
+    """ Group of board's transformations used for reducing of the search
+        used object's attributes:
+            dimension_x, dimension_y - board's dimensions
+            transforms - list of cell permutations like (new_cell, ...)
+                         indexed by cell's number (identity is the first one)
+    """
+
+    def __init__(self, dim_x, dim_y, figure_classes):
+        self.dimension_x, self.dimension_y = dim_x, dim_y
+        self.transforms = []
+        for transform in self._board_transforms():
+            if transform in self.transforms:
+                continue
+            if all(self._keeps_attacks(transform, figure_class)
+                   for figure_class in figure_classes):
+                self.transforms.append(transform)
+
+    def _board_transforms(self):
+        """ All rotations and reflections of the board as cell permutations
+        """
+        dim_x, dim_y = self.dimension_x, self.dimension_y
+        swaps = (False, True) if dim_x == dim_y else (False,)
+        for swap in swaps:
+            for flip_x in (False, True):
+                for flip_y in (False, True):
+                    transform = []
+                    for pos_x in range(dim_x):
+                        for pos_y in range(dim_y):
+                            new_x = dim_x - 1 - pos_x if flip_x else pos_x
+                            new_y = dim_y - 1 - pos_y if flip_y else pos_y
+                            if swap:
+                                new_x, new_y = new_y, new_x
+                            transform.append(new_x * dim_y + new_y)
+                    yield tuple(transform)
+
+    def _keeps_attacks(self, transform, figure_class):
+        """ Detect that transformation maps attacks of the figure's type to
+            attacks of the same figure's type
+        """
+        table = figure_class.attack_table(self.dimension_x, self.dimension_y)
+        for cell, attack_cells in enumerate(table.cells):
+            new_mask = 0
+            for coord_x, coord_y in attack_cells:
+                new_mask |= 1 << transform[table.index(coord_x, coord_y)]
+            if new_mask != table.masks[transform[cell]]:
+                return False
+        return True
+
+    def canonical_cells(self):
+        """ Cells which are the smallest in their orbits. Only these cells
+            must be tried for the first placed figure.
+
+        :return: set of cells numbers
+        """
+        return {cell for cell in range(self.dimension_x * self.dimension_y)
+                if all(cell <= transform[cell]
+                       for transform in self.transforms)}
+
+    def reduce_transforms(self, transforms, block, complete):
+        """ Check canonical order of figures of the current type. Figures of
+            previous types are mapped onto themselves by transforms (other
+            transforms give greater combinations whatever the next figures
+            are), so the combination is not canonical if sorted images of
+            cells of the current type are smaller than these cells.
+
+        :param transforms: transformations which keep previous types
+        :param block: sorted cells of placed figures of the current type
+        :param complete: all figures of the current type are placed
+        :return: transformations which keep placed figures (all of them if
+                 the type is not complete) or None if the combination is
+                 not canonical
+        """
+        kept = []
+        for transform in transforms:
+            image = sorted([transform[cell] for cell in block])
+            if image < block:
+                return None
+            if not complete or image == block:
+                kept.append(transform)
+        return tuple(kept)
+
+    def stabilizer_orbit_size(self, stabilizer):
+        """ Size of the orbit of the combination by the number of
+            transformations which map the combination onto itself
+        """
+        return len(self.transforms) // len(stabilizer)
+
+    def images(self, placements):
+        """ Distinct images of the combination (including itself)
+
+        :return: set of placements
+        """
+        return {
+            tuple(sorted((order, transform[cell])
+                         for order, cell in placements))
+            for transform in self.transforms
+        }
+
+    def orbit_size(self, placements):
+        """ Number of combinations which are represented by this one
+
+        :return: size of the orbit or 0 if combination is not canonical
+        """
+        placements = tuple(sorted(placements))
+        images = {placements}
+        for transform in self.transforms[1:]:
+            image = tuple(sorted((order, transform[cell])
+                                 for order, cell in placements))
+            if image < placements:
+                # stop as soon as the smaller image is found
+                return 0
+            images.add(image)
+        return len(images)
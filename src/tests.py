@@ -1,13 +1,42 @@
+import asyncio
+import csv
 import io
+import json
 import logging
 import os
+import pickle
 import sys
+import tempfile
+import threading
+import time
 import unittest
 from contextlib import contextmanager
+from unittest import mock
 
-from src.exceptions import GameArgumentsValidationError
-from src.figures import Queen, King, Rook
-from src.game_logic import Board, Game
+from src.exceptions import GameArgumentsValidationError, ResultsFileError, \
+    CheckpointError, SearchCancelledError, ShardError
+from src.batch import iter_batch_results, read_jobs
+from src.benchmark import compare_with_baseline, run_case
+from src.bitboard import BitBoard
+from src.cache import ResultsCache
+from src.checkpoint import Checkpoint
+from src.counting import MEMO_SIZE
+from src.figures import ATTACK_TABLES_SIZE, FigureOnBoard, Queen, King, \
+    Rook, Knight, Bishop, StoredFigure, pin_attack_tables
+from src.frontier import FrontierSearch, numpy
+from src.game_logic import WORKER_GAMES_SIZE, Board, Game, \
+    get_worker_game, run_subtree_task
+from src.ordering import get_peace_probability, get_placing_order
+from src.render import CombinationsRenderer, format_board
+from src.results import CanonicalResultSet, CombinationKeys, ResultSet, \
+    get_combination_key
+from src.search import CombinationsSearch
+from src.server import QueryServer, count_task, init_worker, subtree_task
+from src.sharding import assign_subtrees, get_split_checksum, \
+    merge_shards, parse_shard
+from src.stats import ProgressReporter
+from src.storage import ResultsReader, ResultsWriter
+from src.symmetry import BoardSymmetry, get_type_blocks
 
 
 class GameInitialTestCase(unittest.TestCase):
@@ -38,6 +67,13 @@ class GameInitialTestCase(unittest.TestCase):
         with self.assertRaises(GameArgumentsValidationError):
             Game(0, 0, {})
 
+    def test_fail_for_too_large_boards(self):
+        Game(32, 32, {'queens': 1})
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(65, 64, {'queens': 1})
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(20, 20, {'queens': 1}, engine='list')
+
 
 class FigureAttackTestCase(unittest.TestCase):
     """ Checking logic of detecting attack cells for various figures """
@@ -121,6 +157,68 @@ class FigureAttackTestCase(unittest.TestCase):
         self.assertSetEqual(cells_to_attack, test_cells_attack)
         assert not cells_to_attack.issubset(test_cells_not_attack)
 
+    def test_attack_tables(self):
+        table = Knight.attack_table(4, 4)
+        self.assertIs(table, Knight.attack_table(4, 4))
+        self.assertIsNot(table, Knight.attack_table(4, 3))
+        self.assertSetEqual(set(table.cells[table.index(0, 0)]),
+                            {(1, 2), (2, 1)})
+        self.assertEqual(table.masks[table.index(0, 0)],
+                         1 << table.index(1, 2) | 1 << table.index(2, 1))
+
+    def test_pinned_attack_tables(self):
+        pin_attack_tables([King, Rook], 2, 9)
+        pinned = Rook.attack_table(2, 9)
+        errors = []
+
+        def build_tables(dims):
+            try:
+                for dim in dims:
+                    Knight.attack_table(dim, 5)
+            except Exception as error:
+                errors.append(error)
+
+        # tables are built and dropped by several threads at once
+        threads = [threading.Thread(target=build_tables,
+                                    args=(range(start, 200, 4),))
+                   for start in range(3, 7)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # the pinned table is not dropped by the limit of cached tables
+        self.assertIs(Rook.attack_table(2, 9), pinned)
+
+    def test_shared_figures(self):
+        figure = Queen.on_cell(4, 4, 2, 1)
+        self.assertIs(figure, Queen.on_cell(4, 4, 2, 1))
+        self.assertEqual((figure.pos_x, figure.pos_y), (2, 1))
+        self.assertFalse(hasattr(figure, '__dict__'))
+        self.assertEqual(figure.cells_to_attack(),
+                         Queen(self.board, 2, 1).cells_to_attack())
+
+        board = Board(Game(4, 4, {}))
+        board.place_figure(Queen, 2, 1)
+        child = board.copy()
+        child.place_figure(King, 0, 3)
+        self.assertIs(child.figures[0], figure)
+        self.assertEqual(len(board.figures), 1)
+        self.assertFalse(child.can_place_figure(Rook, 0, 0))
+        self.assertTrue(child.can_place_figure(Knight, 3, 0))
+
+    def test_attack_tables_for_new_figures(self):
+        class Pawn(FigureOnBoard):
+            display_char = 'P'
+
+            def _get_cells_to_attack(self):
+                return [(self.pos_x - 1, self.pos_y + 1),
+                        (self.pos_x + 1, self.pos_y + 1)]
+
+        figure = Pawn(self.board, 3, 1)
+        self.assertEqual(figure.cells_to_attack(), ((2, 2),))
+        self.assertTrue(figure.can_take_position())
+
 
 class FillBoardTestCase(unittest.TestCase):
     """ Checking base game logic (for main usages) """
@@ -265,6 +363,1122 @@ class FillBoardTestCase(unittest.TestCase):
         self.assertIn(combination_3, game.serialized_boards)
         self.assertIn(combination_4, game.serialized_boards)
 
+    def test_identical_figures_placed_once(self):
+        for engine in ('list', 'bitboard'):
+            game = Game(3, 3, {'kings': 1, 'rooks': 2}, engine=engine)
+            game.generate_combinations()
+            self.assertEqual(len(game.serialized_boards), 4)
+            uniq_boards = {frozenset(map(str, board))
+                           for board in game.serialized_boards}
+            self.assertEqual(len(uniq_boards), 4)
+            for board in game.serialized_boards:
+                rooks = [(f['pos_x'], f['pos_y']) for f in board
+                         if f['type'] == 'Rook']
+                self.assertEqual(rooks, sorted(rooks))
+
+    def test_iter_combinations(self):
+        for symmetry in (False, True):
+            game = Game(4, 4, {'kings': 1, 'knights': 1, 'bishops': 1},
+                        engine='bitboard', symmetry=symmetry)
+            combinations = game.iter_combinations()
+            self.assertIsInstance(next(combinations), list)
+
+            game.generate_combinations()
+            game.expand_combinations()
+            self.assertCountEqual(list(game.iter_combinations()),
+                                  game.serialized_boards)
+
+
+class BitBoardEngineTestCase(unittest.TestCase):
+    """ Checking that bitboard engine gives the same results as list one """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    @staticmethod
+    def _get_combinations(engine, dim_x, dim_y, figures_numbers):
+        game = Game(dim_x, dim_y, figures_numbers, engine=engine)
+        game.generate_combinations()
+        return sorted(sorted(map(str, board))
+                      for board in game.serialized_boards)
+
+    def test_free_cells(self):
+        board = BitBoard(Game(3, 4, {}))
+        self.assertEqual(board.free_cells, Board(Game(3, 4, {})).free_cells)
+
+        board.place_figure(King, 0, 1)
+        self.assertEqual(board.free_cells, [[0, 3], [1, 3], [2, 0], [2, 1],
+                                            [2, 2], [2, 3]])
+        self.assertEqual(board.free_mask, board.full_mask &
+                         ~(board.occupied | board.attacked))
+        self.assertEqual(list(board.candidate_cells(King)),
+                         [(0, 3), (1, 3), (2, 0), (2, 1), (2, 2), (2, 3)])
+        self.assertFalse(board.can_place_figure(Rook, 0, 3))
+        self.assertTrue(board.can_place_figure(Knight, 0, 3))
+
+    def test_same_combinations(self):
+        configurations = [
+            (3, 3, {'kings': 1, 'rooks': 2}),
+            (3, 2, {'kings': 1, 'rooks': 1}),
+            (3, 3, {'kings': 1}),
+            (4, 4, {'rooks': 2, 'knights': 2}),
+            (4, 3, {'kings': 1, 'queens': 1, 'bishops': 1, 'knights': 1}),
+        ]
+        for dim_x, dim_y, figures_numbers in configurations:
+            expected = self._get_combinations('list', dim_x, dim_y,
+                                              figures_numbers)
+            for engine in ('bitboard', 'stack'):
+                self.assertEqual(
+                    self._get_combinations(engine, dim_x, dim_y,
+                                           figures_numbers),
+                    expected
+                )
+
+    def test_fail_for_unknown_engine(self):
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, engine='unknown')
+
+
+class CombinationsSearchTestCase(unittest.TestCase):
+    """ Checking search core with explicit stack """
+
+    def test_search(self):
+        search = CombinationsSearch(3, 3, [Rook, Rook, King])
+        combinations = list(search.run())
+        self.assertEqual(len(combinations), 4)
+        # identical figures are placed in increasing order of cells
+        for first_rook, second_rook, _ in combinations:
+            self.assertLess(first_rook, second_rook)
+
+    def test_search_with_prefix(self):
+        search = CombinationsSearch(3, 3, [Rook, Rook, King])
+        combinations = list(search.run())
+        self.assertEqual(list(search.run(prefix=(1,))),
+                         [c for c in combinations if c[0] == 1])
+        self.assertEqual(list(search.run(prefix=(1, 3, 8))), [(1, 3, 8)])
+        # the second rook is under attack
+        self.assertEqual(list(search.run(prefix=(1, 2))), [])
+
+    def test_prune_without_free_cells(self):
+        search = CombinationsSearch(4, 4, [Queen] * 4)
+        self.assertEqual(len(list(search.run())), 2)
+        # every placed queen is counted, branches without enough free cells
+        # for the remaining queens are not expanded (86 nodes without it)
+        self.assertEqual(search.nodes, 78)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class FrontierSearchTestCase(unittest.TestCase):
+    """ Checking the level-synchronous engine based on NumPy """
+
+    def test_same_combinations_as_stack_search(self):
+        configurations = [
+            (3, 3, [Rook, Rook, King]),
+            (4, 4, [Queen, Bishop, Rook, King, Knight]),
+            (6, 6, [Queen] * 6),
+            (5, 4, [Bishop, Bishop, King, Knight, Knight]),
+        ]
+        for dim_x, dim_y, figures in configurations:
+            expected = list(CombinationsSearch(dim_x, dim_y, figures).run())
+            for max_frontier in (1, 7, 1 << 15):
+                search = FrontierSearch(dim_x, dim_y, figures,
+                                        max_frontier=max_frontier)
+                combinations = [tuple(cells) for batch in search.run()
+                                for cells in batch.tolist()]
+                self.assertEqual(combinations, expected)
+
+    def test_prefix(self):
+        figures = [Rook, Rook, King]
+        search = FrontierSearch(3, 3, figures)
+        stack_search = CombinationsSearch(3, 3, figures)
+        for prefix in ((1,), (1, 5), (5, 1), (0, 1)):
+            combinations = [tuple(cells) for batch in search.run(prefix)
+                            for cells in batch.tolist()]
+            self.assertEqual(combinations, list(stack_search.run(prefix)))
+
+    def test_engine_of_game(self):
+        figures_numbers = {'kings': 2, 'queens': 1, 'knights': 1}
+        game = Game(5, 5, figures_numbers, engine='numpy', instrument=True)
+        game.generate_combinations()
+        stack_game = Game(5, 5, figures_numbers, instrument=True)
+        stack_game.generate_combinations()
+        self.assertEqual(game.serialized_boards, stack_game.serialized_boards)
+        stats, stack_stats = game.stats.as_dict(), stack_game.stats.as_dict()
+        del stats['workers'], stack_stats['workers']
+        self.assertEqual(stats, stack_stats)
+
+        game = Game(5, 5, figures_numbers, engine='numpy', symmetry=True)
+        game.generate_combinations()
+        self.assertEqual(game.combinations_count,
+                         len(stack_game.serialized_boards))
+
+    def test_numpy_is_required(self):
+        with mock.patch('src.game_logic.numpy', None):
+            with self.assertRaises(GameArgumentsValidationError):
+                Game(3, 3, {'kings': 1}, engine='numpy')
+
+
+class PlacingOrderTestCase(unittest.TestCase):
+    """ Checking selection of the order of placing of figure's types """
+
+    def test_peace_probability(self):
+        # only diagonal pairs of cells are safe for rooks
+        self.assertAlmostEqual(get_peace_probability(2, 2, Rook, Rook), 1 / 3)
+        self.assertAlmostEqual(get_peace_probability(2, 2, King, Rook), 0)
+        self.assertAlmostEqual(get_peace_probability(3, 3, Bishop, Rook),
+                               get_peace_probability(3, 3, Rook, Bishop))
+
+    def test_placing_order(self):
+        self.assertEqual(get_placing_order(6, 6, [Bishop, Rook], [3, 3]),
+                         [Rook, Bishop])
+        self.assertEqual(get_placing_order(6, 6, [Queen, King], [2, 2]),
+                         [Queen, King])
+        self.assertEqual(get_placing_order(6, 6, [Knight], [3]), [Knight])
+
+    def test_adaptive_ordering(self):
+        figures_numbers = {'bishops': 3, 'rooks': 2, 'kings': 1}
+        static_game = Game(5, 5, figures_numbers)
+        game = Game(5, 5, figures_numbers, ordering='adaptive')
+        self.assertEqual(game.figure_classes, [Rook, Bishop, King])
+        self.assertEqual(game.possible_figures,
+                         [Rook] * 2 + [Bishop] * 3 + [King])
+
+        def as_sets(serialized_boards):
+            return sorted(
+                sorted((f['type'], f['pos_x'], f['pos_y']) for f in board)
+                for board in serialized_boards
+            )
+
+        static_game.generate_combinations()
+        for engine in ('stack', 'bitboard'):
+            game = Game(5, 5, figures_numbers, engine=engine,
+                        ordering='adaptive')
+            game.generate_combinations()
+            self.assertEqual(as_sets(game.serialized_boards),
+                             as_sets(static_game.serialized_boards))
+        self.assertEqual(game.count_combinations(),
+                         len(static_game.serialized_boards))
+
+    def test_fail_for_unknown_ordering(self):
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, ordering='random')
+
+
+class WorkSplittingTestCase(unittest.TestCase):
+    """ Checking splitting of the search between workers of the pool """
+
+    def test_split_depth(self):
+        game = Game(4, 4, {'rooks': 2, 'knights': 2}, split_depth=2)
+        prefixes = list(game.iter_subtrees())
+        self.assertTrue(all(len(prefix) == 2 for prefix in prefixes))
+
+        game = Game(4, 4, {'rooks': 2, 'knights': 2}, workers=4)
+        self.assertGreater(len(list(game.iter_subtrees())), 16)
+        self.assertEqual(len(list(game.iter_subtrees(in_pool=False))), 16)
+
+    def test_run_subtree_task(self):
+        game = Game(3, 3, {'kings': 1, 'rooks': 2})
+        self.assertEqual(run_subtree_task((game.config, (1, 3))),
+                         game.run_subtree((1, 3)))
+
+    def test_process_pool(self):
+        figures_numbers = {'kings': 1, 'rooks': 1, 'knights': 2}
+        with mock.patch.dict(os.environ, {'TEST_MODE': '1'}):
+            game = Game(4, 4, figures_numbers)
+            game.generate_combinations()
+        with mock.patch.dict(os.environ, {'TEST_MODE': ''}):
+            for symmetry in (False, True):
+                pool_game = Game(4, 4, figures_numbers, workers=2,
+                                 symmetry=symmetry)
+                pool_game.generate_combinations()
+                pool_game.expand_combinations()
+                self.assertCountEqual(pool_game.serialized_boards,
+                                      game.serialized_boards)
+            self.assertEqual(list(pool_game.iter_combinations()),
+                             list(pool_game.iter_combinations()))
+
+    def test_fail_for_invalid_workers(self):
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, workers=0)
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, split_depth=0)
+
+
+class LimitedSearchTestCase(unittest.TestCase):
+    """ Checking the search stopped by the limit, the timeout or SIGINT """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+        cls.expected = list(Game(5, 5, {'queens': 5}).iter_combinations())
+
+    def test_limit(self):
+        for engine in ('stack', 'bitboard', 'list'):
+            for symmetry in (False, True):
+                game = Game(5, 5, {'queens': 5}, engine=engine,
+                            symmetry=symmetry, limit=3)
+                combinations = list(game.iter_combinations())
+                self.assertEqual(len(combinations), 3)
+                self.assertTrue(game.partial)
+                for combination in combinations:
+                    self.assertIn(combination, self.expected)
+
+                game.generate_combinations()
+                self.assertGreaterEqual(game.combinations_count, 3)
+                self.assertTrue(game.partial)
+
+        game = Game(5, 5, {'queens': 5}, limit=100)
+        self.assertEqual(list(game.iter_combinations()), self.expected)
+        self.assertFalse(game.partial)
+
+    def test_timeout(self):
+        game = Game(5, 5, {'queens': 5}, timeout=1e-9)
+        combinations = list(game.iter_combinations())
+        self.assertTrue(game.partial)
+        self.assertLess(len(combinations), len(self.expected))
+
+        game = Game(5, 5, {'queens': 5}, timeout=60)
+        self.assertEqual(list(game.iter_combinations()), self.expected)
+        self.assertFalse(game.partial)
+
+    def test_timeout_inside_subtree(self):
+        engines = ['stack', 'bitboard', 'list']
+        if numpy is not None:
+            engines.append('numpy')
+        for engine in engines:
+            # the first subtree alone takes much longer than the timeout
+            game = Game(12, 12, {'queens': 12}, engine=engine,
+                        split_depth=1, timeout=0.2)
+            start = time.monotonic()
+            list(game.iter_combinations())
+            self.assertTrue(game.partial)
+            self.assertLess(time.monotonic() - start, 5)
+
+    def test_interruption(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        cache = ResultsCache(tmp_dir.name)
+        game = Game(5, 5, {'queens': 5}, cache=cache)
+        run_subtree = game._run_subtree
+        subtrees = []
+
+        def interrupted_subtree(prefix):
+            if len(subtrees) == 2:
+                raise KeyboardInterrupt
+            subtrees.append(prefix)
+            return run_subtree(prefix)
+
+        with mock.patch.object(game, '_run_subtree', interrupted_subtree):
+            combinations = list(game.iter_combinations())
+        self.assertTrue(game.partial)
+        self.assertEqual(combinations,
+                         self.expected[:len(combinations)])
+        # partial combinations are not cached
+        self.assertIsNone(cache.get_results(game))
+
+    def test_process_pool(self):
+        with mock.patch.dict(os.environ, {'TEST_MODE': ''}):
+            game = Game(10, 10, {'queens': 10}, workers=2, limit=1)
+            self.assertEqual(len(game.generate_combinations()), 1)
+            self.assertTrue(game.partial)
+
+            game = Game(12, 12, {'queens': 12}, workers=2, timeout=0.2)
+            start = time.monotonic()
+            list(game.iter_combinations())
+            self.assertTrue(game.partial)
+            self.assertLess(time.monotonic() - start, 5)
+
+    def test_fail_for_invalid_limits(self):
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, limit=0)
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, timeout=0)
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, limit=1, shard=(0, 2))
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, limit=1, checkpoint=mock.Mock())
+        # counting and sampling do not run the search
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, limit=1).count_combinations()
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(3, 3, {'kings': 1}, timeout=1).sample_combinations(1)
+
+
+class SymmetryTestCase(unittest.TestCase):
+    """ Checking search reduced by symmetries of the board """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def test_board_symmetries(self):
+        self.assertEqual(len(BoardSymmetry(4, 4, [Queen]).transforms), 8)
+        self.assertEqual(len(BoardSymmetry(4, 3, [Queen]).transforms), 4)
+        self.assertEqual(BoardSymmetry(3, 3, [King]).canonical_cells(),
+                         {0, 1, 4})
+
+    def test_type_blocks(self):
+        self.assertEqual(get_type_blocks([King, King, Rook, Knight, Knight]),
+                         ([0, 0, 2, 3, 3],
+                          [False, True, True, False, True]))
+        self.assertEqual(get_type_blocks([]), ([], []))
+
+    def test_asymmetric_figures(self):
+        class Pawn(FigureOnBoard):
+            display_char = 'P'
+
+            def _get_cells_to_attack(self):
+                return [(self.pos_x - 1, self.pos_y + 1),
+                        (self.pos_x + 1, self.pos_y + 1)]
+
+        # only reflection by X keeps attacks of the pawn
+        self.assertEqual(len(BoardSymmetry(4, 4, [Pawn, King]).transforms), 2)
+
+    def test_same_combinations(self):
+        configurations = [
+            (3, 3, {'kings': 1, 'rooks': 2}),
+            (4, 4, {'kings': 1, 'knights': 1, 'bishops': 1}),
+            (4, 3, {'kings': 2, 'knights': 2}),
+            (5, 5, {'queens': 5}),
+        ]
+        for dim_x, dim_y, figures_numbers in configurations:
+            game = Game(dim_x, dim_y, figures_numbers, engine='bitboard')
+            game.generate_combinations()
+            sym_game = Game(dim_x, dim_y, figures_numbers, engine='bitboard',
+                            symmetry=True)
+            sym_game.generate_combinations()
+
+            self.assertEqual(sym_game.combinations_count,
+                             len(game.serialized_boards))
+            self.assertLess(len(sym_game.canonical_boards),
+                            len(game.serialized_boards))
+            sym_game.expand_combinations()
+            self.assertCountEqual(sym_game.serialized_boards,
+                                  game.serialized_boards)
+
+    def test_reduce_transforms(self):
+        symmetry = BoardSymmetry(3, 3, [Rook])
+        transforms = tuple(symmetry.transforms)
+        # the corner is canonical, the side cell (1; 0) has smaller image
+        self.assertEqual(len(symmetry.reduce_transforms(transforms, [0],
+                                                        False)), 8)
+        self.assertIsNone(symmetry.reduce_transforms(transforms, [3], False))
+        # the diagonal reflection keeps cells 1 and 3
+        stabilizer = symmetry.reduce_transforms(transforms, [1, 3], True)
+        self.assertEqual(len(stabilizer), 2)
+        self.assertEqual(symmetry.stabilizer_orbit_size(stabilizer), 4)
+
+    def test_canonical_prefixes_for_all_engines(self):
+        figures_numbers = {'queens': 1, 'kings': 2, 'knights': 1}
+        game = Game(5, 5, figures_numbers)
+        game.generate_combinations()
+        symmetry = BoardSymmetry(5, 5, game.figure_classes)
+        expected = []
+        for serialized_board in game.serialized_boards:
+            orbit_size = symmetry.orbit_size(
+                game._get_placements(serialized_board)
+            )
+            if orbit_size:
+                expected.append((serialized_board, orbit_size))
+
+        engines = ['stack', 'bitboard', 'list']
+        if numpy is not None:
+            engines.append('numpy')
+        for engine in engines:
+            sym_game = Game(5, 5, figures_numbers, engine=engine,
+                            symmetry=True)
+            self.assertEqual(list(sym_game.generate_combinations()),
+                             expected)
+
+
+class CountCombinationsTestCase(unittest.TestCase):
+    """ Checking counting of combinations without building of boards """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def test_count_as_generated(self):
+        configurations = [
+            (3, 3, {'kings': 1, 'rooks': 2}),
+            (4, 4, {'kings': 1, 'rooks': 1, 'knights': 1, 'queens': 1,
+                    'bishops': 1}),
+            (4, 3, {'kings': 2, 'knights': 2}),
+            (5, 5, {'queens': 5}),
+        ]
+        for dim_x, dim_y, figures_numbers in configurations:
+            game = Game(dim_x, dim_y, figures_numbers, engine='bitboard')
+            count = game.count_combinations()
+            game.generate_combinations()
+            self.assertEqual(count, len(game.serialized_boards))
+
+    def test_count_big_boards(self):
+        game = Game(6, 6, {'queens': 2, 'kings': 2, 'knights': 1})
+        self.assertEqual(game.count_combinations(), 15440)
+
+        game = Game(8, 8, {'queens': 8})
+        self.assertEqual(game.count_combinations(), 92)
+
+    def test_count_many_figures(self):
+        # states are expanded without recursion
+        recursion_limit = sys.getrecursionlimit()
+        self.addCleanup(sys.setrecursionlimit, recursion_limit)
+        sys.setrecursionlimit(100)
+        self.assertEqual(Game(1, 159, {'kings': 80}).count_combinations(), 1)
+
+    def test_bounded_memo(self):
+        game = Game(6, 6, {'queens': 2, 'kings': 2, 'knights': 1})
+        counter = game._get_counter()
+        counter.memo_size = 16
+        self.assertEqual(counter.count(), 15440)
+        self.assertLessEqual(len(counter._memo), 16)
+        counter.clear()
+        self.assertEqual(len(counter._memo), 0)
+        # memoized states are not kept after counting
+        counter.memo_size = MEMO_SIZE
+        self.assertEqual(game.count_combinations(), 15440)
+        self.assertEqual(len(counter._memo), 0)
+
+    def test_count_without_figures(self):
+        self.assertEqual(Game(3, 3, {}).count_combinations(), 0)
+
+    def test_sample_all_combinations(self):
+        for dim_x, dim_y, figures_numbers in [
+                (4, 3, {'kings': 2, 'knights': 2}),
+                (4, 4, {'kings': 1, 'queens': 1, 'knights': 1})]:
+            game = Game(dim_x, dim_y, figures_numbers)
+            sample = game.sample_combinations(10000, seed=1)
+            self.assertCountEqual(list(sample),
+                                  list(game.generate_combinations()))
+        self.assertEqual(len(Game(3, 3, {}).sample_combinations(1)), 0)
+        with self.assertRaises(GameArgumentsValidationError):
+            game.sample_combinations(0)
+
+    def test_sample_big_board(self):
+        game = Game(20, 20, {'queens': 2, 'kings': 1})
+        sample = game.sample_combinations(5, seed=7)
+        self.assertEqual(list(sample),
+                         list(game.sample_combinations(5, seed=7)))
+        self.assertEqual(len(set(sample.keys())), 5)
+        figure_classes = {'Queen': Queen, 'King': King}
+        for serialized_board in sample:
+            board = Board(game)
+            for figure in serialized_board:
+                figure_class = figure_classes[figure['type']]
+                self.assertTrue(board.can_place_figure(
+                    figure_class, figure['pos_x'], figure['pos_y']
+                ))
+                board.place_figure(figure_class, figure['pos_x'],
+                                   figure['pos_y'])
+
+
+class ResultSetTestCase(unittest.TestCase):
+    """ Checking the packed container of combinations """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def test_generated_result_set(self):
+        game = Game(4, 4, {'kings': 1, 'queens': 1, 'knights': 1})
+        results = game.generate_combinations()
+        self.assertIsInstance(results, ResultSet)
+        self.assertIs(results, game.serialized_boards)
+
+        board_game = Game(4, 4, {'kings': 1, 'queens': 1, 'knights': 1},
+                          engine='list')
+        board_game.generate_combinations()
+        self.assertEqual(results, board_game.serialized_boards)
+        self.assertEqual(list(results), list(game.iter_combinations()))
+        self.assertEqual(len(results), len(list(results)))
+        self.assertEqual(results[-1], list(results)[-1])
+        self.assertEqual(results[-1][0]['type'], 'Queen')
+        self.assertEqual(str(results[0][0]), '[Q] Queen (1;1)')
+
+    def test_slices_and_pickling(self):
+        results = ResultSet(3, 4, [King, Rook], 2)
+        results.append_cells([0, 11], [0, 1])
+        results.append([StoredFigure({'type': 'King', 'pos_x': 1,
+                                      'pos_y': 2}),
+                        StoredFigure({'type': 'Rook', 'pos_x': 0,
+                                      'pos_y': 3})])
+        results.extend(results[:1])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(list(results.iter_records()),
+                         [(0, 0, 11, 1), (6, 0, 3, 1), (0, 0, 11, 1)])
+        self.assertEqual(results[1][0],
+                         {'type': 'King', 'pos_x': 1, 'pos_y': 2,
+                          'display_char': 'K'})
+        self.assertEqual(results[::2], [results[0], results[0]])
+        self.assertEqual(len(results[5:]), 0)
+        self.assertEqual(pickle.loads(pickle.dumps(results)), results)
+        with self.assertRaises(IndexError):
+            results[3]
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_append_cell_array(self):
+        cells = numpy.array([[0, 11], [6, 3], [300, 1]])
+        results = ResultSet(30, 40, [King, Rook], 2)
+        results.append_cell_array(cells, [0, 1])
+        expected = ResultSet(30, 40, [King, Rook], 2)
+        for row in cells.tolist():
+            expected.append_cells(row, [0, 1])
+        self.assertEqual(results, expected)
+
+        results = CanonicalResultSet(30, 40, [King, Rook], 2)
+        results.append_cell_array(cells[:2], [0, 1], numpy.array([4, 8]))
+        results.append_cell_array(cells[2:], [0, 1])
+        self.assertEqual(list(results.orbit_sizes), [4, 8, 1])
+        self.assertEqual([board for board, _ in results], list(expected))
+
+    def test_canonical_result_set(self):
+        results = CanonicalResultSet(3, 4, [King, Rook], 2)
+        results.append_cells([0, 11], [0, 1], 4)
+        results.append((results[0][0], 2))
+        results.extend(results[:1])
+        self.assertEqual(list(results.orbit_sizes), [4, 2, 4])
+        self.assertEqual(results.combinations_count, 10)
+        self.assertEqual(results[1], (results[0][0], 2))
+        self.assertEqual(results[1:], [(results[0][0], 2),
+                                       (results[0][0], 4)])
+        self.assertEqual(pickle.loads(pickle.dumps(results)), results)
+
+        game = Game(4, 4, {'kings': 1, 'queens': 1, 'knights': 1},
+                    symmetry=True)
+        self.assertIsInstance(game.generate_combinations(),
+                              CanonicalResultSet)
+
+    def test_combination_keys(self):
+        self.assertEqual(get_combination_key([5, 1, 3], 10), 135)
+        self.assertEqual(get_combination_key([3, 5, 1], 10), 135)
+
+        game = Game(4, 4, {'kings': 1, 'queens': 1, 'knights': 1},
+                    engine='list')
+        results = game.generate_combinations()
+        keys = results.create_keys()
+        self.assertEqual(len(keys), len(results))
+        self.assertEqual(keys.update(results.keys()), 0)
+        self.assertEqual(pickle.loads(pickle.dumps(keys)).update(keys), 0)
+        self.assertIn(next(results.keys()), keys)
+        self.assertNotIn(-1, keys)
+
+        # keys of long combinations are kept in the set
+        big_keys = CombinationKeys(100, [1 << 90, 5, 1 << 90])
+        self.assertEqual(len(big_keys), 2)
+        self.assertEqual(big_keys.update([5, 7]), 1)
+
+        keys = CombinationKeys(64, [3])
+        other_keys = CombinationKeys(64, [2, 1])
+        self.assertEqual(keys.update_all([[1, 3], other_keys]), 2)
+        self.assertEqual(list(keys), [1, 2, 3])
+
+    def test_collect_keys(self):
+        for symmetry in (False, True):
+            game = Game(5, 5, {'kings': 2, 'queens': 1, 'knights': 1},
+                        symmetry=symmetry)
+            self.assertEqual(len(game.collect_keys()),
+                             game.count_combinations())
+
+    def test_board_keys(self):
+        game = Game(4, 4, {'kings': 1, 'rooks': 1})
+        for board_class in (Board, BitBoard):
+            board, other_board = board_class(game), board_class(game)
+            board.place_figure(Rook, 0, 1)
+            board.place_figure(King, 3, 3)
+            other_board.place_figure(King, 3, 3)
+            other_board.place_figure(Rook, 0, 1)
+            self.assertEqual(board.key(), other_board.key())
+            self.assertEqual(len({board, other_board}), 1)
+            other_board.place_figure(King, 2, 0)
+            self.assertNotEqual(board, other_board)
+
+
+class BinaryResultsTestCase(unittest.TestCase):
+    """ Checking storing of combinations to the binary results file """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'results.bin')
+
+    def test_save_and_read_combinations(self):
+        game = Game(4, 4, {'kings': 1, 'rooks': 1, 'knights': 1, 'queens': 1,
+                           'bishops': 1})
+        self.assertEqual(game.save_combinations(self.path), 16)
+        game.generate_combinations()
+
+        with ResultsReader(self.path) as reader:
+            self.assertEqual(len(reader), 16)
+            self.assertEqual((reader.dimension_x, reader.dimension_y), (4, 4))
+            self.assertEqual(reader.figures_number, 5)
+            self.assertEqual(reader.types[0], ('Queen', 'Q', 1))
+            self.assertEqual(list(reader), game.serialized_boards)
+            self.assertEqual(reader[-1], game.serialized_boards[-1])
+            self.assertEqual(reader.record(0)[1::2], (0, 1, 2, 3, 4))
+            batches = list(reader.iter_batches(batch_size=5))
+            self.assertEqual([len(batch) for batch in batches], [5, 5, 5, 1])
+            with self.assertRaises(IndexError):
+                reader.record(16)
+
+    def test_long_type_names(self):
+        class ExtremelyLongFairyPieceName(FigureOnBoard):
+            display_char = 'F'
+
+            def _get_cells_to_attack(self):
+                return []
+
+        figure = ExtremelyLongFairyPieceName.on_cell(3, 3, 1, 2)
+        with ResultsWriter(self.path, 3, 3, [ExtremelyLongFairyPieceName],
+                           [1]) as writer:
+            writer.write([figure.serialize()])
+        with ResultsReader(self.path) as reader:
+            self.assertEqual(reader.types,
+                             [('ExtremelyLongFairyPieceName', 'F', 1)])
+            self.assertEqual(reader[0][0]['type'],
+                             'ExtremelyLongFairyPieceName')
+
+        ExtremelyLongFairyPieceName.__name__ = 'Piece' * 60
+        with self.assertRaises(ResultsFileError):
+            ResultsWriter(self.path, 3, 3, [ExtremelyLongFairyPieceName], [1])
+
+    def test_read_incorrect_file(self):
+        with open(self.path, 'wb') as results_file:
+            results_file.write(b'results')
+        with self.assertRaises(ResultsFileError):
+            ResultsReader(self.path)
+
+
+class ResultsCacheTestCase(unittest.TestCase):
+    """ Checking the persistent cache of results """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = ResultsCache(tmp_dir.name)
+
+    def get_game(self, dim_x=4, dim_y=3, **kwargs):
+        return Game(dim_x, dim_y, {'queens': 1, 'kings': 1, 'knights': 1},
+                    cache=self.cache, **kwargs)
+
+    def test_cache_hit_does_not_run_search(self):
+        game = self.get_game()
+        game.generate_combinations()
+        expected = game.serialized_boards
+        self.assertTrue(expected)
+
+        with mock.patch.object(Game, '_iter_subtrees_results') as search:
+            game = self.get_game()
+            game.generate_combinations()
+            self.assertEqual(game.serialized_boards, expected)
+            self.assertEqual(list(self.get_game().iter_combinations()),
+                             expected)
+            self.assertEqual(self.get_game().count_combinations(),
+                             len(expected))
+            self.assertFalse(search.called)
+
+    def test_transposed_board(self):
+        game = self.get_game(4, 3)
+        game.generate_combinations()
+
+        transposed_game = Game(3, 4, {'queens': 1, 'kings': 1,
+                                      'knights': 1})
+        transposed_game.generate_combinations()
+        cached_game = self.get_game(3, 4)
+        with mock.patch.object(Game, '_iter_subtrees_results') as search:
+            cached_combinations = list(cached_game.iter_combinations())
+            self.assertFalse(search.called)
+        # combinations and their figures are in order of the fresh search
+        self.assertEqual(cached_combinations,
+                         list(transposed_game.serialized_boards))
+
+    def test_transposed_board_order(self):
+        figures_numbers = {'knights': 2, 'bishops': 2, 'kings': 1}
+        for dims in ((3, 4), (4, 3)):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                cache = ResultsCache(tmp_dir)
+                Game(*dims[::-1], figures_numbers,
+                     cache=cache).generate_combinations()
+                cached_game = Game(*dims, figures_numbers, cache=cache)
+                with mock.patch.object(Game,
+                                       '_iter_subtrees_results') as search:
+                    cached_combinations = list(
+                        cached_game.iter_combinations()
+                    )
+                    self.assertFalse(search.called)
+            fresh_combinations = list(Game(*dims, figures_numbers)
+                                      .iter_combinations())
+            self.assertEqual(len(cached_combinations),
+                             len(fresh_combinations))
+            for cached, fresh in zip(cached_combinations,
+                                     fresh_combinations):
+                self.assertEqual(cached, fresh)
+
+    def test_cache_of_count(self):
+        self.assertEqual(self.get_game().count_combinations(), 8)
+        with mock.patch('src.game_logic.CombinationsCounter') as counter:
+            self.assertEqual(self.get_game().count_combinations(), 8)
+            self.assertFalse(counter.called)
+        # only number of combinations is cached
+        self.assertIsNone(self.cache.get_results(self.get_game()))
+
+    def test_symmetry_from_cache(self):
+        game = self.get_game(4, 4, symmetry=True)
+        game.generate_combinations()
+        canonical_boards = game.canonical_boards
+
+        game = self.get_game(4, 4, symmetry=True)
+        game.generate_combinations()
+        self.assertEqual(game.canonical_boards, canonical_boards)
+        self.assertEqual(game.combinations_count, game.count_combinations())
+
+    def test_damaged_entry(self):
+        self.get_game().generate_combinations()
+        key, _ = self.cache.get_key(self.get_game())
+        path = os.path.join(self.cache.cache_dir, key + '.chsr')
+        with open(path, 'r+b') as entry_file:
+            entry_file.seek(-1, os.SEEK_END)
+            entry_file.write(b'\xff')
+
+        self.assertIsNone(self.cache.get_results(self.get_game()))
+        self.assertFalse(os.path.exists(path))
+        game = self.get_game()
+        game.generate_combinations()
+        self.assertEqual(len(game.serialized_boards), 8)
+
+    def test_eviction(self):
+        def get_size(game):
+            key, _ = self.cache.get_key(game)
+            return os.path.getsize(os.path.join(self.cache.cache_dir,
+                                                key + '.chsr'))
+
+        games = [self.get_game(4, 3), self.get_game(4, 4),
+                 self.get_game(3, 3)]
+        games[0].generate_combinations()
+        games[1].generate_combinations()
+        # the first entry is used recently, so the second one is evicted
+        list(self.cache.get_results(games[0]))
+        self.cache.max_size = get_size(games[0]) + get_size(games[1]) + 1
+        games[2].generate_combinations()
+        self.assertIsNotNone(self.cache.get_results(games[0]))
+        self.assertIsNone(self.cache.get_results(games[1]))
+        self.assertIsNotNone(self.cache.get_results(games[2]))
+
+    def test_abandoned_iteration_is_not_cached(self):
+        combinations = self.get_game().iter_combinations()
+        next(combinations)
+        combinations.close()
+        self.assertIsNone(self.cache.get_results(self.get_game()))
+        self.assertEqual(os.listdir(self.cache.cache_dir), ['index.lock'])
+
+    def test_concurrent_writers(self):
+        games = [self.get_game(dim_x, dim_y)
+                 for dim_x in range(3, 6) for dim_y in range(3, 6)]
+        threads = [threading.Thread(target=game.generate_combinations)
+                   for game in games]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # entries of all writers are registered in the index
+        for game in games:
+            cached_boards = list(self.cache.get_results(game))
+            self.assertCountEqual(cached_boards, game.serialized_boards)
+
+    def test_eviction_of_untracked_files(self):
+        untracked_path = os.path.join(self.cache.cache_dir, 'stale.chsr')
+        with open(untracked_path, 'wb') as untracked_file:
+            untracked_file.write(b'results')
+        self.get_game().generate_combinations()
+        self.assertFalse(os.path.exists(untracked_path))
+        self.assertIsNotNone(self.cache.get_results(self.get_game()))
+
+
+class CheckpointTestCase(unittest.TestCase):
+    """ Checking checkpoints and resuming of the search """
+
+    figures_numbers = {'queens': 1, 'rooks': 1, 'knights': 2}
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'checkpoint')
+
+    def get_game(self, resume=False, **kwargs):
+        checkpoint = Checkpoint(self.path, resume=resume, interval=0)
+        return Game(4, 4, self.figures_numbers, checkpoint=checkpoint,
+                    **kwargs)
+
+    def interrupt(self, game, subtrees_number):
+        """ Run the search and stop it after some finished subtrees """
+
+        subtrees = game._iter_subtrees_results()
+        for _ in range(subtrees_number):
+            next(subtrees)
+        subtrees.close()
+
+    def test_resume(self):
+        expected_game = Game(4, 4, self.figures_numbers)
+        expected_game.generate_combinations()
+
+        self.interrupt(self.get_game(), 5)
+        game = self.get_game(resume=True)
+        with mock.patch.object(game, '_run_measured_subtree',
+                               wraps=game._run_measured_subtree) as run:
+            combinations = list(game.iter_combinations())
+        # 16 subtrees (one for every cell of the first figure)
+        self.assertEqual(run.call_count, 11)
+        self.assertEqual(combinations, expected_game.serialized_boards)
+        # finished search removes the checkpoint
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_resume_in_symmetry_mode(self):
+        expected_game = Game(4, 4, self.figures_numbers, symmetry=True)
+        expected_game.generate_combinations()
+
+        self.interrupt(self.get_game(symmetry=True), 2)
+        game = self.get_game(resume=True, symmetry=True)
+        game.generate_combinations()
+        self.assertEqual(game.canonical_boards, expected_game.canonical_boards)
+        self.assertEqual(game.combinations_count,
+                         expected_game.combinations_count)
+
+    def test_resumed_subtrees_are_packed(self):
+        for symmetry, results_class in ((False, ResultSet),
+                                        (True, CanonicalResultSet)):
+            expected_game = Game(4, 4, self.figures_numbers,
+                                 symmetry=symmetry)
+            expected = dict(expected_game._iter_subtrees_results())
+
+            self.interrupt(self.get_game(symmetry=symmetry), 2)
+            game = self.get_game(resume=True, symmetry=symmetry)
+            restored = []
+            restore_subtree = game._restore_subtree
+
+            def restore(serialized_boards):
+                restored.append(serialized_boards)
+                return restore_subtree(serialized_boards)
+
+            with mock.patch.object(game, '_restore_subtree', restore):
+                results = dict(game._iter_subtrees_results())
+            self.assertEqual(len(restored), 2)
+            # boards of finished subtrees are loaded as packed records
+            for index, serialized_boards in enumerate(restored):
+                self.assertIsInstance(serialized_boards, ResultSet)
+                self.assertIsInstance(results[index], results_class)
+                self.assertEqual(len(serialized_boards),
+                                 len(expected[index]))
+            self.assertEqual(results, expected)
+
+    def test_new_search_replaces_checkpoint(self):
+        self.interrupt(self.get_game(), 3)
+        game = self.get_game()
+        with mock.patch.object(game, '_run_measured_subtree',
+                               wraps=game._run_measured_subtree) as run:
+            game.generate_combinations()
+        self.assertEqual(run.call_count, 16)
+
+    def test_fail_for_other_game(self):
+        self.interrupt(self.get_game(), 3)
+        game = self.get_game(resume=True, ordering='adaptive')
+        with self.assertRaises(CheckpointError):
+            game.generate_combinations()
+        game = Game(4, 5, self.figures_numbers,
+                    checkpoint=Checkpoint(self.path, resume=True))
+        with self.assertRaises(CheckpointError):
+            game.generate_combinations()
+
+
+class ShardingTestCase(unittest.TestCase):
+    """ Checking splitting of the search to shards and their merging """
+
+    figures_numbers = {'queens': 1, 'kings': 2, 'knights': 1}
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def save_shards(self, shards_number, **kwargs):
+        paths = []
+        for shard_index in range(shards_number):
+            path = os.path.join(self.tmp_dir, 'shard{}.chsr'.format(
+                shard_index
+            ))
+            game = Game(5, 5, self.figures_numbers,
+                        shard=(shard_index, shards_number), **kwargs)
+            game.save_combinations(path)
+            paths.append(path)
+        return paths
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('1/4'), (1, 4))
+        with self.assertRaises(ValueError):
+            parse_shard('1')
+        with self.assertRaises(GameArgumentsValidationError):
+            Game(5, 5, self.figures_numbers, shard=(2, 2))
+
+    def test_assign_subtrees(self):
+        estimates = [10, 1, 7, 3, 3, 2, 9]
+        assignment = assign_subtrees(estimates, 3)
+        self.assertEqual(assignment, assign_subtrees(estimates, 3))
+        loads = [0] * 3
+        for estimate, shard_index in zip(estimates, assignment):
+            loads[shard_index] += estimate
+        self.assertEqual(sorted(loads), [11, 12, 12])
+
+    def test_shards_cover_all_combinations(self):
+        game = Game(5, 5, self.figures_numbers)
+        expected_count = game.count_combinations()
+        counts = [
+            Game(5, 5, self.figures_numbers, shard=(shard_index, 3),
+                 workers=shard_index + 1).count_combinations()
+            for shard_index in range(3)
+        ]
+        self.assertEqual(sum(counts), expected_count)
+        # shards are balanced
+        self.assertLess(max(counts), 2 * min(counts))
+
+    def test_merge_shards(self):
+        for symmetry in (False, True):
+            path = os.path.join(self.tmp_dir, 'results.chsr')
+            Game(5, 5, self.figures_numbers,
+                 symmetry=symmetry).save_combinations(path)
+            with ResultsReader(path) as reader:
+                expected = list(reader)
+
+            paths = self.save_shards(3, symmetry=symmetry)
+            merged_path = os.path.join(self.tmp_dir, 'merged.chsr')
+            count = merge_shards(paths[::-1], merged_path)
+            self.assertEqual(count, len(expected))
+            self.assertEqual(merge_shards(paths), len(expected))
+            with ResultsReader(merged_path) as reader:
+                self.assertEqual(list(reader), expected)
+
+    def test_fail_for_incomplete_shards(self):
+        paths = self.save_shards(3)
+        with self.assertRaises(ShardError):
+            merge_shards(paths[:2])
+        with self.assertRaises(ShardError):
+            merge_shards(paths + paths[:1])
+
+        other_path = os.path.join(self.tmp_dir, 'other.chsr')
+        Game(5, 6, self.figures_numbers,
+             shard=(2, 3)).save_combinations(other_path)
+        with self.assertRaises(ShardError):
+            merge_shards(paths[:2] + [other_path])
+
+        # the same game split to other subtrees
+        Game(5, 5, self.figures_numbers, shard=(2, 3),
+             split_depth=1).save_combinations(other_path)
+        with self.assertRaises(ShardError):
+            merge_shards(paths[:2] + [other_path])
+
+    def write_shard(self, shard, subtrees, figure_class):
+        path = os.path.join(self.tmp_dir, 'shard{}.chsr'.format(shard))
+        with ResultsWriter(path, 2, 2, [figure_class], [1]) as writer:
+            for prefix in subtrees:
+                writer.write([figure_class.on_cell(
+                    2, 2, *divmod(prefix[0], 2)
+                ).serialize()])
+        manifest = {
+            'version': 2, 'shard': shard, 'shards': 2,
+            'identity': [2, 2, [['pawns', 1]], [figure_class.__name__],
+                         False, get_split_checksum([[0], [1], [2], [3]])],
+            'count': len(subtrees),
+            'subtrees': [[prefix, 1] for prefix in subtrees]
+        }
+        with open(path + '.json', 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        return path
+
+    def test_merge_shards_of_other_figures(self):
+        class Pawn(FigureOnBoard):
+            display_char = 'P'
+
+            def _get_cells_to_attack(self):
+                return []
+
+        paths = [self.write_shard(0, [[0], [3]], Pawn),
+                 self.write_shard(1, [[1], [2]], Pawn)]
+        merged_path = os.path.join(self.tmp_dir, 'merged.chsr')
+        self.assertEqual(merge_shards(paths, merged_path), 4)
+        with ResultsReader(merged_path) as reader:
+            self.assertEqual(reader.types, [('Pawn', 'P', 1)])
+            self.assertEqual([board[0]['pos_y'] for board in reader],
+                             [0, 1, 0, 1])
+
+        # subtrees overlap or do not cover the split
+        paths[1] = self.write_shard(1, [[1], [3]], Pawn)
+        with self.assertRaises(ShardError):
+            merge_shards(paths)
+        paths[1] = self.write_shard(1, [[1]], Pawn)
+        with self.assertRaises(ShardError):
+            merge_shards(paths)
+
+
+class BulkRenderTestCase(unittest.TestCase):
+    """ Checking buffered rendering of combinations """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ['TEST_MODE'] = '1'
+        cls.game = Game(3, 3, {'kings': 1, 'rooks': 2})
+        cls.game.generate_combinations()
+
+    def _render(self, output_format, **kwargs):
+        stream = io.StringIO()
+        renderer = CombinationsRenderer([stream], output_format, 3, 3,
+                                        **kwargs)
+        with renderer:
+            self.assertEqual(
+                renderer.write_all(self.game.serialized_boards), 4
+            )
+        return stream.getvalue()
+
+    def test_board_format(self):
+        output = self._render('board', buffer_size=10)
+        self.assertEqual(output.count('[K] King'), 4)
+        self.assertIn('    1 2 3 \n1 | - R - \n2 | R - - \n3 | - - K \n',
+                      output)
+        self.assertEqual(self._render('board', threaded=True), output)
+
+    def test_compact_formats(self):
+        lines = self._render('line').splitlines()
+        self.assertEqual(lines, [' | '.join(map(str, board))
+                                 for board in self.game.serialized_boards])
+
+        lines = self._render('ndjson', threaded=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         self.game.serialized_boards)
+
+        rows = list(csv.reader(io.StringIO(self._render('csv'))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][:3], ['type_1', 'pos_x_1', 'pos_y_1'])
+        self.assertEqual(rows[1][:3], ['Rook', '0', '1'])
+
+    def test_render_bulk(self):
+        game = Game(3, 3, {'kings': 1, 'rooks': 2})
+        stream = io.StringIO()
+        self.assertEqual(game.render_bulk('ndjson', streams=[stream]), 4)
+        self.assertEqual(stream.getvalue().count('"King"'), 4)
+
 
 @contextmanager
 def capture(command, *args, **kwargs):
@@ -279,6 +1493,341 @@ def capture(command, *args, **kwargs):
         sys.stdout = out
 
 
+class LargeBoardTestCase(unittest.TestCase):
+    """ Testing combinations on boards bigger than 8 x 8 """
+
+    def test_queens_on_large_boards(self):
+        # number of ways to place two non-attacking queens on N x N board
+        for size in (12, 20, 32):
+            expected = size * (size - 1) * (size - 2) * (3 * size - 1) // 6
+            game = Game(size, size, {'queens': 2})
+            self.assertEqual(game.count_combinations(), expected)
+
+        game = Game(20, 20, {'queens': 2})
+        self.assertEqual(sum(1 for _ in game.iter_combinations()), 67260)
+
+    def test_engines_on_large_board(self):
+        figures_numbers = {'rooks': 1, 'knights': 1}
+        counts = set()
+        for engine in ('stack', 'bitboard'):
+            game = Game(12, 10, figures_numbers, engine=engine)
+            game.generate_combinations()
+            counts.add(len(game.serialized_boards))
+        counts.add(Game(12, 10, figures_numbers).count_combinations())
+        self.assertEqual(len(counts), 1)
+
+    def test_symmetry_on_large_board(self):
+        game = Game(16, 16, {'queens': 2}, symmetry=True)
+        game.generate_combinations()
+        self.assertEqual(game.combinations_count, game.count_combinations())
+
+    def test_format_large_board(self):
+        combination = [{'pos_x': 9, 'pos_y': 10, 'display_char': 'Q'}]
+        lines = format_board(combination, 10, 11).split('\n')
+        self.assertEqual(lines[0], '     1  2  3  4  5  6  7  8  9  10 ')
+        self.assertEqual(lines[1], ' 1 | ' + '-  ' * 10)
+        self.assertEqual(lines[11], '11 | ' + '-  ' * 9 + 'Q  ')
+
+
+class SearchStatsTestCase(unittest.TestCase):
+    """ Testing counters of the search in instrumented mode """
+
+    def test_stats_disabled(self):
+        game = Game(4, 4, {'kings': 1, 'rooks': 2})
+        game.generate_combinations()
+        self.assertIsNone(game.stats)
+
+    def test_stats_of_engines(self):
+        figures_numbers = {'kings': 1, 'rooks': 2, 'knights': 1}
+        expected = None
+        for engine in ('stack', 'bitboard', 'list'):
+            game = Game(4, 4, figures_numbers, engine=engine, instrument=True)
+            game.generate_combinations()
+            stats = game.stats.as_dict()
+            self.assertEqual(stats['solutions'], len(game.serialized_boards))
+            self.assertEqual(stats['depth_nodes'][-1], stats['solutions'])
+            del stats['workers']
+            if expected is None:
+                expected = stats
+            self.assertEqual(stats, expected)
+
+        self.assertEqual(expected['depth_nodes'], [16, 72, 152, 68])
+        self.assertEqual(expected['type_nodes'],
+                         {'Rook': 88, 'King': 152, 'Knight': 68})
+        self.assertEqual(expected['nodes'], 308)
+        self.assertEqual(expected['subtrees'], 16)
+
+    def test_stats_do_not_depend_on_split(self):
+        figures_numbers = {'queens': 2, 'knights': 2}
+        game = Game(5, 5, figures_numbers, instrument=True)
+        game.generate_combinations()
+        split_game = Game(5, 5, figures_numbers, instrument=True,
+                          split_depth=3)
+        split_game.generate_combinations()
+        self.assertEqual(split_game.stats.depth_nodes,
+                         game.stats.depth_nodes)
+        self.assertEqual(split_game.stats.rejected, game.stats.rejected)
+        self.assertEqual(split_game.stats.dead_ends, game.stats.dead_ends)
+
+    def test_stats_of_workers(self):
+        figures_numbers = {'kings': 1, 'rooks': 1, 'knights': 2}
+        with mock.patch.dict(os.environ, {'TEST_MODE': ''}):
+            game = Game(4, 4, figures_numbers, workers=2, instrument=True)
+            game.generate_combinations()
+        self.assertEqual(game.stats.solutions, len(game.serialized_boards))
+        self.assertEqual(
+            sum(subtrees for subtrees, _ in game.stats.workers.values()),
+            game.stats.subtrees
+        )
+
+    def test_progress(self):
+        stream = io.StringIO()
+        progress = ProgressReporter(4, stream=stream, interval=3600)
+        progress.update()
+        self.assertEqual(stream.getvalue(), '')
+        progress.update(3)
+        self.assertIn('100.0% (4/4 subtrees)', stream.getvalue())
+
+
+class BatchTestCase(unittest.TestCase):
+    """ Checking running of many jobs in one process """
+
+    jobs_lines = [
+        '{"id": 1, "dims": [3, 3], "figures": {"kings": 1, "rooks": 2}}',
+        '',
+        '{"dims": [4, 4], "figures": {"queens": 4}, "mode": "combinations"}',
+        '{"dims": [3, 3], "figures": {"pawns": 1}}',
+        '[3, 3]',
+        '{"id": "bad", "dims": [3], "figures": {"kings": 1}}',
+        '{"dims": [2, 2], "figures": {"kings": 4}}',
+    ]
+
+    def test_read_jobs(self):
+        jobs = read_jobs(self.jobs_lines)
+        self.assertEqual(len(jobs), 6)
+        self.assertEqual(jobs[0]['dims'], [3, 3])
+        self.assertIn('Line 5', jobs[3]['error'])
+
+    def test_batch_results(self):
+        with mock.patch.dict(os.environ, {'TEST_MODE': '1'}):
+            records = list(iter_batch_results(read_jobs(self.jobs_lines)))
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0]['id'], 1)
+        self.assertEqual(records[0]['count'], 4)
+        self.assertNotIn('combinations', records[0])
+
+        game = Game(4, 4, {'queens': 4})
+        self.assertEqual(records[1]['count'], 2)
+        self.assertEqual(records[1]['combinations'],
+                         list(game.iter_combinations()))
+        self.assertEqual(records[1]['figures'], {'queens': 4})
+
+        self.assertIn('pawns', records[2]['error'])
+        self.assertIn('error', records[3])
+        self.assertEqual(records[4]['id'], 'bad')
+        self.assertIn('error', records[4])
+        self.assertIn('error', records[5])
+
+    def test_batch_in_pool(self):
+        jobs = read_jobs(self.jobs_lines)
+        with mock.patch.dict(os.environ, {'TEST_MODE': '1'}):
+            expected = list(iter_batch_results(jobs, mode='combinations'))
+        with mock.patch.dict(os.environ, {'TEST_MODE': ''}):
+            records = list(iter_batch_results(jobs, mode='combinations',
+                                              workers=2))
+        for record in expected + records:
+            record.pop('seconds', None)
+        self.assertEqual(records, expected)
+
+
+class QueryServerTestCase(unittest.TestCase):
+    """ Checking answers of the query server """
+
+    def run_queries(self, queries, cache=None):
+        """ Send queries to the server by one connection
+
+        :param queries: list of queries or pairs like (query, answers_number)
+                        where the query is sent after receiving of
+                        answers_number answers
+        :return: list of all answers
+        """
+        async def communicate(socket_path):
+            server = QueryServer(workers=2, cache=cache)
+            await server.start(socket_path)
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    socket_path, limit=1 << 24
+                )
+                answers = []
+                for query in queries:
+                    query, waited = query if isinstance(query, tuple) else \
+                        (query, 0)
+                    while len(answers) < waited:
+                        answers.append(json.loads(await reader.readline()))
+                    writer.write(query.encode() + b'\n')
+                writer.write_eof()
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    answers.append(json.loads(line))
+                writer.close()
+                return answers
+            finally:
+                await server.close()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return asyncio.run(communicate(os.path.join(tmp_dir, 's.sock')))
+
+    def get_combinations(self, answers, query_id):
+        return [combination for answer in answers
+                if answer.get('id') == query_id and 'combinations' in answer
+                for combination in answer['combinations']]
+
+    def test_count_and_errors(self):
+        answers = self.run_queries([
+            '{"id": 1, "op": "count", "dims": [4, 4], '
+            '"figures": {"queens": 4}}',
+            '{"id": 2, "op": "count", "dims": [1, 1], '
+            '"figures": {"kings": 3}}',
+            '{"id": 3, "op": "sum", "dims": [3, 3], "figures": {"kings": 1}}',
+            'not json',
+        ])
+        answers = {answer.get('id'): answer for answer in answers}
+        self.assertEqual(answers[1], {'id': 1, 'count': 2})
+        self.assertIn('error', answers[2])
+        self.assertIn('sum', answers[3]['error'])
+        self.assertIn('Incorrect query', answers[None]['error'])
+
+    def test_stream_combinations(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResultsCache(tmp_dir)
+            query = '{{"id": {}, "op": "combinations", "dims": [5, 5], ' \
+                    '"figures": {{"kings": 2, "queens": 1, "knights": 1}}}}'
+            answers = self.run_queries([query.format(1), (query.format(2), 2)],
+                                       cache=cache)
+            # the second query is answered from the cache
+            second = self.run_queries([query.format(3)], cache=cache)
+
+        expected = list(Game(5, 5, {'kings': 2, 'queens': 1, 'knights': 1})
+                        .iter_combinations())
+        self.assertEqual(self.get_combinations(answers, 1), expected)
+        self.assertEqual(self.get_combinations(answers, 2), expected)
+        self.assertEqual(self.get_combinations(second, 3), expected)
+        self.assertIn({'id': 3, 'done': True, 'count': len(expected)}, second)
+
+    def test_cancel(self):
+        answers = self.run_queries([
+            '{"id": "q", "op": "combinations", "dims": [6, 6], '
+            '"figures": {"kings": 2, "queens": 2, "bishops": 1, '
+            '"knights": 1}}',
+            ('{"id": "q", "op": "cancel"}', 1),
+            '{"id": "k", "op": "count", "dims": [3, 3], '
+            '"figures": {"kings": 2}}',
+        ])
+        self.assertIn({'id': 'q', 'cancelled': True}, answers)
+        self.assertNotIn('done', [key for answer in answers
+                                  if answer.get('id') == 'q'
+                                  for key in answer])
+        self.assertIn({'id': 'k', 'count': 16}, answers)
+
+    def test_cancel_started_tasks(self):
+        slot_generations = [0, 1]
+        init_worker(slot_generations)
+        self.addCleanup(init_worker, None)
+        game = Game(12, 12, {'queens': 12})
+        start = time.monotonic()
+        # tasks of the cancelled query are stopped inside the search
+        for engine in ('stack', 'list'):
+            config = Game(12, 12, {'queens': 12}, engine=engine).config
+            with self.assertRaises(SearchCancelledError):
+                subtree_task((config, (0,), (1, 0)))
+        with self.assertRaises(SearchCancelledError):
+            count_task(game.config, (1, 0))
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(
+            count_task(Game(4, 4, {'queens': 4}).config, (0, 0)), 2
+        )
+
+    def test_cancel_before_reused_slot(self):
+        server = QueryServer(workers=1)
+        server._slot_generations = [0]
+        server._free_slots.append(0)
+        init_worker(server._slot_generations)
+        self.addCleanup(init_worker, None)
+
+        # the first query is cancelled, the second one reuses its slot
+        first = server._acquire_slot()
+        server._release_slot(first)
+        second = server._acquire_slot()
+        self.assertEqual(second[0], first[0])
+
+        # tasks of the first query are stopped, tasks of the second one run
+        config = Game(12, 12, {'queens': 12}).config
+        with self.assertRaises(SearchCancelledError):
+            subtree_task((config, (0,), first))
+        with self.assertRaises(SearchCancelledError):
+            count_task(config, first)
+        self.assertEqual(
+            count_task(Game(4, 4, {'queens': 4}).config, second), 2
+        )
+        server._release_slot(second)
+        self.assertEqual(server._acquire_slot(), (0, 2))
+
+    def test_cancel_with_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResultsCache(tmp_dir)
+            answers = self.run_queries([
+                '{"id": "q", "op": "combinations", "dims": [6, 6], '
+                '"figures": {"kings": 2, "queens": 2, "bishops": 1, '
+                '"knights": 1}}',
+                ('{"id": "q", "op": "cancel"}', 1),
+            ], cache=cache)
+            self.assertIn({'id': 'q', 'cancelled': True}, answers)
+            # combinations of the cancelled query are not cached
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['index.lock'])
+
+    def test_worker_games_are_bounded(self):
+        configs = [Game(dim, dim, {'kings': 2}).config
+                   for dim in range(3, 5 + WORKER_GAMES_SIZE)]
+        games = [get_worker_game(config) for config in configs]
+        self.assertIs(get_worker_game(configs[-1]), games[-1])
+        self.assertIsNot(get_worker_game(configs[0]), games[0])
+
+        # boards of batch jobs are pinned, so other boards are used here
+        tables = [King.attack_table(dim, 13)
+                  for dim in range(3, 4 + ATTACK_TABLES_SIZE)]
+        self.assertIs(King.attack_table(3 + ATTACK_TABLES_SIZE, 13),
+                      tables[-1])
+        self.assertIsNot(King.attack_table(3, 13), tables[0])
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """ Testing measurement of the engine's throughput """
+
+    def test_run_case(self):
+        with mock.patch.dict(os.environ, {}):
+            result = run_case(3, 3, {'kings': 1, 'rooks': 2}, 'single')
+        self.assertEqual(result['solutions'], 4)
+        self.assertEqual(result['workers'], 1)
+        self.assertGreater(result['nodes'], result['solutions'])
+
+    def test_search_nodes(self):
+        search = CombinationsSearch(4, 4, [Queen] * 4)
+        self.assertEqual(len(list(search.run())), 2)
+        self.assertGreater(search.nodes, 2)
+
+    def test_compare_with_baseline(self):
+        baseline = [{'name': 'case', 'mode': 'single', 'wall_time': 1.0}]
+        results = [{'name': 'case', 'mode': 'single', 'wall_time': 1.05},
+                   {'name': 'new', 'mode': 'single', 'wall_time': 5.0}]
+        self.assertEqual(compare_with_baseline(results, baseline), [])
+
+        results[0]['wall_time'] = 1.5
+        self.assertEqual(compare_with_baseline(results, baseline),
+                         [('case', 'single', 1.0, 1.5)])
+
+
 class CaptureLoggingHandler(logging.StreamHandler):
     """ This class helps to capture stdout stream for testing output data
     """
@@ -323,6 +1872,20 @@ class RunModeTestCase(unittest.TestCase):
             self.assertIn(msg, output)
             self.assertEqual(output.count('[K] King'), number_of_results)
 
+    def test_run_game_and_render_stream(self):
+        game = Game(3, 2, {'kings': 1, 'rooks': 1})
+        game.logger = self.logger
+        with capture(game.run, stream=True) as output:
+            self.assertIn('Found 4 combinations', output)
+            self.assertEqual(output.count('[K] King'), 4)
+
+    def test_run_game_and_render_count(self):
+        game = Game(3, 3, {'kings': 1, 'rooks': 2})
+        game.logger = self.logger
+        with capture(game.run, count_only=True) as output:
+            self.assertIn('Found 4 combinations', output)
+            self.assertNotIn('[K] King', output)
+
 
 if __name__ == '__main__':
     unittest.main()